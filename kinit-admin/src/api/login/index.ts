@@ -5,6 +5,10 @@ export const loginApi = (data: UserLoginType): Promise<IResponse> => {
   return request.post({ url: '/auth/login/', data })
 }
 
+export const logoutApi = (refresh: string): Promise<IResponse> => {
+  return request.post({ url: '/auth/logout/', data: { refresh } })
+}
+
 export const getRoleMenusApi = (): Promise<IResponse<AppCustomRouteRecordRaw[]>> => {
   return request.get({ url: '/auth/getMenuList/' })
 }
@@ -1,4 +1,5 @@
 import request from '@/config/axios'
+import { waitJobResult } from '@/api/vadmin/system/jobs'
 
 export const getUserListApi = (params: any): Promise<IResponse> => {
   return request.get({ url: '/vadmin/auth/users/', params })
@@ -33,7 +34,9 @@ export const getCurrentAdminUserInfo = (): Promise<IResponse> => {
 }
 
 export const postExportUserQueryListApi = (params: any, data: any): Promise<IResponse> => {
-  return request.post({ url: `/vadmin/auth/user/export/query/list/to/excel/`, params, data })
+  return request
+    .post({ url: `/vadmin/auth/user/export/query/list/to/excel/`, params, data })
+    .then((res: IResponse) => waitJobResult(res))
 }
 
 export const getImportTemplateApi = (): Promise<IResponse> => {
@@ -41,17 +44,23 @@ export const getImportTemplateApi = (): Promise<IResponse> => {
 }
 
 export const postImportUserApi = (data: any): Promise<IResponse> => {
-  return request.post({
-    url: `/vadmin/auth/import/users/`,
-    headersType: 'multipart/form-data',
-    data
-  })
+  return request
+    .post({
+      url: `/vadmin/auth/import/users/`,
+      headersType: 'multipart/form-data',
+      data
+    })
+    .then((res: IResponse) => waitJobResult(res))
 }
 
 export const postUsersInitPasswordSendSMSApi = (data: any): Promise<IResponse> => {
-  return request.post({ url: `/vadmin/auth/users/init/password/send/sms/`, data })
+  return request
+    .post({ url: `/vadmin/auth/users/init/password/send/sms/`, data })
+    .then((res: IResponse) => waitJobResult(res))
 }
 
 export const postUsersInitPasswordSendEmailApi = (data: any): Promise<IResponse> => {
-  return request.post({ url: `/vadmin/auth/users/init/password/send/email/`, data })
+  return request
+    .post({ url: `/vadmin/auth/users/init/password/send/email/`, data })
+    .then((res: IResponse) => waitJobResult(res))
 }
@@ -24,8 +24,10 @@ export const getDictTypeOptionsApi = (): Promise<IResponse> => {
   return request.get({ url: `/vadmin/system/dict/types/options/` })
 }
 
-export const getDictTypeDetailsApi = (data: any): Promise<IResponse> => {
-  return request.post({ url: `/vadmin/system/dict/types/details/`, data })
+export const getDictTypeDetailsApi = (dictTypes: string[]): Promise<IResponse> => {
+  // 使用 GET 请求，浏览器会自动携带 If-None-Match 验证本地缓存，字典未变化时服务器返回 304
+  const query = dictTypes.map((item) => `dict_types=${encodeURIComponent(item)}`).join('&')
+  return request.get({ url: `/vadmin/system/dict/types/details/?${query}` })
 }
 
 export const getDictDetailsListApi = (params: any): Promise<IResponse> => {
@@ -0,0 +1,22 @@
+import request from '@/config/axios'
+import { ElMessage } from 'element-plus'
+
+// 获取后台任务状态、进度与执行结果
+export const getJobApi = (jobId: string): Promise<IResponse> => {
+  return request.get({ url: `/vadmin/system/jobs/${jobId}/` })
+}
+
+// 等待后台任务执行完成，返回与原接口相同结构的任务执行结果
+export const waitJobResult = async (res: IResponse, interval = 1000): Promise<IResponse> => {
+  const jobId = res.data.job_id
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, interval))
+    const job = await getJobApi(jobId)
+    if (job.data.status === 'success') {
+      return { ...job, data: job.data.result }
+    } else if (job.data.status === 'failed') {
+      ElMessage.error(job.data.error || '任务执行失败')
+      throw new Error(job.data.error)
+    }
+  }
+}
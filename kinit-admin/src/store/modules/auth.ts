@@ -1,7 +1,7 @@
 import { defineStore } from 'pinia'
 import { store } from '../index'
 import { UserLoginType } from '@/api/login/types'
-import { loginApi } from '@/api/login'
+import { loginApi, logoutApi } from '@/api/login'
 import { useAppStore } from '@/store/modules/app'
 import { useCache } from '@/hooks/web/useCache'
 import { getCurrentAdminUserInfo } from '@/api/vadmin/auth/user'
@@ -56,7 +56,12 @@ export const useAuthStore = defineStore('auth', {
       }
       return res
     },
-    logout() {
+    async logout() {
+      const appStore = useAppStore()
+      if (wsCache.get(appStore.getToken)) {
+        // 服务端撤销当前 token 与刷新 token，请求失败时仍然退出本地登录
+        await logoutApi(wsCache.get(appStore.getRefreshToken)).catch(() => {})
+      }
       wsCache.clear()
       this.user = {}
       this.isUser = false
@@ -14,6 +14,31 @@ Mysql 数据库配置项
 SQLALCHEMY_DATABASE_URL = "mysql+asyncmy://数据库用户名:数据库密码@数据库地址:数据库端口/数据库名称"
 SQLALCHEMY_DATABASE_TYPE = "mysql"
 
+"""
+Mysql 连接池配置
+每个进程中每个数据库地址只会创建一个连接池
+SQLALCHEMY_POOL_SIZE：连接池大小
+SQLALCHEMY_MAX_OVERFLOW：超过连接池大小外最多创建的连接
+SQLALCHEMY_POOL_TIMEOUT：池中没有连接最多等待的时间（秒），否则报错
+SQLALCHEMY_POOL_RECYCLE：多久之后对连接池中的连接进行一次回收（秒）
+"""
+SQLALCHEMY_POOL_SIZE = 10
+SQLALCHEMY_MAX_OVERFLOW = 5
+SQLALCHEMY_POOL_TIMEOUT = 20
+SQLALCHEMY_POOL_RECYCLE = 3600
+
+"""
+Mysql 读写分离配置
+SQLALCHEMY_READ_DATABASE_URLS：只读从库地址列表，为空则所有查询都走主库
+SQLALCHEMY_READ_SELECT_POLICY：从库选择策略，round_robin：轮询，least_connections：最少连接数
+SQLALCHEMY_READ_STICKY_SECONDS：客户端发生写入后，多少秒内该客户端的查询仍然走主库，避免因主从延迟读到旧数据
+    通过 db_sticky Cookie 或 X-DB-Sticky 请求头记录，只有保存 Cookie 或在请求中带上 X-DB-Sticky 的客户端才会粘滞到主库，
+    两者都不支持的客户端在写入后仍可能从从库读到旧数据
+"""
+SQLALCHEMY_READ_DATABASE_URLS = []
+SQLALCHEMY_READ_SELECT_POLICY = "round_robin"
+SQLALCHEMY_READ_STICKY_SECONDS = 3
+
 
 """
 Redis 数据库配置
@@ -51,3 +76,14 @@ ALIYUN_OSS = {
 """
 IP_PARSE_ENABLE = True
 IP_PARSE_TOKEN = "IP_PARSE_TOKEN"
+
+"""
+IP地址归属地缓存与离线数据
+IP_PARSE_OFFLINE_FILE：离线IP数据文件路径，为 None 则不使用离线数据，
+    文件每行格式：起始IP|结束IP|国家|省份|城市|区县|运营商
+IP_PARSE_CACHE_EXPIRE：解析结果缓存过期时间（秒），IPv4 按照 /24 网段缓存
+IP_PARSE_LRU_SIZE：进程内缓存的最大数量
+"""
+IP_PARSE_OFFLINE_FILE = None
+IP_PARSE_CACHE_EXPIRE = 86400
+IP_PARSE_LRU_SIZE = 4096
@@ -24,7 +24,8 @@ DEMO_WHITE_LIST_PATH = [
     "/auth/token/refresh/",
     "/auth/wx/login/",
     "/vadmin/system/dict/types/details/",
-    "/vadmin/auth/user/export/query/list/to/excel/"
+    "/vadmin/auth/user/export/query/list/to/excel/",
+    "/vadmin/auth/user/export/query/list/to/excel/stream/"
 ]
 
 """
@@ -101,8 +102,12 @@ ALLOW_HEADERS = ["*"]
 全局事件配置
 """
 EVENTS = [
+    "core.event.connect_mysql",
     "core.event.connect_mongo" if MONGO_DB_ENABLE else None,
     "core.event.connect_redis" if REDIS_DB_ENABLE else None,
+    "apps.vadmin.system.utils.config_cache.subscribe_config_cache" if REDIS_DB_ENABLE else None,
+    "core.event.start_job_workers",
+    "core.event.load_ip_offline" if IP_PARSE_OFFLINE_FILE else None,
 ]
 
 """
@@ -114,6 +119,8 @@ DEFAULT_PASSWORD = "0"
 DEFAULT_AVATAR = "https://vv-reserve.oss-cn-hangzhou.aliyuncs.com/avatar/2023-01-27/1674820804e81e7631.png"
 # 默认登陆时最大输入密码或验证码错误次数
 DEFAULT_AUTH_ERROR_MAX_NUMBER = 5
+# 登录错误次数的统计窗口（秒），窗口内错误次数达到最大次数后冻结用户
+DEFAULT_AUTH_ERROR_WINDOW = 86400
 # 是否开启保存登录日志
 LOGIN_LOG_RECORD = not DEBUG
 # 是否开启保存每次请求日志到本地
@@ -125,12 +132,175 @@ OPERATION_RECORD_METHOD = ["POST", "PUT", "DELETE"]
 # 忽略的操作接口函数名称，列表中的函数名称不会被记录到操作日志中
 IGNORE_OPERATION_FUNCTION = ["post_dicts_details"]
 
+"""
+操作日志批量写入配置
+操作日志先放入进程内队列，由后台任务批量写入 MongoDB
+OPERATION_RECORD_QUEUE_SIZE：队列最大长度
+OPERATION_RECORD_BATCH_SIZE：每批最多写入数量
+OPERATION_RECORD_FLUSH_INTERVAL：最长写入间隔（秒）
+OPERATION_RECORD_DROP_POLICY：队列已满时的处理策略，drop_new：丢弃新数据，drop_old：丢弃最早的数据，block：等待队列空闲
+"""
+OPERATION_RECORD_QUEUE_SIZE = 10000
+OPERATION_RECORD_BATCH_SIZE = 100
+OPERATION_RECORD_FLUSH_INTERVAL = 1
+OPERATION_RECORD_DROP_POLICY = "drop_new"
+
+"""
+列表分页总数
+允许使用近似总数的列表（v_approximate），只有在没有任何过滤条件，并且表统计信息中的行数不少于 APPROXIMATE_COUNT_MIN_ROWS 时，
+才使用近似行数作为总数，否则执行 COUNT 查询
+近似行数是 InnoDB 的估算值，并且包含软删除数据，只适合数据量很大、总数不需要准确的列表
+"""
+APPROXIMATE_COUNT_MIN_ROWS = 100000
+
+"""
+用户认证信息缓存
+开启后会将用户基本信息、角色以及权限集合缓存到 Redis，并在进程内使用 LRU 缓存，需要开启 Redis
+AUTH_CACHE_ENABLE：是否开启
+AUTH_CACHE_EXPIRE：Redis 中缓存的过期时间（秒）
+AUTH_CACHE_LRU_SIZE：进程内 LRU 缓存的最大用户数
+"""
+AUTH_CACHE_ENABLE = REDIS_DB_ENABLE
+AUTH_CACHE_EXPIRE = 3600
+AUTH_CACHE_LRU_SIZE = 1024
+
+"""
+已验证 token 缓存
+随用户认证信息缓存（AUTH_CACHE_ENABLE）一起开启，用户信息依赖认证信息缓存的版本号失效，所以不单独设置开关
+开启后同一个 access token 只解码一次，解码结果在进程内缓存到 token 过期为止，
+退出登录后 token 加入 Redis 撤销列表，所有进程立即生效
+TOKEN_CACHE_LRU_SIZE：进程内 LRU 缓存的最大 token 数
+"""
+TOKEN_CACHE_LRU_SIZE = 4096
+
+"""
+数据字典缓存
+开启后会将字典类型下的字典元素列表缓存到 Redis，并在进程内使用 LRU 缓存，需要开启 Redis
+每个字典类型单独记录版本号，字典类型或字典元素发生变化时自增，只有该字典类型的缓存失效
+DICT_CACHE_ENABLE：是否开启
+DICT_CACHE_EXPIRE：Redis 中缓存的过期时间（秒）
+DICT_CACHE_LRU_SIZE：进程内 LRU 缓存的最大字典类型数
+"""
+DICT_CACHE_ENABLE = REDIS_DB_ENABLE
+DICT_CACHE_EXPIRE = 86400
+DICT_CACHE_LRU_SIZE = 512
+
+"""
+系统基础配置缓存
+开启后系统基础配置缓存到 Redis，并在进程内保存快照，更新系统配置后通过 Redis 发布订阅通知所有进程清除快照，需要开启 Redis
+CONFIG_CACHE_ENABLE：是否开启
+CONFIG_CACHE_EXPIRE：Redis 中缓存的过期时间（秒）
+CONFIG_CACHE_SNAPSHOT_TTL：进程内快照的有效时间（秒），订阅断开时最多使用该时间的旧配置
+"""
+CONFIG_CACHE_ENABLE = REDIS_DB_ENABLE
+CONFIG_CACHE_EXPIRE = 86400
+CONFIG_CACHE_SNAPSHOT_TTL = 60
+
+"""
+按照客户端 IP 限制访问频率，滑动窗口，需要开启 Redis
+IP_THROTTLE_ENABLE：是否开启
+IP_THROTTLE_RATES：{限流范围: (窗口内最多请求次数, 窗口大小（秒）)}
+"""
+IP_THROTTLE_ENABLE = REDIS_DB_ENABLE
+IP_THROTTLE_RATES = {
+    "login": (30, 60),
+    "sms": (10, 3600)
+}
+
+"""
+密码哈希工作池
+bcrypt 计算放到工作池中执行，不阻塞事件循环
+PASSWORD_HASH_POOL：工作池类型，thread：线程池，process：进程池
+PASSWORD_HASH_WORKERS：最多同时计算的数量
+PASSWORD_HASH_BATCH_SIZE：批量计算时每批的数量
+"""
+PASSWORD_HASH_POOL = "thread"
+PASSWORD_HASH_WORKERS = 4
+PASSWORD_HASH_BATCH_SIZE = 100
+
+"""
+后台任务队列
+导出、导入、批量发送通知等耗时操作提交到后台任务中执行，接口立即返回任务编号
+JOB_QUEUE_BACKEND：队列类型，redis：所有进程共享队列与任务状态，memory：进程内队列，只适用于单进程部署
+    redis 队列部署在多台服务器上时，导入文件与导出结果保存在 TEMP_DIR 中，TEMP_DIR 必须为共享存储，否则只能部署在一台服务器上
+JOB_WORKERS：每个进程中的工作协程数量
+JOB_RESULT_EXPIRE：任务状态与结果的保存时间（秒）
+"""
+JOB_QUEUE_BACKEND = "redis" if REDIS_DB_ENABLE else "memory"
+JOB_WORKERS = 2
+JOB_RESULT_EXPIRE = 86400
+
+"""
+批量短信发送
+SMS_PROVIDER：短信服务商，aliyun：阿里云短信服务，local：本地替身，不发送短信，只记录日志
+SMS_SEND_CONCURRENCY：最多同时发送的数量
+SMS_SEND_RATE：每秒最多发送的数量，与短信服务商的频率限制保持一致
+SMS_SEND_RETRY：网络异常、服务商限流等临时错误的重试次数
+"""
+SMS_PROVIDER = "aliyun"
+SMS_SEND_CONCURRENCY = 10
+SMS_SEND_RATE = 20
+SMS_SEND_RETRY = 3
+
+"""
+邮件发送
+EMAIL_POOL_SIZE：每个邮箱账号的 SMTP 连接池大小，即同时发送邮件的最大数量
+EMAIL_POOL_IDLE_TIMEOUT：连接空闲超过该时间（秒）后重新建立，避免使用已被服务器断开的连接
+EMAIL_TIMEOUT：SMTP 连接超时时间（秒）
+"""
+EMAIL_POOL_SIZE = 5
+EMAIL_POOL_IDLE_TIMEOUT = 60
+EMAIL_TIMEOUT = 30
+
+"""
+外部接口调用（微信等）
+HTTP_CLIENT_TIMEOUT：请求超时时间（秒）
+HTTP_CLIENT_RETRY：网络异常与 5xx 响应的重试次数
+WX_ACCESS_TOKEN_EXPIRE：微信 access_token 在 Redis 中的缓存时间（秒），微信返回的有效期为 7200 秒
+WX_ACCESS_TOKEN_REFRESH_BEFORE：缓存剩余时间少于该值（秒）时，在后台提前刷新 access_token
+"""
+HTTP_CLIENT_TIMEOUT = 10
+HTTP_CLIENT_RETRY = 2
+WX_ACCESS_TOKEN_EXPIRE = 2000
+WX_ACCESS_TOKEN_REFRESH_BEFORE = 300
+
+"""
+对象存储
+OSS_BACKEND：存储后端，aliyun：阿里云 OSS，local：本地替身，文件保存到 STATIC_ROOT 中，用于本地开发与测试
+OSS_UPLOAD_WORKERS：执行 SDK 调用的线程数量
+OSS_MULTIPART_THRESHOLD：文件大于该值（字节）时使用分片上传
+OSS_MULTIPART_PART_SIZE：分片大小（字节），阿里云要求除最后一个分片外不小于 100KB
+OSS_MULTIPART_PARALLEL：每个文件同时上传的分片数量
+"""
+OSS_BACKEND = "aliyun"
+OSS_UPLOAD_WORKERS = 8
+OSS_MULTIPART_THRESHOLD = 10 * 1024 * 1024
+OSS_MULTIPART_PART_SIZE = 2 * 1024 * 1024
+OSS_MULTIPART_PARALLEL = 4
+
+"""
+图片处理
+IMAGE_PROCESS_WORKERS：图片压缩进程池大小
+IMAGE_RENDITIONS：压缩上传图片时生成的版本，第一个为主版本
+    max_size：最大边长，超过时等比缩放，为 None 时不缩放
+    format：图片格式，JPEG、WEBP、PNG
+    suffix：文件名后缀
+"""
+IMAGE_PROCESS_WORKERS = 2
+IMAGE_RENDITIONS = {
+    "default": {"max_size": 1920, "format": "JPEG", "suffix": ""},
+    "webp": {"max_size": 1920, "format": "WEBP", "suffix": ""},
+    "thumbnail": {"max_size": 200, "format": "JPEG", "suffix": "_thumbnail"},
+}
+
 """
 中间件配置
+所有中间件共用一个纯 ASGI 中间件，列表中的函数只注册钩子，钩子按照列表顺序执行
 """
 MIDDLEWARES = [
     "core.middleware.register_request_log_middleware" if REQUEST_LOG_RECORD else None,
     "core.middleware.register_operation_record_middleware" if OPERATION_LOG_RECORD and MONGO_DB_ENABLE else None,
     "core.middleware.register_demo_env_middleware" if DEMO else None,
+    "core.middleware.register_read_sticky_middleware" if SQLALCHEMY_READ_DATABASE_URLS else None,
     "core.middleware.register_jwt_refresh_middleware"
 ]
@@ -6,31 +6,41 @@
 # @IDE            : PyCharm
 # @desc           : 增删改查
 
-from typing import List, Any
+import datetime
+import hashlib
+import json
+import os
+import random
+import shutil
+from collections import defaultdict
+from typing import List, Any, Dict, Callable, Awaitable
 from aioredis import Redis
 from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import joinedload
 
 from core.exception import CustomException
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import select
+from sqlalchemy import select, insert
 from core.crud import DalBase
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.validator import vali_telephone
 from utils.file.aliyun_oss import AliyunOSS, BucketConf
 from utils.aliyun_sms import AliyunSMS
+from utils.sms_dispatcher import SMSDispatcher
 from utils.excel.import_manage import ImportManage, FieldType
 from utils.excel.write_xlsx import WriteXlsx
+from utils.excel.stream_xlsx import StreamXlsx
 from utils.send_email import EmailSender
-from .params import UserParams
+from utils.password_hash import PasswordHash
 from utils.tools import test_password
 from . import models, schemas
 from application import settings
-from utils.excel.excel_manage import ExcelManage
 from apps.vadmin.system import crud as vadminSystemCRUD
 import copy
 from utils import status
 from utils.wx.oauth import WXOAuth
+from .utils.auth_cache import AuthCache
 
 
 class UserDal(DalBase):
@@ -42,6 +52,8 @@ class UserDal(DalBase):
         {"label": "性别", "field": "gender", "required": False},
         {"label": "关联角色", "field": "role_ids", "required": True, "type": FieldType.list},
     ]
+    # 批量导入时每批插入的用户数量
+    import_batch_size = 500
 
     def __init__(self, db: AsyncSession):
         super(UserDal, self).__init__(db, models.VadminUser, schemas.UserSimpleOut)
@@ -59,8 +71,7 @@ class UserDal(DalBase):
         unique = await self.get_data(telephone=data.telephone, v_return_none=True)
         if unique:
             raise CustomException("手机号已存在！", code=status.HTTP_ERROR)
-        password = data.telephone[5:12] if settings.DEFAULT_PASSWORD == "0" else settings.DEFAULT_PASSWORD
-        data.password = self.model.get_password_hash(password)
+        data.password = await self.model.async_get_password_hash(self.get_default_password(data.telephone))
         data.avatar = data.avatar if data.avatar else settings.DEFAULT_AVATAR
         obj = self.model(**data.dict(exclude={'role_ids'}))
         if data.role_ids:
@@ -70,6 +81,13 @@ class UserDal(DalBase):
         await self.flush(obj)
         return await self.out_dict(obj, v_options, v_return_obj, v_schema)
 
+    @staticmethod
+    def get_default_password(telephone: str) -> str:
+        """
+        获取用户默认密码，"0" 为手机号后六位
+        """
+        return telephone[5:12] if settings.DEFAULT_PASSWORD == "0" else settings.DEFAULT_PASSWORD
+
     async def put_data(
             self,
             data_id: int,
@@ -82,6 +100,7 @@ class UserDal(DalBase):
         更新用户信息
         """
         obj = await self.get_data(data_id, v_options=[joinedload(self.model.roles)])
+        AuthCache.invalidate_user(self.db, obj.telephone, data.telephone)
         data_dict = jsonable_encoder(data)
         for key, value in data_dict.items():
             if key == "role_ids":
@@ -105,15 +124,17 @@ class UserDal(DalBase):
         result = test_password(data.password)
         if isinstance(result, str):
             raise CustomException(msg=result, code=400)
-        user.password = self.model.get_password_hash(data.password)
+        user.password = await self.model.async_get_password_hash(data.password)
         user.is_reset_password = True
         await self.flush(user)
+        AuthCache.invalidate_user(self.db, user.telephone)
         return True
 
     async def update_current_info(self, user: models.VadminUser, data: schemas.UserUpdateBaseInfo):
         """
         更新当前用户基本信息
         """
+        AuthCache.invalidate_user(self.db, user.telephone, data.telephone)
         if data.telephone != user.telephone:
             unique = await self.get_data(telephone=data.telephone, v_return_none=True)
             if unique:
@@ -126,34 +147,53 @@ class UserDal(DalBase):
         await self.flush(user)
         return await self.out_dict(user)
 
-    async def export_query_list(self, header: list, params: UserParams):
+    async def export_query_list(self, header: list, params: dict):
         """
-        导出用户查询列表为excel
+        导出用户查询列表为excel，保存到临时目录并返回文件链接
+        """
+        xlsx = await self.export_query_list_stream(header, params)
+        date = datetime.datetime.strftime(datetime.datetime.now(), "%Y%m%d")
+        file_dir = os.path.join(settings.TEMP_DIR, date)
+        if not os.path.exists(file_dir):
+            os.mkdir(file_dir)
+        name = hashlib.md5(str(random.random()).encode()).hexdigest() + ".xlsx"
+        shutil.move(xlsx.filename, os.path.join(file_dir, name))
+        return {"url": f"{settings.TEMP_URL}/{date}/{name}", "filename": "用户列表.xlsx"}
+
+    async def export_query_list_stream(self, header: list, params: dict) -> StreamXlsx:
+        """
+        流式导出用户查询列表为excel
+
+        使用服务端游标分批查询，每批数据在线程池中写入文件，返回已完成写入的文件对象
+        :param header: 表头与对应字段
+        :param params: 查询参数，UserParams.dict()
         """
-        datas = await self.get_datas(**params.dict(), v_return_objs=True)
-        # 获取表头
-        row = list(map(lambda i: i.get("label"), header))
-        rows = []
         options = await vadminSystemCRUD.DictTypeDal(self.db).get_dicts_details(["sys_vadmin_gender"])
-        for user in datas:
-            data = []
-            for item in header:
-                field = item.get("field")
-                # 通过反射获取对应的属性值
-                value = getattr(user, field, "")
-                if field == "is_active":
-                    value = "可用" if value else "停用"
-                elif field == "gender":
-                    result = list(filter(lambda i: i["value"] == value, options["sys_vadmin_gender"]))
-                    value = result[0]["label"] if result else ""
-                data.append(value)
-            rows.append(data)
-        em = ExcelManage()
-        em.create_excel("用户列表")
-        em.write_list(rows, row)
-        file_url = em.save_excel()
-        em.close()
-        return {"url": file_url, "filename": "用户列表.xlsx"}
+        genders = {item["value"]: item["label"] for item in options["sys_vadmin_gender"]}
+        fields = [item.get("field") for item in header]
+        xlsx = StreamXlsx("用户列表", [item.get("label") for item in header])
+        try:
+            async for users in self.stream_datas(**{key: value for key, value in params.items() if key != "v_after"}):
+                rows = [self.__export_row(user, fields, genders) for user in users]
+                await run_in_threadpool(xlsx.write_rows, rows)
+            await run_in_threadpool(xlsx.close)
+        except Exception:
+            xlsx.remove()
+            raise
+        return xlsx
+
+    @staticmethod
+    def __export_row(user: models.VadminUser, fields: List[str], genders: Dict[str, str]) -> list:
+        data = []
+        for field in fields:
+            # 通过反射获取对应的属性值
+            value = getattr(user, field, "")
+            if field == "is_active":
+                value = "可用" if value else "停用"
+            elif field == "gender":
+                value = genders.get(value, "")
+            data.append(value)
+        return data
 
     async def get_import_headers_options(self):
         """
@@ -182,45 +222,126 @@ class UserDal(DalBase):
         em.close()
         return {"url": em.file_url, "filename": "用户导入模板.xlsx"}
 
-    async def import_users(self, file: UploadFile):
+    async def import_users(self, file: UploadFile | str, progress: Callable[[int, int], Awaitable] = None):
         """
         批量导入用户数据
+
+        :param file: 上传文件，或者已经保存到本地的文件路径
+        :param progress: 进度回调函数，参数为 (已完成数量, 总数量)
+
+        1. 检查表格数据，并去除文件中重复的手机号
+        2. 使用一次 IN 查询获取已存在的手机号，一次 IN 查询获取关联的角色
+        3. 在工作池中并行计算默认密码
+        4. 分批插入用户与用户角色关联数据，每批使用一个保存点，失败时只回滚当前批次
         """
         await self.get_import_headers_options()
         im = ImportManage(file, copy.deepcopy(self.import_headers))
         await im.get_table_data()
         im.check_table_data()
+
+        rows = []
+        telephones = set()
         for item in im.success:
             old_data_list = item.pop("old_data_list")
-            data = schemas.UserIn(**item)
             try:
-                await self.create_data(data)
+                data = schemas.UserIn(**item)
             except ValueError as e:
                 old_data_list.append(e.__str__())
                 im.add_error_data(old_data_list)
-            except Exception:
-                old_data_list.append("创建失败，请联系管理员！")
+                continue
+            if data.telephone in telephones:
+                old_data_list.append("文件中手机号重复！")
+                im.add_error_data(old_data_list)
+                continue
+            telephones.add(data.telephone)
+            rows.append((data, old_data_list))
+
+        exist_telephones = set()
+        role_ids = set()
+        if rows:
+            sql = select(self.model.telephone).where(
+                self.model.is_delete == False,
+                self.model.telephone.in_(telephones)
+            )
+            exist_telephones = set((await self.db.scalars(sql)).all())
+            sql = select(models.VadminRole.id).where(
+                models.VadminRole.is_delete == False,
+                models.VadminRole.id.in_({role_id for data, _ in rows for role_id in data.role_ids})
+            )
+            role_ids = set((await self.db.scalars(sql)).all())
+
+        datas = []
+        for data, old_data_list in rows:
+            if data.telephone in exist_telephones:
+                old_data_list.append("手机号已存在！")
                 im.add_error_data(old_data_list)
+            elif not set(data.role_ids).issubset(role_ids):
+                old_data_list.append("关联角色不存在！")
+                im.add_error_data(old_data_list)
+            else:
+                datas.append((data, old_data_list))
+
+        hashes = await PasswordHash.hash_many([self.get_default_password(data.telephone) for data, _ in datas])
+        size = self.import_batch_size
+        for i in range(0, len(datas), size):
+            batch = datas[i:i + size]
+            try:
+                async with self.db.begin_nested():
+                    await self.bulk_create_users([data for data, _ in batch], hashes[i:i + size])
+            except Exception:
+                for _, old_data_list in batch:
+                    old_data_list.append("创建失败，请联系管理员！")
+                    im.add_error_data(old_data_list)
+            if progress:
+                await progress(i + len(batch), len(datas))
         return {
             "success_number": im.success_number,
             "error_number": im.error_number,
             "error_url": im.generate_error_url()
         }
 
+    async def bulk_create_users(self, datas: List[schemas.UserIn], hashes: List[str]) -> None:
+        """
+        批量插入用户与用户角色关联数据，调用前需要确认手机号不存在
+
+        MySQL 不支持 RETURNING，插入后按照手机号查询一次获取用户 ID
+        """
+        values = []
+        for data, password_hash in zip(datas, hashes):
+            item = data.dict(exclude={"role_ids"})
+            item["password"] = password_hash
+            item["avatar"] = data.avatar if data.avatar else settings.DEFAULT_AVATAR
+            values.append(item)
+        await self.db.execute(insert(self.model), values)
+        sql = select(self.model.id, self.model.telephone).where(
+            self.model.is_delete == False,
+            self.model.telephone.in_([data.telephone for data in datas])
+        )
+        user_ids = {telephone: user_id for user_id, telephone in (await self.db.execute(sql)).all()}
+        user_roles = [
+            {"user_id": user_ids[data.telephone], "role_id": role_id}
+            for data in datas
+            for role_id in set(data.role_ids)
+        ]
+        if user_roles:
+            await self.db.execute(insert(models.vadmin_user_roles), user_roles)
+
     async def init_password(self, ids: List[int]):
         """
         初始化所选用户密码
         将用户密码改为系统默认密码，并将初始化密码状态改为false
         """
         users = await self.get_datas(limit=0, id=("in", ids), v_return_objs=True)
+        passwords = [self.get_default_password(user.telephone) for user in users]
+        hashes = await PasswordHash.hash_many(passwords)
         result = []
-        for user in users:
+        for user, password, password_hash in zip(users, passwords, hashes):
             # 重置密码
             data = {"id": user.id, "telephone": user.telephone, "name": user.name, "email": user.email}
-            password = user.telephone[5:12] if settings.DEFAULT_PASSWORD == "0" else settings.DEFAULT_PASSWORD
-            user.password = self.model.get_password_hash(password)
+            user.password = password_hash
             user.is_reset_password = False
             self.db.add(user)
+            AuthCache.invalidate_user(self.db, user.telephone)
             data["reset_password_status"] = True
             data["password"] = password
             result.append(data)
@@ -232,61 +353,104 @@ class UserDal(DalBase):
         初始化所选用户密码并发送通知短信
         将用户密码改为系统默认密码，并将初始化密码状态改为false
         """
-        result = await self.init_password(ids)
-        for user in result:
+        return await self.send_password_sms(await self.init_password(ids), rd)
+
+    @staticmethod
+    async def send_password_sms(users: List[dict], rd: Redis, progress: Callable[[int, int], Awaitable] = None):
+        """
+        发送重置密码通知短信，不使用数据库
+
+        所有短信共用一次配置获取与同一个客户端，限制并发与每秒发送数量，临时错误自动重试
+
+        :param users: init_password 返回结果
+        :param rd: Redis
+        :param progress: 进度回调函数，参数为 (已完成数量, 总数量)
+        """
+        messages = []
+        for user in users:
+            password = user.pop("password", None)
             if not user["reset_password_status"]:
                 user["send_sms_status"] = False
                 user["send_sms_msg"] = "重置密码失败"
                 continue
-            password = user.pop("password")
-            sms = AliyunSMS(rd, user.get("telephone"))
             try:
-                send_result = await sms.main_async(AliyunSMS.Scene.reset_password, password=password)
-                user["send_sms_status"] = send_result
-                user["send_sms_msg"] = "" if send_result else "发送失败，请联系管理员"
+                AliyunSMS.check_telephone_format(user.get("telephone"))
             except CustomException as e:
                 user["send_sms_status"] = False
                 user["send_sms_msg"] = e.msg
-        return result
+                continue
+            messages.append((user, {"password": password}))
+        if messages:
+            dispatcher = SMSDispatcher(rd, AliyunSMS.Scene.reset_password)
+            try:
+                results = await dispatcher.send_many(
+                    [(user["telephone"], params) for user, params in messages],
+                    progress
+                )
+            except CustomException as e:
+                results = [{"status": False, "msg": e.msg}] * len(messages)
+            for (user, _), result in zip(messages, results):
+                user["send_sms_status"] = result["status"]
+                user["send_sms_msg"] = result["msg"]
+        return users
 
     async def init_password_send_email(self, ids: List[int], rd: Redis):
         """
         初始化所选用户密码并发送通知邮件
         将用户密码改为系统默认密码，并将初始化密码状态改为false
         """
-        result = await self.init_password(ids)
-        for user in result:
+        return await self.send_password_email(await self.init_password(ids), rd)
+
+    @staticmethod
+    async def send_password_email(users: List[dict], rd: Redis, progress: Callable[[int, int], Awaitable] = None):
+        """
+        发送重置密码通知邮件，不使用数据库
+
+        所有邮件共用一次配置获取与同一个 SMTP 连接池，并发发送
+
+        :param users: init_password 返回结果
+        :param rd: Redis
+        :param progress: 进度回调函数，参数为 (已完成数量, 总数量)
+        """
+        messages = []
+        for user in users:
+            password: str = user.pop("password", None)
+            email: str = user.get("email", None)
             if not user["reset_password_status"]:
                 user["send_sms_status"] = False
                 user["send_sms_msg"] = "重置密码失败"
-                continue
-            password: str = user.pop("password")
-            email: str = user.get("email", None)
-            if email:
-                subject = "密码已重置"
-                body = f"您好，您的密码已经重置为{password}，请及时登录并修改密码。"
-                es = EmailSender(rd)
-                try:
-                    send_result = await es.send_email([email], subject, body)
-                    user["send_sms_status"] = send_result
-                    user["send_sms_msg"] = "" if send_result else "发送失败，请联系管理员"
-                except CustomException as e:
-                    user["send_sms_status"] = False
-                    user["send_sms_msg"] = e.msg
-            else:
+            elif not email:
                 user["send_sms_status"] = False
                 user["send_sms_msg"] = "未获取到邮箱地址"
-        return result
+            else:
+                body = f"您好，您的密码已经重置为{password}，请及时登录并修改密码。"
+                messages.append((user, ([email], "密码已重置", body)))
+        if messages:
+            es = EmailSender(rd)
+            try:
+                results = await es.send_many([message for _, message in messages], progress)
+            except CustomException as e:
+                results = [e.msg] * len(messages)
+            for (user, _), result in zip(messages, results):
+                user["send_sms_status"] = result is True
+                user["send_sms_msg"] = "" if result is True else (result or "发送失败，请联系管理员")
+        return users
 
     async def update_current_avatar(self, user: models.VadminUser, file: UploadFile):
         """
         更新当前用户头像
         """
-        result = await AliyunOSS(BucketConf(**settings.ALIYUN_OSS)).upload_image("avatar", file)
+        oss = AliyunOSS(BucketConf(**settings.ALIYUN_OSS))
+        media = vadminSystemCRUD.MediaDal(self.db)
+        result = await oss.upload_image("avatar", file, media=media)
         if not result:
             raise CustomException(msg="上传失败", code=status.HTTP_ERROR)
+        if user.avatar:
+            # 释放旧头像，没有其他用户使用时删除，上传相同头像时抵消本次增加的引用次数
+            await media.release(user.avatar, oss.storage)
         user.avatar = result
         await self.flush(user)
+        AuthCache.invalidate_user(self.db, user.telephone)
         return result
 
     async def update_wx_server_openid(self, code: str, user: models.VadminUser, redis: Redis):
@@ -300,6 +464,7 @@ class UserDal(DalBase):
         user.is_wx_server_openid = True
         user.wx_server_openid = openid
         await self.flush(user)
+        AuthCache.invalidate_user(self.db, user.telephone)
         return True
     
     async def delete_datas(self, ids: List[int], v_soft: bool = False, **kwargs):
@@ -315,6 +480,7 @@ class UserDal(DalBase):
         for obj in objs:
             if obj.roles:
                 obj.roles.clear()
+        AuthCache.invalidate_user(self.db, *[obj.telephone for obj in objs])
         return await super(UserDal, self).delete_datas(ids, v_soft, **kwargs)
 
 
@@ -349,6 +515,7 @@ class RoleDal(DalBase):
     ):
         """更新单个数据"""
         obj = await self.get_data(data_id, v_options=[joinedload(self.model.menus)])
+        AuthCache.invalidate_all(self.db)
         obj_dict = jsonable_encoder(data)
         for key, value in obj_dict.items():
             if key == "menu_ids":
@@ -384,14 +551,38 @@ class RoleDal(DalBase):
         objs = await self.get_datas(limit=0, id=("in", ids), user_total_number=(">", 0), v_return_objs=True)
         if objs:
             raise CustomException("无法删除存在用户关联的角色", code=400)
+        AuthCache.invalidate_all(self.db)
         return await super(RoleDal, self).delete_datas(ids, v_soft, **kwargs)
 
 
 class MenuDal(DalBase):
 
+    ROUTERS_CACHE_KEY = "auth_routers"
+
     def __init__(self, db: AsyncSession):
         super(MenuDal, self).__init__(db, models.VadminMenu, schemas.MenuSimpleOut)
 
+    async def create_data(self, data, v_options: list = None, v_return_obj: bool = False, v_schema: Any = None):
+        """
+        创建菜单，创建后清除所有用户认证缓存
+        """
+        AuthCache.invalidate_all(self.db)
+        return await super(MenuDal, self).create_data(data, v_options, v_return_obj, v_schema)
+
+    async def put_data(
+            self,
+            data_id: int,
+            data: Any,
+            v_options: list = None,
+            v_return_obj: bool = False,
+            v_schema: Any = None
+    ):
+        """
+        更新菜单，更新后清除所有用户认证缓存
+        """
+        AuthCache.invalidate_all(self.db)
+        return await super(MenuDal, self).put_data(data_id, data, v_options, v_return_obj, v_schema)
+
     async def get_tree_list(self, mode: int):
         """
         1：获取菜单树列表
@@ -404,16 +595,14 @@ class MenuDal(DalBase):
             sql = select(self.model).where(self.model.is_delete == False)
         queryset = await self.db.execute(sql)
         datas = queryset.scalars().all()
-        roots = filter(lambda i: not i.parent_id, datas)
+        index = self.generate_menu_index(datas)
         if mode == 1:
-            menus = self.generate_tree_list(datas, roots)
+            return self.generate_tree_list(index)
         elif mode == 2 or mode == 3:
-            menus = self.generate_tree_options(datas, roots)
-        else:
-            raise CustomException("获取菜单失败，无可用选项", code=400)
-        return self.menus_order(menus)
+            return self.generate_tree_options(index)
+        raise CustomException("获取菜单失败，无可用选项", code=400)
 
-    async def get_routers(self, user: models.VadminUser):
+    async def get_routers(self, user: models.VadminUser, rd: Redis = None):
         """
         获取路由表
         declare interface AppCustomRouteRecordRaw extends Omit<RouteRecordRaw, 'meta'> {
@@ -424,87 +613,101 @@ class MenuDal(DalBase):
             redirect: string
             children?: AppCustomRouteRecordRaw[]
         }
-        """
-        if any([i.is_admin for i in user.roles]):
+
+        传入 rd 并且开启了用户认证缓存时，路由表按照（角色集合，菜单版本号）缓存到 Redis 中，
+        菜单版本号使用用户认证缓存的全局版本号，角色或菜单发生变化时自增，缓存随之失效
+        """
+        is_admin = any([i.is_admin for i in user.roles])
+        cache_key = None
+        if rd and settings.AUTH_CACHE_ENABLE:
+            roles = "admin" if is_admin else ",".join(str(i) for i in sorted(i.id for i in user.roles))
+            version = await rd.get(AuthCache.VERSION_KEY) or 0
+            cache_key = f"{self.ROUTERS_CACHE_KEY}:{version}:{hashlib.md5(roles.encode()).hexdigest()}"
+            result = await rd.get(cache_key)
+            if result:
+                return json.loads(result)
+        if is_admin:
             sql = select(self.model)\
                 .where(self.model.disabled == 0, self.model.menu_type != "2", self.model.is_delete == False)
             queryset = await self.db.execute(sql)
             datas = queryset.scalars().all()
         else:
-            options = [joinedload(models.VadminUser.roles), joinedload("roles.menus")]
-            user = await UserDal(self.db).get_data(user.id, v_options=options)
-            datas = set()
-            for role in user.roles:
-                for menu in role.menus:
-                    # 该路由没有被禁用，并且菜单不是按钮
-                    if not menu.disabled and menu.menu_type != "2":
-                        datas.add(menu)
-        roots = filter(lambda i: not i.parent_id, datas)
-        menus = self.generate_router_tree(datas, roots)
-        return self.menus_order(menus)
-
-    def generate_router_tree(self, menus: List[models.VadminMenu], nodes: filter, name: str = "") -> list:
+            # 该路由没有被禁用，并且菜单不是按钮
+            sql = select(self.model).join(self.model.roles).where(
+                models.VadminRole.id.in_([i.id for i in user.roles]),
+                self.model.disabled == 0,
+                self.model.menu_type != "2",
+                self.model.is_delete == False
+            )
+            queryset = await self.db.execute(sql)
+            datas = queryset.scalars().unique().all()
+        routers = self.generate_router_tree(self.generate_menu_index(datas))
+        if cache_key:
+            await rd.set(cache_key, json.dumps(routers), ex=settings.AUTH_CACHE_EXPIRE)
+        return routers
+
+    @classmethod
+    def generate_menu_index(cls, menus: List[models.VadminMenu]) -> Dict[int | None, List[models.VadminMenu]]:
+        """
+        生成菜单索引，parent_id -> 按照排序字段排序后的子菜单列表，根菜单的 key 为 None
+
+        只需要遍历一次菜单列表，生成树时直接通过索引获取子菜单，每一层都已排序
+        """
+        index = defaultdict(list)
+        for menu in menus:
+            index[menu.parent_id or None].append(menu)
+        for items in index.values():
+            items.sort(key=lambda menu: menu.order or 0)
+        return index
+
+    def generate_router_tree(self, index: dict, parent_id: int = None, name: str = "") -> list:
         """
         生成路由树
 
-        menus: 总菜单列表
-        nodes：节点菜单列表
+        index: 菜单索引
+        parent_id：父菜单 ID，为 None 时生成根节点
         name：name拼接，切记Name不能重复
         """
         data = []
-        for root in nodes:
+        for root in index.get(parent_id, []):
             router = schemas.RouterOut.from_orm(root)
             router.name = name + "".join(name.capitalize() for name in router.path.split("/"))
             router.meta = schemas.Meta(title=root.title, icon=root.icon, hidden=root.hidden, alwaysShow=root.alwaysShow)
             if root.menu_type == "0":
-                sons = filter(lambda i: i.parent_id == root.id, menus)
-                router.children = self.generate_router_tree(menus, sons, router.name)
+                router.children = self.generate_router_tree(index, root.id, router.name)
             data.append(router.dict())
         return data
 
-    def generate_tree_list(self, menus: List[models.VadminMenu], nodes: filter) -> list:
+    def generate_tree_list(self, index: dict, parent_id: int = None) -> list:
         """
         生成菜单树列表
 
-        menus: 总菜单列表
-        nodes：每层节点菜单列表
+        index: 菜单索引
+        parent_id：父菜单 ID，为 None 时生成根节点
         """
         data = []
-        for root in nodes:
+        for root in index.get(parent_id, []):
             router = schemas.TreeListOut.from_orm(root)
             if root.menu_type == "0" or root.menu_type == "1":
-                sons = filter(lambda i: i.parent_id == root.id, menus)
-                router.children = self.generate_tree_list(menus, sons)
+                router.children = self.generate_tree_list(index, root.id)
             data.append(router.dict())
         return data
 
-    def generate_tree_options(self, menus: List[models.VadminMenu], nodes: filter) -> list:
+    def generate_tree_options(self, index: dict, parent_id: int = None) -> list:
         """
         生成菜单树选择项
 
-        menus: 总菜单列表
-        nodes：每层节点菜单列表
+        index: 菜单索引
+        parent_id：父菜单 ID，为 None 时生成根节点
         """
         data = []
-        for root in nodes:
+        for root in index.get(parent_id, []):
             router = {"value": root.id, "label": root.title, "order": root.order}
             if root.menu_type == "0" or root.menu_type == "1":
-                sons = filter(lambda i: i.parent_id == root.id, menus)
-                router["children"] = self.generate_tree_options(menus, sons)
+                router["children"] = self.generate_tree_options(index, root.id)
             data.append(router)
         return data
 
-    @classmethod
-    def menus_order(cls, datas: list, order: str = "order", children: str = "children"):
-        """
-        菜单排序
-        """
-        result = sorted(datas, key=lambda menu: menu[order])
-        for item in result:
-            if item[children]:
-                item[children] = sorted(item[children], key=lambda menu: menu[order])
-        return result
-
     async def delete_datas(self, ids: List[int], v_soft: bool = False, **kwargs):
         """
         删除多个菜单
@@ -518,5 +721,6 @@ class MenuDal(DalBase):
         for obj in objs:
             if obj.roles:
                 raise CustomException("无法删除存在角色关联的菜单", code=400)
+        AuthCache.invalidate_all(self.db)
         return await super(MenuDal, self).delete_datas(ids, v_soft, **kwargs)
 
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/16 14:35
+# @File           : jobs.py
+# @IDE            : PyCharm
+# @desc           : 用户管理后台任务
+
+"""
+在 views.py 中导入本模块完成任务注册
+
+发送短信、邮件前先提交重置密码的事务，发送过程中不占用数据库连接
+"""
+
+import os
+from typing import List
+from core.exception import CustomException
+from core.job import job_manage, Job
+from utils.file.file_manage import FileManage
+from . import crud
+
+
+@job_manage.register("export_users")
+async def export_users(job: Job, header: list, params: dict) -> dict:
+    """
+    导出用户查询列表为excel
+    """
+    # 查询参数经过 JSON 序列化后，元组条件 ("like", value) 变为列表，这里还原为元组
+    params = {key: tuple(value) if isinstance(value, list) else value for key, value in params.items()}
+    async with job.session() as db:
+        return await crud.UserDal(db).export_query_list(header, params)
+
+
+@job_manage.register("import_users")
+async def import_users(job: Job, filename: str) -> dict:
+    """
+    批量导入用户数据，filename 为接口中保存的临时文件路径，任务结束后删除
+    """
+    if not os.path.exists(filename):
+        # redis 队列部署在多台服务器上，且 TEMP_DIR 不是共享存储时，执行任务的服务器上没有上传的文件
+        raise CustomException("导入文件不存在，多台服务器部署时 TEMP_DIR 需要使用共享存储")
+    try:
+        async with job.session() as db:
+            return await crud.UserDal(db).import_users(filename, progress=job.set_progress)
+    finally:
+        await FileManage.remove(filename)
+
+
+@job_manage.register("init_password_send_sms")
+async def init_password_send_sms(job: Job, ids: List[int]) -> list:
+    """
+    初始化所选用户密码并发送通知短信
+    """
+    async with job.session() as db:
+        users = await crud.UserDal(db).init_password(ids)
+    return await crud.UserDal.send_password_sms(users, job.redis, job.set_progress)
+
+
+@job_manage.register("init_password_send_email")
+async def init_password_send_email(job: Job, ids: List[int]) -> list:
+    """
+    初始化所选用户密码并发送通知邮件
+    """
+    async with job.session() as db:
+        users = await crud.UserDal(db).init_password(ids)
+    return await crud.UserDal.send_password_email(users, job.redis, job.set_progress)
@@ -11,11 +11,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 from db.db_base import BaseModel
 from sqlalchemy import Column, String, Boolean, DateTime
-from passlib.context import CryptContext
+from utils.password_hash import pwd_context, PasswordHash
 from .m2m import vadmin_user_roles
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
-
 
 class VadminUser(BaseModel):
     __tablename__ = "vadmin_auth_user"
@@ -48,6 +46,16 @@ class VadminUser(BaseModel):
     def verify_password(password: str, hashed_password: str) -> bool:
         return pwd_context.verify(password, hashed_password)
 
+    # generate hash password in the worker pool
+    @staticmethod
+    async def async_get_password_hash(password: str) -> str:
+        return await PasswordHash.hash(password)
+
+    # verify login password in the worker pool
+    @staticmethod
+    async def async_verify_password(password: str, hashed_password: str) -> bool:
+        return await PasswordHash.verify(password, hashed_password)
+
     async def update_login_info(self, db: AsyncSession, last_ip: str):
         """
         更新当前登录信息
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/10 10:21
+# @File           : auth_cache.py
+# @IDE            : PyCharm
+# @desc           : 用户认证信息缓存
+
+"""
+缓存内容：用户基本信息（不包括密码）、用户角色、用户权限集合
+缓存结构：Redis 中缓存 + 进程内 LRU 缓存
+
+版本号：
+    auth_cache_version：全局版本号，角色、菜单发生变化时自增，所有用户缓存同时失效
+    auth_cache_version:{telephone}：用户版本号，用户信息发生变化时自增，只有该用户缓存失效
+
+每次认证时只需要一次 MGET 获取两个版本号，版本号一致则直接使用缓存，不再查询数据库
+"""
+
+import datetime
+import json
+from collections import OrderedDict
+from typing import List, Tuple
+from aioredis import Redis
+from fastapi import FastAPI
+from sqlalchemy import DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from application import settings
+from apps.vadmin.auth import models
+from core.database import add_commit_callback
+
+
+class AuthCache:
+
+    VERSION_KEY = "auth_cache_version"
+    DATA_KEY = "auth_cache_data"
+
+    # 进程内 LRU 缓存，telephone -> 缓存数据
+    lru: OrderedDict = OrderedDict()
+
+    def __init__(self, rd: Redis):
+        self.rd = rd
+        self.version = None
+
+    async def get(self, telephone: str) -> dict | None:
+        """
+        获取用户缓存数据，版本号不一致则返回 None
+
+        返回 None 后，从数据库中获取数据，然后调用 set 方法写入缓存
+        """
+        versions = await self.rd.mget(*self.version_keys(telephone))
+        self.set_version(versions)
+        return await self.get_data(telephone)
+
+    @classmethod
+    def version_keys(cls, telephone: str) -> List[str]:
+        """
+        全局版本号与用户版本号的键
+        """
+        return [cls.VERSION_KEY, f"{cls.VERSION_KEY}:{telephone}"]
+
+    def set_version(self, versions: list) -> None:
+        """
+        设置当前版本号，versions 为 version_keys 对应的值，可以与其他命令放在同一个 pipeline 中获取
+        """
+        self.version = f"{versions[0] or 0}.{versions[1] or 0}"
+
+    async def get_data(self, telephone: str) -> dict | None:
+        """
+        获取与当前版本号一致的缓存数据，需要先调用 set_version 设置当前版本号
+        """
+        data = self.lru.get(telephone)
+        if data and data["version"] == self.version:
+            self.lru.move_to_end(telephone)
+            return data
+        result = await self.rd.get(f"{self.DATA_KEY}:{telephone}")
+        if not result:
+            return None
+        data = json.loads(result)
+        if data["version"] != self.version:
+            return None
+        self.__lru_set(telephone, data)
+        return data
+
+    async def set(self, user: models.VadminUser, permissions: set) -> dict:
+        """
+        写入用户缓存数据
+
+        版本号使用 get 方法获取到的版本号，如果在查询数据库期间缓存被清除，那么下次获取时版本号不一致，会重新查询
+        """
+        data = {
+            "version": self.version,
+            "user": self.serialize(user, exclude=["password"]),
+            "roles": [self.serialize(role) for role in user.roles],
+            "permissions": list(permissions)
+        }
+        await self.rd.set(f"{self.DATA_KEY}:{user.telephone}", json.dumps(data), ex=settings.AUTH_CACHE_EXPIRE)
+        self.__lru_set(user.telephone, data)
+        return data
+
+    @classmethod
+    def to_user(cls, data: dict, db: AsyncSession) -> Tuple[models.VadminUser, set]:
+        """
+        将缓存数据还原为用户对象，并添加到当前数据库会话中
+
+        还原后的对象为持久化状态，与从数据库中查询出来的对象一样可以修改后 flush，并且不会产生 SQL 查询
+        """
+        user = cls.deserialize(models.VadminUser, data["user"])
+        roles = [cls.deserialize(models.VadminRole, role) for role in data["roles"]]
+        set_committed_value(user, "roles", roles)
+        db.add(user)
+        return user, set(data["permissions"])
+
+    @classmethod
+    def serialize(cls, obj, exclude: List[str] = None) -> dict:
+        """
+        序列化模型对象的所有字段
+        """
+        data = {}
+        for column in obj.__table__.columns:
+            if exclude and column.key in exclude:
+                continue
+            value = getattr(obj, column.key)
+            if isinstance(value, datetime.datetime):
+                value = value.isoformat()
+            data[column.key] = value
+        return data
+
+    @classmethod
+    def deserialize(cls, model, data: dict):
+        """
+        反序列化为模型对象，并将对象状态改为游离状态（detached），表示该对象已存在于数据库中
+        """
+        values = {}
+        for column in model.__table__.columns:
+            if column.key not in data:
+                continue
+            value = data[column.key]
+            if value and isinstance(column.type, DateTime):
+                value = datetime.datetime.fromisoformat(value)
+            values[column.key] = value
+        obj = model(**values)
+        make_transient_to_detached(obj)
+        return obj
+
+    def __lru_set(self, telephone: str, data: dict) -> None:
+        self.lru[telephone] = data
+        self.lru.move_to_end(telephone)
+        while len(self.lru) > settings.AUTH_CACHE_LRU_SIZE:
+            self.lru.popitem(last=False)
+
+    @classmethod
+    def invalidate_user(cls, db: AsyncSession, *telephones: str) -> None:
+        """
+        事务提交后清除指定用户的缓存
+        """
+        if not settings.AUTH_CACHE_ENABLE:
+            return
+
+        async def callback(app: FastAPI):
+            rd: Redis = app.state.redis
+            async with rd.pipeline(transaction=False) as pipe:
+                for telephone in set(telephones):
+                    pipe.incr(f"{cls.VERSION_KEY}:{telephone}")
+                await pipe.execute()
+
+        add_commit_callback(db, callback)
+
+    @classmethod
+    def invalidate_all(cls, db: AsyncSession) -> None:
+        """
+        事务提交后清除所有用户的缓存，角色或菜单变化时使用
+        """
+        if not settings.AUTH_CACHE_ENABLE:
+            return
+
+        async def callback(app: FastAPI):
+            await app.state.redis.incr(cls.VERSION_KEY)
+
+        add_commit_callback(db, callback)
@@ -7,9 +7,6 @@
 
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
-from apps.vadmin.auth.crud import UserDal
-from apps.vadmin.auth.models import VadminUser
 from core.exception import CustomException
 from utils import status
 from .validation import AuthValidation
@@ -38,8 +35,7 @@ class OpenAuth(AuthValidation):
         if not settings.OAUTH_ENABLE:
             return Auth(db=db)
         try:
-            telephone = self.validate_token(request, token)
-            user = await UserDal(db).get_data(telephone=telephone, v_return_none=True)
+            user, permissions = await self.get_token_identity(request, db, token)
             return await self.validate_user(request, user, db)
         except CustomException:
             return Auth(db=db)
@@ -63,8 +59,7 @@ class AllUserAuth(AuthValidation):
         """
         if not settings.OAUTH_ENABLE:
             return Auth(db=db)
-        telephone = self.validate_token(request, token)
-        user = await UserDal(db).get_data(telephone=telephone, v_return_none=True)
+        user, permissions = await self.get_token_identity(request, db, token)
         return await self.validate_user(request, user, db)
 
 
@@ -93,11 +88,11 @@ class FullAdminAuth(AuthValidation):
         """
         if not settings.OAUTH_ENABLE:
             return Auth(db=db)
-        telephone = self.validate_token(request, token)
-        options = [joinedload(VadminUser.roles), joinedload("roles.menus")]
-        user = await UserDal(db).get_data(telephone=telephone, v_return_none=True, v_options=options, is_staff=True)
+        user, permissions = await self.get_token_identity(request, db, token)
+        if user and not user.is_staff:
+            user = None
         result = await self.validate_user(request, user, db)
-        permissions = self.get_user_permissions(user)
+        result.permissions = permissions
         if permissions != {'*.*.*'} and self.permissions:
             if not (self.permissions & permissions):
                 raise CustomException(msg="无权限操作", code=status.HTTP_403_FORBIDDEN)
@@ -24,6 +24,7 @@ import jwt
 from fastapi import APIRouter, Depends, Request, Body
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.database import db_getter
+from core.dependencies import IpThrottle
 from utils import status
 from utils.response import SuccessResponse, ErrorResponse
 from application import settings
@@ -34,11 +35,18 @@ from apps.vadmin.auth.crud import MenuDal, UserDal
 from .current import FullAdminAuth
 from .validation.auth import Auth
 from utils.wx.oauth import WXOAuth
+from .auth_cache import AuthCache
+from .token_cache import TokenCache
 
 app = APIRouter()
 
 
-@app.post("/login/", summary="手机号密码登录", description="员工登录通道，限制最多输错次数，达到最大值后将is_active=False")
+@app.post(
+    "/login/",
+    summary="手机号密码登录",
+    description="员工登录通道，限制最多输错次数，达到最大值后将is_active=False",
+    dependencies=[Depends(IpThrottle("login"))]
+)
 async def login_for_access_token(
         request: Request,
         data: LoginForm,
@@ -73,7 +81,12 @@ async def login_for_access_token(
         return ErrorResponse(msg=str(e))
 
 
-@app.post("/wx/login/", summary="微信服务端一键登录", description="员工登录通道")
+@app.post(
+    "/wx/login/",
+    summary="微信服务端一键登录",
+    description="员工登录通道",
+    dependencies=[Depends(IpThrottle("login"))]
+)
 async def wx_login_for_access_token(request: Request, data: WXLoginForm, db: AsyncSession = Depends(db_getter)):
     try:
         if data.platform != "1" or data.method != "2":
@@ -94,6 +107,7 @@ async def wx_login_for_access_token(request: Request, data: WXLoginForm, db: Asy
 
     # 更新登录时间
     await user.update_login_info(db, request.client.host)
+    AuthCache.invalidate_user(db, user.telephone)
 
     # 登录成功创建 token
     access_token = LoginManage.create_token({"sub": user.telephone, "is_refresh": False})
@@ -111,12 +125,32 @@ async def wx_login_for_access_token(request: Request, data: WXLoginForm, db: Asy
 
 
 @app.get("/getMenuList/", summary="获取当前用户菜单树")
-async def get_menu_list(auth: Auth = Depends(FullAdminAuth())):
-    return SuccessResponse(await MenuDal(auth.db).get_routers(auth.user))
+async def get_menu_list(request: Request, auth: Auth = Depends(FullAdminAuth())):
+    rd = request.app.state.redis if settings.AUTH_CACHE_ENABLE else None
+    return SuccessResponse(await MenuDal(auth.db).get_routers(auth.user, rd))
+
+
+@app.post("/logout/", summary="退出登录", description="撤销当前 token 与刷新 token，所有进程立即生效")
+async def logout(
+        request: Request,
+        token: str = Depends(settings.oauth2_scheme),
+        refresh: str = Body(None, embed=True, title="刷新Token")
+):
+    if settings.AUTH_CACHE_ENABLE:
+        cache = TokenCache(request.app.state.redis)
+        for item in (token, refresh):
+            if not item:
+                continue
+            try:
+                payload = jwt.decode(item, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            except jwt.exceptions.PyJWTError:
+                continue
+            await cache.revoke(item, payload["exp"])
+    return SuccessResponse("退出成功")
 
 
 @app.post("/token/refresh/", summary="刷新Token")
-async def token_refresh(refresh: str = Body(..., title="刷新Token")):
+async def token_refresh(request: Request, refresh: str = Body(..., title="刷新Token")):
     error_code = status.HTTP_401_UNAUTHORIZED
     try:
         payload = jwt.decode(refresh, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
@@ -128,6 +162,8 @@ async def token_refresh(refresh: str = Body(..., title="刷新Token")):
         return ErrorResponse("无效认证，请您重新登录", code=error_code, status=error_code)
     except jwt.exceptions.ExpiredSignatureError:
         return ErrorResponse("登录已超时，请您重新登录", code=error_code, status=error_code)
+    if settings.AUTH_CACHE_ENABLE and await TokenCache(request.app.state.redis).is_revoked(refresh, payload["exp"]):
+        return ErrorResponse("登录已失效，请您重新登录", code=error_code, status=error_code)
 
     access_token = LoginManage.create_token({"sub": telephone, "is_refresh": False})
     expires = timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES)
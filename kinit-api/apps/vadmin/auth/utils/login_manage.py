@@ -25,7 +25,7 @@ class LoginManage:
         """
         验证用户密码
         """
-        result = models.VadminUser.verify_password(data.password, user.password)
+        result = await models.VadminUser.async_verify_password(data.password, user.password)
         if result:
             return LoginResult(status=True, msg="验证成功")
         return LoginResult(status=False, msg="手机号或密码错误")
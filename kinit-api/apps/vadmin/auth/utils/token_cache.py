@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/21 15:20
+# @File           : token_cache.py
+# @IDE            : PyCharm
+# @desc           : 已验证 token 缓存
+
+"""
+缓存内容：验证通过的 access token 解码后的信息（手机号、过期时间），保存到 token 过期为止
+缓存结构：进程内 LRU 缓存，键为 token 的 SHA-256 摘要，不保存 token 原文
+
+撤销列表：
+    token_revoked:{过期日期}：已撤销的 token 摘要集合，按照 token 的过期日期分组，过期日期之后自动删除
+
+每次认证时通过一次 pipeline 检查 token 是否已被撤销（SISMEMBER），同时获取用户认证缓存（AuthCache）的版本号，
+用户信息使用 AuthCache 的进程内缓存，用户被冻结或修改后版本号自增，立即生效
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from aioredis import Redis
+from application import settings
+from .auth_cache import AuthCache
+
+
+class TokenCache:
+
+    REVOKED_KEY = "token_revoked"
+
+    # 进程内 LRU 缓存，token 摘要 -> {"telephone": 手机号, "exp": 过期时间戳}
+    lru: OrderedDict = OrderedDict()
+
+    def __init__(self, rd: Redis):
+        self.rd = rd
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @classmethod
+    def revoked_key(cls, exp: int) -> str:
+        return f"{cls.REVOKED_KEY}:{exp // 86400}"
+
+    @classmethod
+    def get(cls, digest: str) -> dict | None:
+        """
+        获取 token 解码后的信息，已过期则删除并返回 None
+        """
+        entry = cls.lru.get(digest)
+        if entry is None:
+            return None
+        if entry["exp"] <= time.time():
+            cls.lru.pop(digest, None)
+            return None
+        cls.lru.move_to_end(digest)
+        return entry
+
+    @classmethod
+    def set(cls, digest: str, payload: dict) -> dict:
+        """
+        写入验证通过的 token 解码后的信息
+        """
+        entry = {"telephone": payload["sub"], "exp": payload["exp"]}
+        cls.lru[digest] = entry
+        cls.lru.move_to_end(digest)
+        while len(cls.lru) > settings.TOKEN_CACHE_LRU_SIZE:
+            cls.lru.popitem(last=False)
+        return entry
+
+    async def check(self, digest: str, entry: dict, auth_cache: AuthCache) -> bool:
+        """
+        检查 token 是否已被撤销，并在同一个 pipeline 中获取用户认证缓存的版本号
+
+        :return: 是否已被撤销
+        """
+        async with self.rd.pipeline(transaction=False) as pipe:
+            pipe.sismember(self.revoked_key(entry["exp"]), digest)
+            pipe.mget(*auth_cache.version_keys(entry["telephone"]))
+            revoked, versions = await pipe.execute()
+        auth_cache.set_version(versions)
+        return bool(revoked)
+
+    async def is_revoked(self, token: str, exp: int) -> bool:
+        return bool(await self.rd.sismember(self.revoked_key(exp), self.digest(token)))
+
+    async def revoke(self, token: str, exp: int) -> None:
+        """
+        撤销 token，所有进程在下一次认证时生效
+        """
+        digest = self.digest(token)
+        key = self.revoked_key(exp)
+        async with self.rd.pipeline(transaction=True) as pipe:
+            pipe.sadd(key, digest)
+            # 分组内的 token 都已过期后删除撤销列表
+            pipe.expireat(key, (exp // 86400 + 1) * 86400 + 60)
+            await pipe.execute()
+        self.lru.pop(digest, None)
@@ -5,12 +5,18 @@
 # @IDE            : PyCharm
 # @desc           : 用户凭证验证装饰器
 
+from typing import Set, Tuple
 from fastapi import Request
 import jwt
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 from application import settings
 from sqlalchemy.ext.asyncio import AsyncSession
-from apps.vadmin.auth.models import VadminUser
+from apps.vadmin.auth.models import VadminUser, VadminMenu, VadminRole
+from apps.vadmin.auth.crud import UserDal
+from apps.vadmin.auth.utils.auth_cache import AuthCache
+from apps.vadmin.auth.utils.token_cache import TokenCache
 from core.exception import CustomException
 from utils import status
 from datetime import timedelta, datetime
@@ -19,6 +25,7 @@ from datetime import timedelta, datetime
 class Auth(BaseModel):
     user: VadminUser = None
     db: AsyncSession
+    permissions: Set[str] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -37,29 +44,128 @@ class AuthValidation:
         """
         验证用户 token
         """
+        payload = cls.decode_token(token)
+        cls.set_refresh_flag(request, payload["exp"])
+        return payload["sub"]
+
+    @classmethod
+    def decode_token(cls, token: str | None) -> dict:
+        """
+        解码并验证 access token
+        """
         if not token:
             raise CustomException(msg="请您先登录！", code=status.HTTP_ERROR)
         try:
             payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
             telephone: str = payload.get("sub")
-            exp: int = payload.get("exp")
             is_refresh: bool = payload.get("is_refresh")
             if telephone is None or is_refresh:
                 raise CustomException(msg="未认证，请您重新登录", code=cls.error_code)
-            # 计算当前时间 + 缓冲时间是否大于等于 JWT 过期时间
-            buffer_time = (datetime.now() + timedelta(minutes=settings.ACCESS_TOKEN_CACHE_MINUTES)).timestamp()
-            # print("过期时间", exp, datetime.fromtimestamp(exp))
-            # print("当前时间", buffer_time, datetime.fromtimestamp(buffer_time))
-            # print("剩余时间", exp - buffer_time)
-            if buffer_time >= exp:
-                request.scope["if-refresh"] = 1
-            else:
-                request.scope["if-refresh"] = 0
         except jwt.exceptions.InvalidSignatureError:
             raise CustomException(msg="无效认证，请您重新登录", code=cls.error_code)
         except jwt.exceptions.ExpiredSignatureError:
             raise CustomException(msg="认证已过期，请您重新登录", code=cls.error_code)
-        return telephone
+        return payload
+
+    @classmethod
+    def set_refresh_flag(cls, request: Request, exp: int) -> None:
+        """
+        计算当前时间 + 缓冲时间是否大于等于 JWT 过期时间，通知前端刷新 token
+        """
+        buffer_time = (datetime.now() + timedelta(minutes=settings.ACCESS_TOKEN_CACHE_MINUTES)).timestamp()
+        if buffer_time >= exp:
+            request.scope["if-refresh"] = 1
+        else:
+            request.scope["if-refresh"] = 0
+
+    @classmethod
+    async def get_token_identity(
+            cls,
+            request: Request,
+            db: AsyncSession,
+            token: str | None
+    ) -> Tuple[VadminUser | None, Set[str]]:
+        """
+        验证用户 token，并获取用户信息与权限集合
+
+        开启认证信息缓存后同时使用 token 缓存，同一个 token 只解码一次，之后每次认证只需要一次 pipeline 检查 token 是否已被撤销，
+        并获取用户认证缓存的版本号，版本号一致时直接使用缓存，不会查询数据库
+        """
+        if not settings.AUTH_CACHE_ENABLE:
+            telephone = cls.validate_token(request, token)
+            return await cls.get_user_identity(request, db, telephone)
+        if not token:
+            raise CustomException(msg="请您先登录！", code=status.HTTP_ERROR)
+        digest = TokenCache.digest(token)
+        entry = TokenCache.get(digest)
+        if entry is None:
+            entry = TokenCache.set(digest, cls.decode_token(token))
+        cls.set_refresh_flag(request, entry["exp"])
+        rd = request.app.state.redis
+        cache = AuthCache(rd)
+        if await TokenCache(rd).check(digest, entry, cache):
+            raise CustomException(msg="认证已失效，请您重新登录", code=cls.error_code)
+        data = await cache.get_data(entry["telephone"])
+        if data:
+            return AuthCache.to_user(data, db)
+        return await cls.load_user_identity(db, entry["telephone"], cache)
+
+    @classmethod
+    async def get_user_identity(
+            cls,
+            request: Request,
+            db: AsyncSession,
+            telephone: str
+    ) -> Tuple[VadminUser | None, Set[str]]:
+        """
+        获取用户信息与权限集合
+
+        开启认证信息缓存后，优先从缓存中获取，缓存命中时不会查询数据库
+        """
+        cache = None
+        if settings.AUTH_CACHE_ENABLE:
+            cache = AuthCache(request.app.state.redis)
+            data = await cache.get(telephone)
+            if data:
+                return AuthCache.to_user(data, db)
+        return await cls.load_user_identity(db, telephone, cache)
+
+    @classmethod
+    async def load_user_identity(
+            cls,
+            db: AsyncSession,
+            telephone: str,
+            cache: AuthCache = None
+    ) -> Tuple[VadminUser | None, Set[str]]:
+        """
+        从数据库中获取用户信息与权限集合，传入 cache 时写入用户认证缓存
+        """
+        options = [joinedload(VadminUser.roles)]
+        user = await UserDal(db).get_data(telephone=telephone, v_return_none=True, v_options=options)
+        if not user:
+            return None, set()
+        permissions = await cls.get_role_permissions(db, user.roles)
+        if cache:
+            await cache.set(user, permissions)
+        return user, permissions
+
+    @classmethod
+    async def get_role_permissions(cls, db: AsyncSession, roles: list) -> Set[str]:
+        """
+        获取角色列表的所有权限，只查询权限标识，不加载完整的菜单对象
+        """
+        if any([role.is_admin for role in roles]):
+            return {'*.*.*'}
+        if not roles:
+            return set()
+        sql = select(VadminMenu.perms).distinct().join(VadminMenu.roles).where(
+            VadminRole.id.in_([role.id for role in roles]),
+            VadminMenu.perms.isnot(None),
+            VadminMenu.perms != "",
+            VadminMenu.disabled == False
+        )
+        queryset = await db.execute(sql)
+        return set(queryset.scalars().all())
 
     @classmethod
     async def validate_user(cls, request: Request, user: VadminUser, db: AsyncSession) -> Auth:
@@ -78,17 +184,3 @@ class AuthValidation:
         except RuntimeError:
             request.scope["body"] = "获取失败"
         return Auth(user=user, db=db)
-
-    @classmethod
-    def get_user_permissions(cls, user: VadminUser) -> set:
-        """
-        获取员工用户所有权限列表
-        """
-        if any([role.is_admin for role in user.roles]):
-            return {'*.*.*'}
-        permissions = set()
-        for role_obj in user.roles:
-            for menu in role_obj.menus:
-                if menu.perms and not menu.disabled:
-                    permissions.add(menu.perms)
-        return permissions
@@ -9,11 +9,12 @@
 from fastapi import Request
 from pydantic import BaseModel, validator
 from sqlalchemy.ext.asyncio import AsyncSession
-from application.settings import DEFAULT_AUTH_ERROR_MAX_NUMBER, DEMO
+from application.settings import DEFAULT_AUTH_ERROR_MAX_NUMBER, DEFAULT_AUTH_ERROR_WINDOW, DEMO
 from apps.vadmin.auth import crud, schemas
 from core.validator import vali_telephone
 from typing import Optional
-from utils.count import Count
+from utils.count import RateLimiter
+from apps.vadmin.auth.utils.auth_cache import AuthCache
 
 
 class LoginForm(BaseModel):
@@ -63,27 +64,35 @@ class LoginValidation:
 
         result = await self.func(self, data=data, user=user, request=request)
 
-        count_key = f"{data.telephone}_password_auth" if data.method == '0' else f"{data.telephone}_sms_auth"
-        count = Count(request.app.state.redis, count_key)
+        count_key = f"{data.telephone}_password_errors" if data.method == '0' else f"{data.telephone}_sms_errors"
+        # 统计窗口内的错误次数，并发提交时每次错误都会被记录
+        count = RateLimiter(
+            request.app.state.redis,
+            count_key,
+            DEFAULT_AUTH_ERROR_MAX_NUMBER,
+            DEFAULT_AUTH_ERROR_WINDOW
+        )
 
         if not result.status:
             self.result.msg = result.msg
             if not DEMO:
-                number = await count.add(ex=86400)
+                number = await count.hit()
                 if number >= DEFAULT_AUTH_ERROR_MAX_NUMBER:
                     await count.reset()
                     # 如果等于最大次数，那么就将用户 is_active=False
                     user.is_active = False
                     await db.flush()
+                    AuthCache.invalidate_user(db, user.telephone)
         elif not user.is_active:
             self.result.msg = "此手机号已被冻结！"
         elif data.platform in ["0", "1"] and not user.is_staff:
             self.result.msg = "此手机号无权限！"
         else:
             if not DEMO:
-                await count.delete()
+                await count.reset()
             self.result.msg = "OK"
             self.result.status = True
             self.result.user = schemas.UserSimpleOut.from_orm(user)
             await user.update_login_info(db, request.client.host)
+            AuthCache.invalidate_user(db, user.telephone)
         return self.result
@@ -6,7 +6,10 @@
 # @IDE            : PyCharm
 # @desc           : 简要说明
 
+from urllib.parse import quote
 from fastapi import APIRouter, Depends, Body, UploadFile, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import joinedload
 from utils.response import SuccessResponse, ErrorResponse
 from . import schemas, crud, models
@@ -14,6 +17,10 @@ from core.dependencies import IdList
 from apps.vadmin.auth.utils.current import AllUserAuth, FullAdminAuth
 from apps.vadmin.auth.utils.validation.auth import Auth
 from .params import UserParams, RoleParams
+from core.job import job_manage
+from utils.excel.import_manage import ImportManage
+from utils.file.file_manage import FileManage
+from . import jobs  # noqa: F401 注册后台任务
 
 app = APIRouter()
 
@@ -29,9 +36,9 @@ async def get_users(
     model = models.VadminUser
     options = [joinedload(model.roles)]
     schema = schemas.UserOut
-    datas = await crud.UserDal(auth.db).get_datas(**params.dict(), v_options=options, v_schema=schema)
-    count = await crud.UserDal(auth.db).get_count(**params.to_count())
-    return SuccessResponse(datas, count=count)
+    dal = crud.UserDal(auth.db)
+    datas, count, next_cursor = await dal.get_page(**params.dict(), v_options=options, v_schema=schema)
+    return SuccessResponse(datas, count=count, next_cursor=next_cursor)
 
 
 @app.post("/users/", summary="创建用户")
@@ -87,17 +94,34 @@ async def post_user_current_update_avatar(file: UploadFile, auth: Auth = Depends
 @app.get("/user/admin/current/info/", summary="获取当前管理员信息")
 async def get_user_admin_current_info(auth: Auth = Depends(FullAdminAuth())):
     result = schemas.UserOut.from_orm(auth.user).dict()
-    result["permissions"] = list(FullAdminAuth.get_user_permissions(auth.user))
+    result["permissions"] = list(auth.permissions)
     return SuccessResponse(result)
 
 
-@app.post("/user/export/query/list/to/excel/", summary="导出用户查询列表为excel")
+@app.post("/user/export/query/list/to/excel/", summary="导出用户查询列表为excel", description="后台任务执行，返回任务编号")
 async def post_user_export_query_list(
         header: list = Body(..., title="表头与对应字段"),
         params: UserParams = Depends(),
         auth: Auth = Depends(FullAdminAuth(permissions=["auth.user.export"]))
 ):
-    return SuccessResponse(await crud.UserDal(auth.db).export_query_list(header, params))
+    job_id = await job_manage.submit("export_users", auth.user.id, header=header, params=params.dict())
+    return SuccessResponse({"job_id": job_id})
+
+
+@app.post("/user/export/query/list/to/excel/stream/", summary="流式导出用户查询列表为excel，直接返回文件")
+async def post_user_export_query_list_stream(
+        header: list = Body(..., title="表头与对应字段"),
+        params: UserParams = Depends(),
+        auth: Auth = Depends(FullAdminAuth(permissions=["auth.user.export"]))
+):
+    xlsx = await crud.UserDal(auth.db).export_query_list_stream(header, params.dict())
+    headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{quote('用户列表.xlsx')}"}
+    return StreamingResponse(
+        xlsx.iter_bytes(),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers=headers,
+        background=BackgroundTask(xlsx.remove)
+    )
 
 
 @app.get("/user/download/import/template/", summary="下载最新批量导入用户模板")
@@ -105,27 +129,35 @@ async def get_user_download_new_import_template(auth: Auth = Depends(AllUserAuth
     return SuccessResponse(await crud.UserDal(auth.db).download_import_template())
 
 
-@app.post("/import/users/", summary="批量导入用户")
+@app.post("/import/users/", summary="批量导入用户", description="后台任务执行，返回任务编号")
 async def post_import_users(file: UploadFile, auth: Auth = Depends(FullAdminAuth(permissions=["auth.user.import"]))):
-    return SuccessResponse(await crud.UserDal(auth.db).import_users(file))
-
-
-@app.post("/users/init/password/send/sms/", summary="初始化所选用户密码并发送通知短信")
+    ImportManage.check_file_type(file)
+    filename = await FileManage.save_tmp_file(file)
+    try:
+        job_id = await job_manage.submit("import_users", auth.user.id, filename=filename)
+    except Exception:
+        # 任务提交失败时任务不会执行，由接口删除临时文件
+        await FileManage.remove(filename)
+        raise
+    return SuccessResponse({"job_id": job_id})
+
+
+@app.post("/users/init/password/send/sms/", summary="初始化所选用户密码并发送通知短信", description="后台任务执行，返回任务编号")
 async def post_users_init_password(
-        request: Request,
         ids: IdList = Depends(),
         auth: Auth = Depends(FullAdminAuth(permissions=["auth.user.reset"]))
 ):
-    return SuccessResponse(await crud.UserDal(auth.db).init_password_send_sms(ids.ids, request.app.state.redis))
+    job_id = await job_manage.submit("init_password_send_sms", auth.user.id, ids=ids.ids)
+    return SuccessResponse({"job_id": job_id})
 
 
-@app.post("/users/init/password/send/email/", summary="初始化所选用户密码并发送通知邮件")
+@app.post("/users/init/password/send/email/", summary="初始化所选用户密码并发送通知邮件", description="后台任务执行，返回任务编号")
 async def post_users_init_password_send_email(
-        request: Request,
         ids: IdList = Depends(),
         auth: Auth = Depends(FullAdminAuth(permissions=["auth.user.reset"]))
 ):
-    return SuccessResponse(await crud.UserDal(auth.db).init_password_send_email(ids.ids, request.app.state.redis))
+    job_id = await job_manage.submit("init_password_send_email", auth.user.id, ids=ids.ids)
+    return SuccessResponse({"job_id": job_id})
 
 
 @app.put("/users/wx/server/openid/", summary="更新当前用户服务端微信平台openid")
@@ -142,9 +174,8 @@ async def get_roles(
         params: RoleParams = Depends(),
         auth: Auth = Depends(FullAdminAuth(permissions=["auth.role.list"]))
 ):
-    datas = await crud.RoleDal(auth.db).get_datas(**params.dict())
-    count = await crud.RoleDal(auth.db).get_count(**params.to_count())
-    return SuccessResponse(datas, count=count)
+    datas, count, next_cursor = await crud.RoleDal(auth.db).get_page(**params.dict())
+    return SuccessResponse(datas, count=count, next_cursor=next_cursor)
 
 
 @app.post("/roles/", summary="创建角色信息")
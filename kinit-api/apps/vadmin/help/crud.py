@@ -7,6 +7,7 @@
 # @desc           : 帮助中心 - 增删改查
 from typing import List
 
+from sqlalchemy import update, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.crud import DalBase
 from . import models, schemas
@@ -20,10 +21,12 @@ class IssueDal(DalBase):
     async def add_view_number(self, data_id: int):
         """
         更新常见问题查看次数+1
+
+        直接在数据库中自增，避免查询结果来自从库时覆盖掉其他请求的计数
         """
-        obj = await self.get_data(data_id)
-        obj.view_number = obj.view_number + 1 if obj.view_number else 1
-        await self.flush(obj)
+        await self.get_data(data_id)
+        view_number = func.coalesce(self.model.view_number, 0) + 1
+        await self.db.execute(update(self.model).where(self.model.id == data_id).values(view_number=view_number))
         return True
 
 
@@ -27,9 +27,9 @@ async def get_issue_categorys(p: params.IssueCategoryParams = Depends(), auth: A
     model = models.VadminIssueCategory
     options = [joinedload(model.user)]
     schema = schemas.IssueCategoryListOut
-    datas = await crud.IssueCategoryDal(auth.db).get_datas(**p.dict(), v_options=options, v_schema=schema)
-    count = await crud.IssueCategoryDal(auth.db).get_count(**p.to_count())
-    return SuccessResponse(datas, count=count)
+    dal = crud.IssueCategoryDal(auth.db)
+    datas, count, next_cursor = await dal.get_page(**p.dict(), v_options=options, v_schema=schema)
+    return SuccessResponse(datas, count=count, next_cursor=next_cursor)
 
 
 @app.get("/issue/categorys/options/", summary="获取类别选择项")
@@ -79,9 +79,8 @@ async def get_issues(p: params.IssueParams = Depends(), auth: Auth = Depends(All
     model = models.VadminIssue
     options = [joinedload(model.user), joinedload(model.category)]
     schema = schemas.IssueListOut
-    datas = await crud.IssueDal(auth.db).get_datas(**p.dict(), v_options=options, v_schema=schema)
-    count = await crud.IssueDal(auth.db).get_count(**p.to_count())
-    return SuccessResponse(datas, count=count)
+    datas, count, next_cursor = await crud.IssueDal(auth.db).get_page(**p.dict(), v_options=options, v_schema=schema)
+    return SuccessResponse(datas, count=count, next_cursor=next_cursor)
 
 
 @app.post("/issues/", summary="创建问题")
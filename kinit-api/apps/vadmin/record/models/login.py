@@ -5,15 +5,18 @@
 # @File           : login.py
 # @IDE            : PyCharm
 # @desc           : 登录记录模型
+import asyncio
 import json
 
-from application.settings import LOGIN_LOG_RECORD
+from application.settings import LOGIN_LOG_RECORD, REDIS_DB_ENABLE, IP_PARSE_ENABLE
 from apps.vadmin.auth.utils.validation import LoginForm, WXLoginForm
+from core.database import add_commit_callback, engine_manage
+from core.logger import logger
 from utils.ip_manage import IPManage
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.db_base import BaseModel
-from sqlalchemy import Column, String, Boolean, TEXT
-from fastapi import Request
+from sqlalchemy import Column, String, Boolean, TEXT, update
+from fastapi import Request, FastAPI
 from user_agents import parse
 
 
@@ -39,6 +42,9 @@ class VadminLoginRecord(BaseModel):
     response = Column(TEXT, comment="响应信息")
     request = Column(TEXT, comment="请求信息")
 
+    # 正在执行的归属地回填任务，保持引用避免任务被垃圾回收
+    location_tasks = set()
+
     @classmethod
     async def create_login_record(
             cls,
@@ -50,6 +56,9 @@ class VadminLoginRecord(BaseModel):
     ):
         """
         创建登录记录
+
+        IP归属地优先从缓存与离线IP数据中获取，没有数据并且开启了IP地址数据解析（IP_PARSE_ENABLE）时，
+        在事务提交后请求第三方接口，再回填到登录记录中，不阻塞登录
         :return:
         """
         if not LOGIN_LOG_RECORD:
@@ -61,11 +70,12 @@ class VadminLoginRecord(BaseModel):
         user_agent = parse(req.headers.get("user-agent"))
         system = f"{user_agent.os.family} {user_agent.os.version_string}"
         browser = f"{user_agent.browser.family} {user_agent.browser.version_string}"
-        ip = IPManage(req.client.host)
-        location = await ip.parse()
+        rd = getattr(req.app.state, "redis", None) if REDIS_DB_ENABLE else None
+        ip = IPManage(req.client.host, rd)
+        location = await ip.parse_local()
         params = json.dumps({"body": body, "headers": header})
         obj = VadminLoginRecord(
-            **location.dict(),
+            **(location.dict() if location else {"ip": ip.ip}),
             telephone=data.telephone if data.telephone else data.code,
             status=status,
             browser=browser,
@@ -77,3 +87,28 @@ class VadminLoginRecord(BaseModel):
         )
         db.add(obj)
         await db.flush()
+        if location is None and IP_PARSE_ENABLE:
+            record_id = obj.id
+
+            async def callback(app: FastAPI):
+                task = asyncio.create_task(cls.fill_location(record_id, ip))
+                cls.location_tasks.add(task)
+                task.add_done_callback(cls.location_tasks.discard)
+
+            add_commit_callback(db, callback)
+
+    @classmethod
+    async def fill_location(cls, record_id: int, ip: IPManage):
+        """
+        请求第三方接口获取IP归属地，并回填到登录记录中
+        """
+        try:
+            location = await ip.parse_remote()
+            if not location.address:
+                return
+            async with engine_manage.get_session_factory()() as session:
+                async with session.begin():
+                    values = location.dict(exclude={"ip"})
+                    await session.execute(update(cls).where(cls.id == record_id).values(**values))
+        except Exception as e:
+            logger.error(f"回填登录记录IP归属地失败：{e}")
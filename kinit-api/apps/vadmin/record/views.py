@@ -8,9 +8,10 @@
 from fastapi import APIRouter, Depends
 from utils.response import SuccessResponse
 from . import crud, schemas
-from apps.vadmin.auth.utils.current import AllUserAuth
+from apps.vadmin.auth.utils.current import AllUserAuth, FullAdminAuth
 from apps.vadmin.auth.utils.validation.auth import Auth
 from core.mongo import get_database, DatabaseManage
+from core.middleware import operation_record_writer
 from .params import LoginParams, OperationParams, SMSParams
 
 app = APIRouter()
@@ -21,9 +22,12 @@ app = APIRouter()
 ###########################################################
 @app.get("/logins/", summary="获取登录日志列表")
 async def get_record_login(p: LoginParams = Depends(), auth: Auth = Depends(AllUserAuth())):
-    datas = await crud.LoginRecordDal(auth.db).get_datas(**p.dict())
-    count = await crud.LoginRecordDal(auth.db).get_count(**p.to_count())
-    return SuccessResponse(datas, count=count)
+    dal = crud.LoginRecordDal(auth.db)
+    if p.v_after is not None:
+        datas = await dal.get_datas(**p.dict())
+        return SuccessResponse(datas, next_cursor=dal.next_cursor)
+    datas, count, next_cursor = await dal.get_page(**p.dict(), v_approximate=True)
+    return SuccessResponse(datas, count=count, next_cursor=next_cursor)
 
 
 @app.get("/operations/", summary="获取操作日志列表")
@@ -33,15 +37,23 @@ async def get_record_operation(
         auth: Auth = Depends(AllUserAuth())
 ):
     count = await db.get_count("operation_record", **p.to_count())
-    datas = await db.get_datas("operation_record", v_schema=schemas.OpertionRecordSimpleOut, **p.dict())
+    datas = await db.get_datas("operation_record", v_schema=schemas.OpertionRecordSimpleOut, **p.dict(["v_after"]))
     return SuccessResponse(datas, count=count)
 
 
+@app.get("/operations/writer/status/", summary="获取操作日志批量写入状态")
+async def get_operation_writer_status(auth: Auth = Depends(FullAdminAuth())):
+    return SuccessResponse(operation_record_writer.get_status())
+
+
 @app.get("/sms/send/list/", summary="获取短信发送列表")
 async def get_sms_send_list(p: SMSParams = Depends(), auth: Auth = Depends(AllUserAuth())):
-    datas = await crud.SMSSendRecordDal(auth.db).get_datas(**p.dict())
-    count = await crud.SMSSendRecordDal(auth.db).get_count(**p.to_count())
-    return SuccessResponse(datas, count=count)
+    dal = crud.SMSSendRecordDal(auth.db)
+    if p.v_after is not None:
+        datas = await dal.get_datas(**p.dict())
+        return SuccessResponse(datas, next_cursor=dal.next_cursor)
+    datas, count, next_cursor = await dal.get_page(**p.dict(), v_approximate=True)
+    return SuccessResponse(datas, count=count, next_cursor=next_cursor)
 
 
 ###########################################################
@@ -11,15 +11,24 @@
 # sqlalchemy 关联查询详细：https://blog.csdn.net/u012324798/article/details/103940527
 import json
 import os
-from typing import List, Union
+import uuid
+from typing import Any, List, Tuple, Union
 
 from aioredis import Redis
-from sqlalchemy import select, update
+from fastapi import FastAPI, UploadFile
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
-from application.settings import STATIC_ROOT
+from application import settings
+from application.settings import STATIC_ROOT, TEMP_DIR
+from core.database import add_commit_callback, engine_manage
+from utils.file.file_base import FileBase
 from utils.file.file_manage import FileManage
+from utils.file.storage import StorageBackend
 from . import models, schemas
+from .utils.config_cache import ConfigCache
+from .utils.dict_cache import DictCache
 from core.crud import DalBase
 
 
@@ -28,11 +37,37 @@ class DictTypeDal(DalBase):
     def __init__(self, db: AsyncSession):
         super(DictTypeDal, self).__init__(db, models.VadminDictType, schemas.DictTypeSimpleOut)
 
-    async def get_dicts_details(self, dict_types: List[str]) -> dict:
+    async def get_dicts_details(self, dict_types: List[str], rd: Redis = None) -> dict:
         """
         获取多个字典类型下的字典元素列表
         """
-        data = {}
+        data, _ = await self.get_dicts_details_etag(dict_types, rd)
+        return data
+
+    async def get_dicts_details_etag(self, dict_types: List[str], rd: Redis = None) -> Tuple[dict, str]:
+        """
+        获取多个字典类型下的字典元素列表，以及内容对应的 ETag
+
+        传入 rd 并且开启了数据字典缓存时，优先使用缓存，只查询缓存中没有的字典类型
+        """
+        dict_types = list(dict.fromkeys(dict_types or []))
+        if rd and settings.DICT_CACHE_ENABLE and dict_types:
+            cache = DictCache(rd)
+            entries = await cache.get(dict_types)
+            missing = [i for i in dict_types if i not in entries]
+            if missing:
+                entries.update(await cache.set(await self.query_dicts_details(missing)))
+        else:
+            entries = DictCache.entries(await self.query_dicts_details(dict_types))
+        return DictCache.merge(dict_types, entries)
+
+    async def query_dicts_details(self, dict_types: List[str]) -> dict:
+        """
+        从数据库中查询多个字典类型下的字典元素列表，字典类型不存在时为 None
+        """
+        data = {i: None for i in dict_types}
+        if not dict_types:
+            return data
         options = [joinedload(self.model.details)]
         objs = await DictTypeDal(self.db).get_datas(
             limit=0,
@@ -41,13 +76,40 @@ class DictTypeDal(DalBase):
             dict_type=("in", dict_types)
         )
         for obj in objs:
-            if not obj:
-                data[obj.dict_type] = []
-                continue
-            else:
-                data[obj.dict_type] = [schemas.DictDetailsSimpleOut.from_orm(i).dict() for i in obj.details]
+            data[obj.dict_type] = [schemas.DictDetailsSimpleOut.from_orm(i).dict() for i in obj.details]
         return data
 
+    async def create_data(self, data: schemas.DictType, v_options: list = None, v_return_obj: bool = False, v_schema: Any = None):
+        """
+        创建字典类型，已缓存的同名字典类型（不存在）失效
+        """
+        DictCache.invalidate(self.db, data.dict_type)
+        return await super().create_data(data, v_options, v_return_obj, v_schema)
+
+    async def put_data(
+            self,
+            data_id: int,
+            data: schemas.DictType,
+            v_options: list = None,
+            v_return_obj: bool = False,
+            v_schema: Any = None
+    ):
+        """
+        更新字典类型，修改前后的字典类型缓存都失效
+        """
+        obj = await self.get_data(data_id)
+        DictCache.invalidate(self.db, obj.dict_type, data.dict_type)
+        return await super().put_data(data_id, data, v_options, v_return_obj, v_schema)
+
+    async def delete_datas(self, ids: List[int], v_soft: bool = False, **kwargs):
+        """
+        删除多个字典类型
+        """
+        if settings.DICT_CACHE_ENABLE:
+            queryset = await self.db.scalars(select(self.model.dict_type).where(self.model.id.in_(ids)))
+            DictCache.invalidate(self.db, *queryset.all())
+        await super().delete_datas(ids, v_soft, **kwargs)
+
     async def get_select_datas(self):
         """获取选择数据，全部数据"""
         sql = select(self.model)
@@ -60,6 +122,52 @@ class DictDetailsDal(DalBase):
     def __init__(self, db: AsyncSession):
         super(DictDetailsDal, self).__init__(db, models.VadminDictDetails, schemas.DictDetailsSimpleOut)
 
+    async def invalidate_cache(self, dict_type_ids: List[int] = None, ids: List[int] = None) -> None:
+        """
+        字典元素发生变化后，所属字典类型的缓存失效
+
+        :param dict_type_ids: 字典类型编号列表
+        :param ids: 字典元素编号列表
+        """
+        if not settings.DICT_CACHE_ENABLE:
+            return
+        sql = select(models.VadminDictType.dict_type)
+        if ids:
+            sql = sql.join(self.model, self.model.dict_type_id == models.VadminDictType.id).where(self.model.id.in_(ids))
+        else:
+            sql = sql.where(models.VadminDictType.id.in_(dict_type_ids or []))
+        queryset = await self.db.scalars(sql)
+        DictCache.invalidate(self.db, *queryset.all())
+
+    async def create_data(self, data: schemas.DictDetails, v_options: list = None, v_return_obj: bool = False, v_schema: Any = None):
+        """
+        创建字典元素
+        """
+        await self.invalidate_cache(dict_type_ids=[data.dict_type_id])
+        return await super().create_data(data, v_options, v_return_obj, v_schema)
+
+    async def put_data(
+            self,
+            data_id: int,
+            data: schemas.DictDetails,
+            v_options: list = None,
+            v_return_obj: bool = False,
+            v_schema: Any = None
+    ):
+        """
+        更新字典元素，修改前后所属的字典类型缓存都失效
+        """
+        obj = await self.get_data(data_id)
+        await self.invalidate_cache(dict_type_ids=[obj.dict_type_id, data.dict_type_id])
+        return await super().put_data(data_id, data, v_options, v_return_obj, v_schema)
+
+    async def delete_datas(self, ids: List[int], v_soft: bool = False, **kwargs):
+        """
+        删除多个字典元素
+        """
+        await self.invalidate_cache(ids=ids)
+        await super().delete_datas(ids, v_soft, **kwargs)
+
 
 class SettingsDal(DalBase):
 
@@ -103,11 +211,34 @@ class SettingsDal(DalBase):
                 await self.db.execute(sql)
         if "wx_server_app_id" in datas:
             await rd.client().set("wx_server", json.dumps(datas))
+        ConfigCache.invalidate(self.db)
 
-    async def get_base_config(self):
+    async def get_base_config(self, rd: Redis = None) -> dict:
         """
         获取系统基本信息
         """
+        config, _ = await self.get_base_config_etag(rd)
+        return config
+
+    async def get_base_config_etag(self, rd: Redis = None) -> Tuple[dict, str]:
+        """
+        获取系统基本信息，以及内容对应的 ETag
+
+        传入 rd 并且开启了系统基础配置缓存时，优先使用进程内快照与 Redis 中的缓存
+        """
+        if rd and settings.CONFIG_CACHE_ENABLE:
+            cache = ConfigCache(rd)
+            data = await cache.get()
+            if data is None:
+                data = await cache.set(await self.query_base_config())
+        else:
+            data = ConfigCache.entry(await self.query_base_config())
+        return data["config"], data["etag"]
+
+    async def query_base_config(self) -> dict:
+        """
+        从数据库中查询系统基本信息
+        """
         ignore_configs = ["wx_server_app_id", "wx_server_app_secret"]
         datas = await self.get_datas(limit=0, tab_id=("in", ["1", "9"]), disabled=False, v_return_objs=True)
         result = {}
@@ -167,3 +298,121 @@ class SettingsTabDal(DalBase):
                     tabs[item.config_key] = item.config_value
             result[tab.tab_name] = tabs
         return result
+
+
+class MediaDal(DalBase):
+    """
+    按照文件内容去重的媒体文件存储
+
+    同一个存储位置中相同内容（SHA-256）的文件只保存一份，保存路径为 media/{哈希前两位}/{哈希}{后缀}
+    重复上传时引用次数加一，直接返回已保存的链接，不再重新上传
+    释放文件时引用次数减一，减到 0 时删除记录，并在事务提交后删除文件
+
+    并发：
+        保存时先写入记录再上传文件，记录在事务提交前一直被锁定，相同内容的其他请求会等待该事务结束
+        删除文件前在新的事务中锁定 (storage, sha256)，确认没有记录后才删除，避免删除其他请求刚刚重新上传的文件
+    """
+
+    def __init__(self, db: AsyncSession):
+        super(MediaDal, self).__init__(db, models.VadminSystemMedia, schemas.MediaSimpleOut)
+
+    async def save(
+            self,
+            file: UploadFile,
+            storage: StorageBackend,
+            max_size: int = None,
+            mime_types: list = None
+    ) -> models.VadminSystemMedia | None:
+        """
+        保存上传文件，先分块写入临时文件并计算 SHA-256，再根据哈希判断是否需要上传
+
+        :param file: 上传文件
+        :param storage: 存储后端
+        :param max_size: 文件最大值，单位 MB
+        :param mime_types: 允许的文件类型
+        :return: 文件记录，上传失败返回 None
+        """
+        tmp_path = os.path.join(TEMP_DIR, "media", uuid.uuid4().hex)
+        info = await FileBase.stream_save(file, tmp_path, max_size, mime_types)
+        try:
+            media = await self.__reference(storage, info["sha256"])
+            if media:
+                return media
+            path = f"media/{info['sha256'][:2]}/{info['sha256']}{os.path.splitext(file.filename)[-1].lower()}"
+            media = self.model(
+                sha256=info["sha256"],
+                storage=storage.name,
+                path=path,
+                url=storage.get_url(path),
+                size=info["size"],
+                content_type=info["content_type"],
+                ref_count=1
+            )
+            try:
+                async with self.db.begin_nested():
+                    self.db.add(media)
+            except IntegrityError:
+                # 相同内容的文件被同时上传，另一个请求已经写入记录并上传文件
+                return await self.__reference(storage, info["sha256"])
+            if not await storage.put_file(path, tmp_path):
+                await self.db.delete(media)
+                await self.db.flush()
+                return None
+            return media
+        finally:
+            await StorageBackend.run(self.__remove, tmp_path)
+
+    async def release(self, url: str, storage: StorageBackend) -> None:
+        """
+        释放文件，引用次数减一，减到 0 时删除记录，并在事务提交后删除文件
+
+        :param url: 文件访问链接，不是通过 MediaDal 保存的文件会被忽略
+        :param storage: 存储后端
+        """
+        sql = select(self.model).where(self.model.storage == storage.name, self.model.url == url).with_for_update()
+        media = (await self.db.scalars(sql)).first()
+        if not media:
+            return
+        if media.ref_count > 1:
+            media.ref_count -= 1
+            await self.flush(media)
+            return
+        await self.db.execute(delete(self.model).where(self.model.id == media.id))
+        sha256, path = media.sha256, media.path
+
+        async def remove(app: FastAPI):
+            await self.remove_object(storage, sha256, path)
+
+        add_commit_callback(self.db, remove)
+
+    @classmethod
+    async def remove_object(cls, storage: StorageBackend, sha256: str, path: str) -> None:
+        """
+        没有相同内容的文件记录时删除文件
+
+        在新的事务中锁定 (storage, sha256)：其他请求未提交的同内容记录会使查询等待其事务结束，
+        查询不到记录时持有的锁会阻止其他请求在删除完成前写入同内容的记录
+        """
+        model = models.VadminSystemMedia
+        async with engine_manage.get_session_factory()() as session:
+            async with session.begin():
+                sql = select(model.id).where(model.storage == storage.name, model.sha256 == sha256).with_for_update()
+                if (await session.scalars(sql)).first() is not None:
+                    return
+                await storage.delete_object(path)
+
+    async def __reference(self, storage: StorageBackend, sha256: str) -> models.VadminSystemMedia | None:
+        """
+        已存在相同内容的文件时，引用次数加一并返回记录
+        """
+        where = (self.model.storage == storage.name, self.model.sha256 == sha256)
+        sql = update(self.model).where(*where).values(ref_count=self.model.ref_count + 1)
+        result = await self.db.execute(sql.execution_options(synchronize_session=False))
+        if result.rowcount == 0:
+            return None
+        return (await self.db.scalars(select(self.model).where(*where).execution_options(populate_existing=True))).first()
+
+    @staticmethod
+    def __remove(path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
@@ -1,3 +1,4 @@
 from .dict import VadminDictType, VadminDictDetails
 from .settings import VadminSystemSettings
 from .settings_tab import VadminSystemSettingsTab
+from .media import VadminSystemMedia
@@ -0,0 +1,23 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/18 16:20
+# @File           : media.py
+# @IDE            : PyCharm
+# @desc           : 媒体文件模型
+
+from db.db_base import BaseModel
+from sqlalchemy import Column, String, Integer, UniqueConstraint
+
+
+class VadminSystemMedia(BaseModel):
+    __tablename__ = "vadmin_system_media"
+    __table_args__ = (UniqueConstraint("storage", "sha256"), {'comment': '媒体文件表，按照文件内容哈希去重'})
+
+    sha256 = Column(String(64), index=True, nullable=False, comment="文件内容 SHA-256")
+    storage = Column(String(100), nullable=False, comment="存储位置")
+    path = Column(String(255), nullable=False, comment="文件保存路径")
+    url = Column(String(500), index=True, nullable=False, comment="文件访问链接")
+    size = Column(Integer, comment="文件大小")
+    content_type = Column(String(50), comment="文件类型")
+    ref_count = Column(Integer, default=1, nullable=False, comment="引用次数")
@@ -1,3 +1,4 @@
 from .dict import DictType, DictDetails, DictTypeSimpleOut, DictDetailsSimpleOut, DictTypeSelectOut
 from .settings_tab import SettingsTab, SettingsTabSimpleOut
 from .settings import Settings, SettingsSimpleOut
+from .media import Media, MediaSimpleOut
@@ -0,0 +1,29 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/18 16:25
+# @File           : media.py
+# @IDE            : PyCharm
+# @desc           : pydantic 模型，用于数据库序列化操作
+
+from pydantic import BaseModel
+from core.data_types import DatetimeStr
+
+
+class Media(BaseModel):
+    sha256: str
+    storage: str
+    path: str
+    url: str
+    size: int | None = None
+    content_type: str | None = None
+    ref_count: int
+
+
+class MediaSimpleOut(Media):
+    id: int
+    create_datetime: DatetimeStr
+    update_datetime: DatetimeStr
+
+    class Config:
+        orm_mode = True
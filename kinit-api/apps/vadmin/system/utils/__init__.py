@@ -0,0 +1,7 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/20 10:10
+# @File           : __init__.py
+# @IDE            : PyCharm
+# @desc           : 简要说明
@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/20 15:30
+# @File           : config_cache.py
+# @IDE            : PyCharm
+# @desc           : 系统基础配置缓存
+
+"""
+缓存内容：系统基础配置（每次进入系统时获取），以及内容对应的 ETag
+缓存结构：进程内快照 + Redis 中缓存
+
+版本号：
+    settings_version：系统配置版本号，更新系统配置时自增
+
+进程内快照在 CONFIG_CACHE_SNAPSHOT_TTL 秒内直接使用，不访问 Redis；
+更新系统配置后通过 Redis 发布订阅通知所有进程，所有进程同时清除快照，下次获取时重新从 Redis 中读取
+订阅断开期间可能错过通知，所以快照仍然设置有效期，并在重新订阅后清除快照
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from aioredis import Redis
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+from application import settings
+from core.database import add_commit_callback
+from core.logger import logger
+
+
+class ConfigCache:
+
+    VERSION_KEY = "settings_version"
+    DATA_KEY = "base_config_cache"
+    CHANNEL = "settings_invalidate"
+
+    # 进程内快照，{"version": 版本号, "config": 系统基础配置, "etag": ETag}
+    snapshot: dict | None = None
+    snapshot_expire: float = 0
+    # 快照清除次数，查询数据库期间快照被清除时，查询结果不再写入快照
+    generation: int = 0
+    # 订阅任务
+    task: asyncio.Task | None = None
+
+    def __init__(self, rd: Redis):
+        self.rd = rd
+        self.version = None
+        self.__generation = ConfigCache.generation
+
+    async def get(self) -> dict | None:
+        """
+        获取系统基础配置缓存，版本号不一致则返回 None
+
+        返回 None 后，从数据库中获取数据，然后调用 set 方法写入缓存
+        """
+        snapshot = ConfigCache.snapshot
+        if snapshot and time.monotonic() < ConfigCache.snapshot_expire:
+            return snapshot
+        version, result = await self.rd.mget(self.VERSION_KEY, self.DATA_KEY)
+        self.version = str(version or 0)
+        if not result:
+            return None
+        data = json.loads(result)
+        if data["version"] != self.version:
+            return None
+        self.__snapshot_set(data)
+        return data
+
+    async def set(self, config: dict) -> dict:
+        """
+        写入系统基础配置缓存
+
+        版本号使用 get 方法获取到的版本号，如果在查询数据库期间配置被更新，那么下次获取时版本号不一致，会重新查询
+        """
+        data = self.entry(config, self.version)
+        await self.rd.set(self.DATA_KEY, json.dumps(data), ex=settings.CONFIG_CACHE_EXPIRE)
+        self.__snapshot_set(data)
+        return data
+
+    @classmethod
+    def entry(cls, config: dict, version: str = None) -> dict:
+        """
+        生成缓存数据，ETag 为配置内容序列化后的摘要
+        """
+        content = json.dumps(config, ensure_ascii=False, sort_keys=True)
+        etag = hashlib.md5(content.encode()).hexdigest()
+        return {"version": version or "0", "config": config, "etag": f'"{etag}"'}
+
+    def __snapshot_set(self, data: dict) -> None:
+        if self.__generation != ConfigCache.generation:
+            return
+        ConfigCache.snapshot = data
+        ConfigCache.snapshot_expire = time.monotonic() + settings.CONFIG_CACHE_SNAPSHOT_TTL
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        清除进程内快照
+        """
+        cls.snapshot = None
+        cls.generation += 1
+
+    @classmethod
+    def invalidate(cls, db: AsyncSession) -> None:
+        """
+        事务提交后版本号自增，并通知所有进程清除快照
+        """
+        if not settings.CONFIG_CACHE_ENABLE:
+            return
+
+        async def callback(app: FastAPI):
+            rd: Redis = app.state.redis
+            version = await rd.incr(cls.VERSION_KEY)
+            cls.clear()
+            await rd.publish(cls.CHANNEL, version)
+
+        add_commit_callback(db, callback)
+
+    @classmethod
+    async def listen(cls, rd: Redis) -> None:
+        """
+        订阅配置更新通知，收到通知后清除快照，订阅断开后自动重新订阅
+        """
+        while True:
+            try:
+                async with rd.pubsub() as pubsub:
+                    await pubsub.subscribe(cls.CHANNEL)
+                    # 订阅之前可能错过通知
+                    cls.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            cls.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"系统配置更新通知订阅断开，报错：{e!r}")
+                cls.clear()
+                await asyncio.sleep(1)
+
+    @classmethod
+    def start(cls, rd: Redis) -> None:
+        if cls.task is None:
+            cls.task = asyncio.create_task(cls.listen(rd))
+
+    @classmethod
+    async def stop(cls) -> None:
+        if cls.task is not None:
+            cls.task.cancel()
+            await asyncio.gather(cls.task, return_exceptions=True)
+            cls.task = None
+        cls.clear()
+
+
+async def subscribe_config_cache(app: FastAPI, status: bool):
+    """
+    订阅系统配置更新通知，需要在 connect_redis 之后启动
+    :param app:
+    :param status:
+    :return:
+    """
+    if not settings.CONFIG_CACHE_ENABLE:
+        return
+    if status:
+        print("Subscribing settings invalidation")
+        ConfigCache.start(app.state.redis)
+    else:
+        print("Settings invalidation unsubscribed")
+        await ConfigCache.stop()
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/20 10:10
+# @File           : dict_cache.py
+# @IDE            : PyCharm
+# @desc           : 数据字典缓存
+
+"""
+缓存内容：字典类型下序列化后的字典元素列表，以及内容对应的 ETag
+缓存结构：Redis 中缓存 + 进程内 LRU 缓存
+
+版本号：
+    dict_cache_version:{dict_type}：字典类型版本号，字典类型或字典元素发生变化时自增，只有该字典类型缓存失效
+
+每次获取时只需要一次 MGET 获取所有字典类型的版本号，版本号一致则直接使用缓存，只查询缓存中没有的字典类型
+不存在的字典类型同样缓存，创建该字典类型时失效
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+from aioredis import Redis
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+from application import settings
+from core.database import add_commit_callback
+
+
+class DictCache:
+
+    VERSION_KEY = "dict_cache_version"
+    DATA_KEY = "dict_cache_data"
+
+    # 进程内 LRU 缓存，dict_type -> 缓存数据
+    lru: OrderedDict = OrderedDict()
+
+    def __init__(self, rd: Redis):
+        self.rd = rd
+        self.versions = {}
+
+    async def get(self, dict_types: List[str]) -> Dict[str, dict]:
+        """
+        获取多个字典类型的缓存数据，只返回版本号一致的字典类型
+
+        未返回的字典类型从数据库中查询，然后调用 set 方法写入缓存
+        """
+        versions = await self.rd.mget(*[f"{self.VERSION_KEY}:{i}" for i in dict_types])
+        self.versions = {dict_type: str(version or 0) for dict_type, version in zip(dict_types, versions)}
+        result = {}
+        missing = []
+        for dict_type, version in self.versions.items():
+            data = self.lru.get(dict_type)
+            if data and data["version"] == version:
+                self.lru.move_to_end(dict_type)
+                result[dict_type] = data
+            else:
+                missing.append(dict_type)
+        if not missing:
+            return result
+        values = await self.rd.mget(*[f"{self.DATA_KEY}:{i}" for i in missing])
+        for dict_type, value in zip(missing, values):
+            if not value:
+                continue
+            data = json.loads(value)
+            if data["version"] != self.versions[dict_type]:
+                continue
+            self.__lru_set(dict_type, data)
+            result[dict_type] = data
+        return result
+
+    async def set(self, datas: Dict[str, list | None]) -> Dict[str, dict]:
+        """
+        写入多个字典类型的缓存数据，一次 pipeline 写入
+
+        版本号使用 get 方法获取到的版本号，如果在查询数据库期间缓存被清除，那么下次获取时版本号不一致，会重新查询
+
+        :param datas: {字典类型: 字典元素列表}，字典类型不存在时为 None
+        """
+        result = self.entries(datas, self.versions)
+        async with self.rd.pipeline(transaction=False) as pipe:
+            for dict_type, data in result.items():
+                pipe.set(f"{self.DATA_KEY}:{dict_type}", json.dumps(data), ex=settings.DICT_CACHE_EXPIRE)
+                self.__lru_set(dict_type, data)
+            await pipe.execute()
+        return result
+
+    @classmethod
+    def entries(cls, datas: Dict[str, list | None], versions: Dict[str, str] = None) -> Dict[str, dict]:
+        """
+        生成缓存数据，每个字典类型的 ETag 为字典元素列表序列化后的摘要
+        """
+        result = {}
+        for dict_type, details in datas.items():
+            content = json.dumps(details, ensure_ascii=False)
+            result[dict_type] = {
+                "version": (versions or {}).get(dict_type, "0"),
+                "details": details,
+                "etag": hashlib.md5(content.encode()).hexdigest()
+            }
+        return result
+
+    @classmethod
+    def merge(cls, dict_types: List[str], entries: Dict[str, dict]) -> Tuple[dict, str]:
+        """
+        合并多个字典类型的缓存数据
+
+        :return: ({字典类型: 字典元素列表}，不包括不存在的字典类型；所有字典类型 ETag 合并后的 ETag)
+        """
+        data = {}
+        tags = []
+        for dict_type in dict_types:
+            entry = entries[dict_type]
+            if entry["details"] is not None:
+                data[dict_type] = entry["details"]
+            tags.append(f"{dict_type}:{entry['etag']}")
+        etag = hashlib.md5("\n".join(tags).encode()).hexdigest()
+        return data, f'"{etag}"'
+
+    def __lru_set(self, dict_type: str, data: dict) -> None:
+        self.lru[dict_type] = data
+        self.lru.move_to_end(dict_type)
+        while len(self.lru) > settings.DICT_CACHE_LRU_SIZE:
+            self.lru.popitem(last=False)
+
+    @classmethod
+    def invalidate(cls, db: AsyncSession, *dict_types: str) -> None:
+        """
+        事务提交后清除指定字典类型的缓存
+        """
+        if not settings.DICT_CACHE_ENABLE:
+            return
+        dict_types = {i for i in dict_types if i}
+        if not dict_types:
+            return
+
+        async def callback(app: FastAPI):
+            rd: Redis = app.state.redis
+            async with rd.pipeline(transaction=False) as pipe:
+                for dict_type in dict_types:
+                    pipe.incr(f"{cls.VERSION_KEY}:{dict_type}")
+                await pipe.execute()
+
+        add_commit_callback(db, callback)
@@ -7,16 +7,18 @@
 
 # UploadFile 库依赖：pip install python-multipart
 from typing import List
-from fastapi import APIRouter, Depends, Body, UploadFile, Request, Form
+from fastapi import APIRouter, Depends, Body, UploadFile, Request, Form, Query
 from sqlalchemy.ext.asyncio import AsyncSession
+from application import settings
 from application.settings import ALIYUN_OSS
-from core.database import db_getter
+from core.database import db_getter, engine_manage
+from core.job import job_manage
 from utils.file.aliyun_oss import AliyunOSS, BucketConf
 from utils.aliyun_sms import AliyunSMS
 from utils.file.file_manage import FileManage
-from utils.response import SuccessResponse, ErrorResponse
+from utils.response import SuccessResponse, ErrorResponse, NotModifiedResponse
 from . import schemas, crud
-from core.dependencies import IdList
+from core.dependencies import IdList, IpThrottle
 from apps.vadmin.auth.utils.current import AllUserAuth, FullAdminAuth
 from apps.vadmin.auth.utils.validation.auth import Auth
 from .params import DictTypeParams, DictDetailParams
@@ -29,9 +31,8 @@ app = APIRouter()
 ###########################################################
 @app.get("/dict/types/", summary="获取字典类型列表")
 async def get_dict_types(p: DictTypeParams = Depends(), auth: Auth = Depends(AllUserAuth())):
-    datas = await crud.DictTypeDal(auth.db).get_datas(**p.dict())
-    count = await crud.DictTypeDal(auth.db).get_count(**p.to_count())
-    return SuccessResponse(datas, count=count)
+    datas, count, next_cursor = await crud.DictTypeDal(auth.db).get_page(**p.dict())
+    return SuccessResponse(datas, count=count, next_cursor=next_cursor)
 
 
 @app.post("/dict/types/", summary="创建字典类型")
@@ -47,11 +48,29 @@ async def delete_dict_types(ids: IdList = Depends(), auth: Auth = Depends(AllUse
 
 @app.post("/dict/types/details/", summary="获取多个字典类型下的字典元素列表")
 async def post_dicts_details(
+        request: Request,
         auth: Auth = Depends(AllUserAuth()),
         dict_types: List[str] = Body(None, title="字典元素列表", description="查询字典元素列表")
 ):
-    datas = await crud.DictTypeDal(auth.db).get_dicts_details(dict_types)
-    return SuccessResponse(datas)
+    rd = request.app.state.redis if settings.DICT_CACHE_ENABLE else None
+    return SuccessResponse(await crud.DictTypeDal(auth.db).get_dicts_details(dict_types, rd))
+
+
+@app.get("/dict/types/details/", summary="获取多个字典类型下的字典元素列表，支持协商缓存")
+async def get_dicts_details(
+        request: Request,
+        auth: Auth = Depends(AllUserAuth()),
+        dict_types: List[str] = Query(None, title="字典元素列表", description="查询字典元素列表")
+):
+    rd = request.app.state.redis if settings.DICT_CACHE_ENABLE else None
+    datas, etag = await crud.DictTypeDal(auth.db).get_dicts_details_etag(dict_types, rd)
+    # 浏览器每次使用本地缓存前都携带 If-None-Match 向服务器确认，字典内容未变化时不返回响应体
+    headers = {"Cache-Control": "no-cache"}
+    if NotModifiedResponse.match(request.headers.get("If-None-Match"), etag):
+        return NotModifiedResponse(etag, headers)
+    response = SuccessResponse(datas)
+    response.headers.update({"ETag": etag, **headers})
+    return response
 
 
 @app.get("/dict/types/options/", summary="获取字典类型选择项")
@@ -82,9 +101,8 @@ async def create_dict_details(data: schemas.DictDetails, auth: Auth = Depends(Al
 async def get_dict_details(params: DictDetailParams = Depends(), auth: Auth = Depends(AllUserAuth())):
     if not params.dict_type_id:
         return ErrorResponse(msg="未获取到字典类型！")
-    datas = await crud.DictDetailsDal(auth.db).get_datas(**params.dict())
-    count = await crud.DictDetailsDal(auth.db).get_count(**params.to_count())
-    return SuccessResponse(datas, count=count)
+    datas, count, next_cursor = await crud.DictDetailsDal(auth.db).get_page(**params.dict())
+    return SuccessResponse(datas, count=count, next_cursor=next_cursor)
 
 
 @app.delete("/dict/details/", summary="批量删除字典元素", description="硬删除")
@@ -108,16 +126,16 @@ async def get_dict_detail(data_id: int, auth: Auth = Depends(AllUserAuth())):
 #    文件上传管理
 ###########################################################
 @app.post("/upload/image/to/oss/", summary="上传图片到阿里云OSS")
-async def upload_image_to_oss(file: UploadFile, path: str = Form(...)):
-    result = await AliyunOSS(BucketConf(**ALIYUN_OSS)).upload_image(path, file)
+async def upload_image_to_oss(file: UploadFile, path: str = Form(...), db: AsyncSession = Depends(db_getter)):
+    result = await AliyunOSS(BucketConf(**ALIYUN_OSS)).upload_image(path, file, media=crud.MediaDal(db))
     if not result:
         return ErrorResponse(msg="上传失败")
     return SuccessResponse(result)
 
 
 @app.post("/upload/image/to/local/", summary="上传图片到本地")
-async def upload_image_to_local(file: UploadFile, path: str = Form(...)):
-    manage = FileManage(file, path)
+async def upload_image_to_local(file: UploadFile, path: str = Form(...), db: AsyncSession = Depends(db_getter)):
+    manage = FileManage(file, path, crud.MediaDal(db))
     path = await manage.save_image_local()
     return SuccessResponse(path)
 
@@ -125,7 +143,7 @@ async def upload_image_to_local(file: UploadFile, path: str = Form(...)):
 ###########################################################
 #    短信服务管理
 ###########################################################
-@app.post("/sms/send/", summary="发送短信验证码（阿里云服务）")
+@app.post("/sms/send/", summary="发送短信验证码（阿里云服务）", dependencies=[Depends(IpThrottle("sms"))])
 async def sms_send(request: Request, telephone: str):
     sms = AliyunSMS(request.app.state.redis, telephone)
     return SuccessResponse(await sms.main_async(AliyunSMS.Scene.login))
@@ -150,8 +168,16 @@ async def put_settings_tabs_values(request: Request, datas: dict = Body(...), au
 
 
 @app.get("/settings/base/config/", summary="获取系统基础配置", description="每次进入系统中时使用")
-async def get_setting_base_config(db: AsyncSession = Depends(db_getter)):
-    return SuccessResponse(await crud.SettingsDal(db).get_base_config())
+async def get_setting_base_config(request: Request, db: AsyncSession = Depends(db_getter)):
+    rd = request.app.state.redis if settings.CONFIG_CACHE_ENABLE else None
+    config, etag = await crud.SettingsDal(db).get_base_config_etag(rd)
+    # 浏览器每次使用本地缓存前都向服务器确认，配置未变化时不返回响应体
+    headers = {"Cache-Control": "no-cache"}
+    if NotModifiedResponse.match(request.headers.get("If-None-Match"), etag):
+        return NotModifiedResponse(etag, headers)
+    response = SuccessResponse(config)
+    response.headers.update({"ETag": etag, **headers})
+    return response
 
 
 @app.get("/settings/privacy/", summary="获取隐私协议")
@@ -162,3 +188,22 @@ async def get_settings_privacy(auth: Auth = Depends(FullAdminAuth())):
 @app.get("/settings/agreement/", summary="获取用户协议")
 async def get_settings_agreement(auth: Auth = Depends(FullAdminAuth())):
     return SuccessResponse((await crud.SettingsDal(auth.db).get_data(config_key="web_agreement")).config_value)
+
+
+###########################################################
+#    数据库管理
+###########################################################
+@app.get("/database/pool/status/", summary="获取数据库连接池状态")
+async def get_database_pool_status(auth: Auth = Depends(FullAdminAuth())):
+    return SuccessResponse(engine_manage.get_pool_status())
+
+
+###########################################################
+#    后台任务
+###########################################################
+@app.get("/jobs/{job_id}/", summary="获取后台任务状态、进度与执行结果")
+async def get_job(job_id: str, auth: Auth = Depends(AllUserAuth())):
+    data = await job_manage.get(job_id)
+    if not data or data["user_id"] != auth.user.id:
+        return ErrorResponse("任务不存在或已过期")
+    return SuccessResponse(data)
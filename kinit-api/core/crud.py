@@ -18,14 +18,19 @@
 # joinedload 官方文档：
 # https://www.osgeo.cn/sqlalchemy/orm/loading_relationships.html?highlight=selectinload#sqlalchemy.orm.joinedload
 
+import asyncio
+import base64
 import datetime
-from typing import List, Set
+import json
+from typing import List, Set, Tuple, AsyncIterator
 from fastapi import HTTPException
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import func, delete, update, or_
+from sqlalchemy import func, delete, update, or_, and_, text
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
+from application import settings
+from core.database import engine_manage
 from core.exception import CustomException
 from sqlalchemy.sql.selectable import Select
 from typing import Any
@@ -41,6 +46,8 @@ class DalBase:
         self.model = model
         self.schema = schema
         self.key_models = key_models
+        # 游标分页时，下一页的游标，没有下一页则为 None
+        self.next_cursor = None
 
     async def get_data(
             self,
@@ -71,6 +78,9 @@ class DalBase:
         sql = self.add_filter_condition(sql, v_options, v_join_query, v_or, **kwargs)
         if v_order and (v_order in self.ORDER_FIELD):
             sql = sql.order_by(self.model.create_datetime.desc())
+        if v_schema:
+            # 只返回序列化数据的查询允许路由到从库
+            sql = sql.execution_options(read_replica=True)
         queryset = await self.db.execute(sql)
         data = queryset.scalars().unique().first()
         if not data and v_return_none:
@@ -93,6 +103,7 @@ class DalBase:
             v_return_objs: bool = False,
             v_start_sql: Any = None,
             v_schema: Any = None,
+            v_after: str = None,
             **kwargs
     ):
         """
@@ -107,23 +118,54 @@ class DalBase:
         :param v_return_objs: 是否返回对象
         :param v_start_sql: 初始 sql
         :param v_schema: 指定使用的序列化对象
+        :param v_after: 游标分页，上一页返回的 next_cursor，为空字符串时获取第一页，为 None 时使用页码分页
         :param kwargs: 查询参数
         """
-        if not isinstance(v_start_sql, Select):
-            v_start_sql = select(self.model).where(self.model.is_delete == False)
-        sql = self.add_filter_condition(v_start_sql, v_options, v_join_query, v_or, **kwargs)
-        if v_order_field and (v_order in self.ORDER_FIELD):
-            sql = sql.order_by(getattr(self.model, v_order_field).desc(), self.model.id.desc())
-        elif v_order_field:
-            sql = sql.order_by(getattr(self.model, v_order_field), self.model.id)
-        elif v_order in self.ORDER_FIELD:
-            sql = sql.order_by(self.model.id.desc())
-        if limit != 0:
-            sql = sql.offset((page - 1) * limit).limit(limit)
+        if v_after is not None:
+            # 游标分页必须有确定的排序，默认按照 ID 排序
+            v_order_field = v_order_field or "id"
+        sql = self.__generate_datas_sql(
+            page, limit, v_options, v_join_query, v_or, v_order, v_order_field, v_start_sql, v_after, **kwargs
+        )
+        if not v_return_objs:
+            # 只返回序列化数据的查询允许路由到从库
+            sql = sql.execution_options(read_replica=True)
         queryset = await self.db.execute(sql)
+        objs = queryset.scalars().unique().all()
+        if v_after is not None:
+            has_next = limit != 0 and len(objs) == limit
+            self.next_cursor = self.encode_cursor(objs[-1], v_order_field) if has_next else None
         if v_return_objs:
-            return queryset.scalars().unique().all()
-        return [await self.out_dict(i, v_schema=v_schema) for i in queryset.scalars().unique().all()]
+            return objs
+        return [await self.out_dict(i, v_schema=v_schema) for i in objs]
+
+    async def stream_datas(
+            self,
+            page: int = 1,
+            limit: int = 0,
+            v_options: list = None,
+            v_join_query: dict = None,
+            v_or: List[tuple] = None,
+            v_order: str = None,
+            v_order_field: str = None,
+            v_start_sql: Any = None,
+            v_yield_per: int = 1000,
+            **kwargs
+    ) -> AsyncIterator[list]:
+        """
+        使用服务端游标分批获取数据对象，不会一次性将所有数据加载到内存中，适用于大数据量导出
+
+        注意：不支持预加载集合关系（joinedload 一对多、多对多）
+        :param v_yield_per: 每批数据量
+        其他参数与 get_datas 一致
+        """
+        sql = self.__generate_datas_sql(
+            page, limit, v_options, v_join_query, v_or, v_order, v_order_field, v_start_sql, None, **kwargs
+        )
+        sql = sql.execution_options(read_replica=True, yield_per=v_yield_per)
+        queryset = await self.db.stream(sql)
+        async for objs in queryset.scalars().partitions(v_yield_per):
+            yield objs
 
     async def get_count(self, v_options: list = None, v_join_query: dict = None, v_or: List[tuple] = None, **kwargs):
         """
@@ -136,9 +178,125 @@ class DalBase:
         """
         sql = select(func.count(self.model.id).label('total')).where(self.model.is_delete == False)
         sql = self.add_filter_condition(sql, v_options, v_join_query, v_or, **kwargs)
+        sql = sql.execution_options(read_replica=True)
         queryset = await self.db.execute(sql)
         return queryset.one()['total']
 
+    async def get_page(
+            self,
+            page: int = 1,
+            limit: int = 10,
+            v_options: list = None,
+            v_join_query: dict = None,
+            v_or: List[tuple] = None,
+            v_order: str = None,
+            v_order_field: str = None,
+            v_start_sql: Any = None,
+            v_schema: Any = None,
+            v_after: str = None,
+            v_approximate: bool = False,
+            **kwargs
+    ) -> Tuple[list, int, str | None]:
+        """
+        获取分页数据列表、数据总数与游标分页的下一页游标，代替分别调用 get_datas 与 get_count
+
+        总数获取方式：
+            1. v_approximate 为 True、没有任何过滤条件，并且表统计信息中的近似行数不少于 APPROXIMATE_COUNT_MIN_ROWS 时，
+               使用近似行数（只支持 MySQL，包含软删除数据）
+            2. 没有 v_options 并且数据库支持窗口函数时，使用 COUNT(*) OVER() 在同一条 SQL 中返回总数
+            3. 其他情况使用新的数据库连接并发执行总数查询
+
+        :param v_approximate: 是否允许使用近似总数，适用于数据量很大的表
+        其他参数与 get_datas 一致
+        :return: 数据列表，数据总数，下一页游标（页码分页或没有下一页时为 None）
+        """
+        self.next_cursor = None
+        # 总数查询不需要预加载
+        count_kwargs = dict(v_join_query=v_join_query, v_or=v_or, **kwargs)
+        if v_approximate and v_start_sql is None and not self.__has_filter(v_join_query, v_or, **kwargs):
+            total = await self.__get_approximate_count()
+            if total is not None and total >= settings.APPROXIMATE_COUNT_MIN_ROWS:
+                datas = await self.get_datas(
+                    page, limit, v_options, v_join_query, v_or, v_order, v_order_field,
+                    v_start_sql=v_start_sql, v_schema=v_schema, v_after=v_after, **kwargs
+                )
+                return datas, total, self.next_cursor
+        if v_after is None and not v_options and self.__support_window_function():
+            # 预加载会使 ORM 将分页查询包装为子查询，所以只在没有 v_options 时使用窗口函数
+            if not isinstance(v_start_sql, Select):
+                v_start_sql = select(self.model).where(self.model.is_delete == False)
+            v_start_sql = v_start_sql.add_columns(func.count().over().label("v_total"))
+            sql = self.__generate_datas_sql(
+                page, limit, v_options, v_join_query, v_or, v_order, v_order_field, v_start_sql, v_after, **kwargs
+            )
+            queryset = await self.db.execute(sql.execution_options(read_replica=True))
+            rows = queryset.unique().all()
+            if rows:
+                total = rows[0][-1]
+            elif page > 1:
+                # 页码超出范围时没有数据行，无法获取总数
+                total = await self.get_count(**count_kwargs)
+            else:
+                total = 0
+            return [await self.out_dict(row[0], v_schema=v_schema) for row in rows], total, None
+        datas, total = await asyncio.gather(
+            self.get_datas(
+                page, limit, v_options, v_join_query, v_or, v_order, v_order_field,
+                v_start_sql=v_start_sql, v_schema=v_schema, v_after=v_after, **kwargs
+            ),
+            self.__get_concurrent_count(**count_kwargs)
+        )
+        return datas, total, self.next_cursor
+
+    async def __get_concurrent_count(self, **kwargs) -> int:
+        """
+        使用新的数据库连接获取数据总数，可以与当前会话中的查询并发执行
+
+        注意：新连接中看不到当前事务中未提交的修改，所以只用于查询
+        """
+        async with engine_manage.get_session_factory()() as session:
+            return await DalBase(session, self.model, self.schema, self.key_models).get_count(**kwargs)
+
+    async def __get_approximate_count(self) -> int | None:
+        """
+        从表统计信息中获取近似行数，不支持时返回 None
+        """
+        if self.__get_dialect().name != "mysql":
+            return None
+        sql = text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+        )
+        queryset = await self.db.execute(sql, {"name": self.model.__tablename__})
+        return queryset.scalar()
+
+    def __has_filter(self, v_join_query: dict = None, v_or: List[tuple] = None, **kwargs) -> bool:
+        """
+        是否存在过滤条件
+        """
+        conditions = []
+        self.__dict_filter(conditions, self.model, **kwargs)
+        return bool(conditions or v_join_query or v_or)
+
+    def __get_dialect(self):
+        bind = self.db.bind or engine_manage.get_engine()
+        return bind.dialect
+
+    def __support_window_function(self) -> bool:
+        """
+        数据库是否支持窗口函数，MySQL 8.0、MariaDB 10.2、SQLite 3.25 及以上版本支持
+        """
+        dialect = self.__get_dialect()
+        version = dialect.server_version_info or ()
+        if dialect.name == "postgresql":
+            return True
+        elif dialect.name == "mysql" and getattr(dialect, "is_mariadb", False):
+            return version >= (10, 2)
+        elif dialect.name == "mysql":
+            return version >= (8, 0)
+        elif dialect.name == "sqlite":
+            return version >= (3, 25)
+        return False
+
     async def create_data(self, data, v_options: list = None, v_return_obj: bool = False, v_schema: Any = None):
         """
         创建数据
@@ -239,6 +397,92 @@ class DalBase:
             sql = sql.options(*[load for load in v_options])
         return sql
 
+    def __generate_datas_sql(
+            self,
+            page: int,
+            limit: int,
+            v_options: list = None,
+            v_join_query: dict = None,
+            v_or: List[tuple] = None,
+            v_order: str = None,
+            v_order_field: str = None,
+            v_start_sql: Any = None,
+            v_after: str = None,
+            **kwargs
+    ) -> select:
+        """
+        生成数据列表查询 SQL，参数与 get_datas 一致
+        """
+        if not isinstance(v_start_sql, Select):
+            v_start_sql = select(self.model).where(self.model.is_delete == False)
+        sql = self.add_filter_condition(v_start_sql, v_options, v_join_query, v_or, **kwargs)
+        if v_after is not None:
+            sql = self.__cursor_filter(sql, v_after, v_order, v_order_field)
+        if v_order_field and (v_order in self.ORDER_FIELD):
+            sql = sql.order_by(getattr(self.model, v_order_field).desc(), self.model.id.desc())
+        elif v_order_field:
+            sql = sql.order_by(getattr(self.model, v_order_field), self.model.id)
+        elif v_order in self.ORDER_FIELD:
+            sql = sql.order_by(self.model.id.desc())
+        if limit != 0 and v_after is not None:
+            sql = sql.limit(limit)
+        elif limit != 0:
+            sql = sql.offset((page - 1) * limit).limit(limit)
+        return sql
+
+    def __cursor_filter(self, sql: select, after: str, v_order: str, v_order_field: str) -> select:
+        """
+        游标分页过滤条件，从上一页最后一条数据之后开始查询
+
+        排序为 (排序字段, ID)，MySQL 中 NULL 值正序时排在最前，倒序时排在最后
+        :param sql:
+        :param after: 上一页返回的 next_cursor
+        :param v_order: 排序，默认正序，为 desc 是倒叙
+        :param v_order_field: 排序字段
+        """
+        if not after:
+            return sql
+        field, value, last_id = self.decode_cursor(after)
+        if field != v_order_field:
+            raise CustomException(msg="分页游标与排序字段不一致，请重新获取第一页")
+        desc = v_order in self.ORDER_FIELD
+        attr = getattr(self.model, field)
+        if field == "id":
+            condition = self.model.id < last_id if desc else self.model.id > last_id
+        elif value is None and desc:
+            condition = and_(attr.is_(None), self.model.id < last_id)
+        elif value is None:
+            condition = or_(attr.isnot(None), and_(attr.is_(None), self.model.id > last_id))
+        elif desc:
+            condition = or_(attr < value, and_(attr == value, self.model.id < last_id), attr.is_(None))
+        else:
+            condition = or_(attr > value, and_(attr == value, self.model.id > last_id))
+        return sql.where(condition)
+
+    @classmethod
+    def encode_cursor(cls, obj: Any, v_order_field: str) -> str:
+        """
+        生成分页游标，游标内容为 (排序字段, 排序字段值, ID)，对客户端不透明
+        """
+        value = getattr(obj, v_order_field)
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            value = {"datetime": value.isoformat()}
+        cursor = json.dumps([v_order_field, value, obj.id], separators=(",", ":"))
+        return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> tuple:
+        """
+        解析分页游标
+        """
+        try:
+            field, value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise CustomException(msg="无效的分页游标")
+        if isinstance(value, dict):
+            value = datetime.datetime.fromisoformat(value["datetime"])
+        return field, value, last_id
+
     def __or_filter(self, sql: select, v_or: List[tuple], v_join_left: Set[str], v_join: Set[str]):
         """
         或逻辑操作
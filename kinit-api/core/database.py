@@ -10,15 +10,49 @@
 安装： pip install sqlalchemy
 中文文档：https://www.osgeo.cn/sqlalchemy/
 """
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+import itertools
+import time
+from typing import Dict, List, Callable, Awaitable
+from fastapi import Request, FastAPI
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, AsyncEngine
 from sqlalchemy.ext.declarative import declared_attr, declarative_base
-from sqlalchemy.orm import sessionmaker
-from application.settings import SQLALCHEMY_DATABASE_URL, DEBUG, SQLALCHEMY_DATABASE_TYPE
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.sql.selectable import Select
+from core.logger import logger
+from application.settings import SQLALCHEMY_DATABASE_URL, DEBUG, SQLALCHEMY_DATABASE_TYPE, SQLALCHEMY_POOL_SIZE, \
+    SQLALCHEMY_MAX_OVERFLOW, SQLALCHEMY_POOL_TIMEOUT, SQLALCHEMY_POOL_RECYCLE, SQLALCHEMY_READ_DATABASE_URLS, \
+    SQLALCHEMY_READ_SELECT_POLICY
 
 
-def create_async_engine_session(database_url: str, database_type: str = "mysql"):
+# 主库粘滞 Cookie，客户端发生写入后设置，有效期内该客户端的查询走主库
+READ_STICKY_COOKIE = "db_sticky"
+# 主库粘滞请求头，值为粘滞结束的时间戳（秒），供不保存 Cookie 的客户端（例如 kinit-uni）使用：
+# 写入后响应头中返回该时间戳，客户端在之后的请求中原样带上
+READ_STICKY_HEADER = "X-DB-Sticky"
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
     """
-    创建数据库会话
+    记录等待时间的连接池
+
+    在 AsyncAdaptedQueuePool 的基础上，统计从连接池中获取连接的次数与等待时间，用于观察连接池是否过小
+    """
+
+    def _do_get(self):
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait_time = time.perf_counter() - start_time
+            self.checkout_number = getattr(self, "checkout_number", 0) + 1
+            self.wait_time_total = getattr(self, "wait_time_total", 0) + wait_time
+            self.wait_time_max = max(getattr(self, "wait_time_max", 0), wait_time)
+
+
+def create_async_engine_pool(database_url: str, database_type: str = "mysql") -> AsyncEngine:
+    """
+    创建数据库引擎
 
     相关配置文档：https://docs.sqlalchemy.org/en/14/core/engines.html#database-urls
 
@@ -32,18 +66,174 @@ def create_async_engine_session(database_url: str, database_type: str = "mysql")
     :param database_url: 数据库地址
     :return:
     """
-    engine = create_async_engine(
+    if database_type == "sqlite3":
+        return create_async_engine(
+            database_url
+            , echo=False
+            , future=True
+            , connect_args={"check_same_thread": False, "timeout": 30}
+        )
+    return create_async_engine(
         database_url
         , echo=False
         , pool_pre_ping=True
-        , pool_recycle=3600
+        , pool_recycle=SQLALCHEMY_POOL_RECYCLE
         , future=True
-        , max_overflow=5
-        , connect_args={"check_same_thread": False, "timeout": 30} if database_type == "sqlite3" else {}
+        , poolclass=TimedQueuePool
+        , pool_size=SQLALCHEMY_POOL_SIZE
+        , max_overflow=SQLALCHEMY_MAX_OVERFLOW
+        , pool_timeout=SQLALCHEMY_POOL_TIMEOUT
     )
+
+
+def create_async_engine_session(database_url: str, database_type: str = "mysql"):
+    """
+    创建数据库会话
+
+    注意：每次调用都会创建一个新的数据库引擎与连接池，项目中请使用 engine_manage.get_session_factory()
+
+    :param database_type: 数据库类型
+    :param database_url: 数据库地址
+    :return:
+    """
+    engine = create_async_engine_pool(database_url, database_type)
     return sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=True, class_=AsyncSession)
 
 
+class RoutingSession(Session):
+    """
+    读写分离会话
+
+    路由规则：
+        1. 写入操作（flush、insert、update、delete）以及非查询语句全部走主库
+        2. 当前会话发生过写入，或者当前客户端在 SQLALCHEMY_READ_STICKY_SECONDS 秒内发生过写入（sticky），查询走主库
+        3. GET 请求中的查询，或者添加了 read_replica 执行选项的查询，走从库
+        4. 其他情况走主库
+
+    SQLAlchemy 官方文档：https://docs.sqlalchemy.org/en/14/orm/persistence_techniques.html#custom-vertical-partitioning
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        primary = engine_manage.get_engine()
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.info["has_write"] = True
+            return primary.sync_engine
+        if not isinstance(clause, Select) or self.info.get("has_write") or self.info.get("sticky"):
+            return primary.sync_engine
+        if self.info.get("read_only") or clause.get_execution_options().get("read_replica"):
+            replica = engine_manage.get_read_engine()
+            if replica is not None:
+                return replica.sync_engine
+        return primary.sync_engine
+
+
+class AsyncEngineManage:
+    """
+    数据库引擎管理
+
+    每个数据库地址在进程内只创建一个 AsyncEngine 与 sessionmaker，所有请求共享同一个连接池
+    在 core.event.connect_mysql 中启动，项目关闭时释放所有连接
+    """
+
+    def __init__(self):
+        self.engines: Dict[str, AsyncEngine] = {}
+        self.session_factories: Dict[str, sessionmaker] = {}
+        self.read_urls_cycle = itertools.cycle(SQLALCHEMY_READ_DATABASE_URLS)
+
+    def get_engine(self, database_url: str = SQLALCHEMY_DATABASE_URL, database_type: str = SQLALCHEMY_DATABASE_TYPE):
+        """
+        获取数据库引擎，不存在则创建
+
+        :param database_url: 数据库地址
+        :param database_type: 数据库类型
+        """
+        engine = self.engines.get(database_url)
+        if engine is None:
+            engine = create_async_engine_pool(database_url, database_type)
+            self.engines[database_url] = engine
+        return engine
+
+    def get_session_factory(
+            self,
+            database_url: str = SQLALCHEMY_DATABASE_URL,
+            database_type: str = SQLALCHEMY_DATABASE_TYPE
+    ) -> sessionmaker:
+        """
+        获取数据库会话工厂，不存在则创建
+
+        :param database_url: 数据库地址
+        :param database_type: 数据库类型
+        """
+        factory = self.session_factories.get(database_url)
+        if factory is None:
+            kwargs = {}
+            if database_url == SQLALCHEMY_DATABASE_URL and SQLALCHEMY_READ_DATABASE_URLS:
+                # 配置了从库，主库会话使用读写分离会话
+                kwargs["sync_session_class"] = RoutingSession
+            factory = sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                bind=self.get_engine(database_url, database_type),
+                expire_on_commit=True,
+                class_=AsyncSession,
+                **kwargs
+            )
+            self.session_factories[database_url] = factory
+        return factory
+
+    def get_read_engine(self) -> AsyncEngine | None:
+        """
+        获取从库引擎
+
+        round_robin：轮询
+        least_connections：选择当前已取出连接数最少的从库
+        """
+        if not SQLALCHEMY_READ_DATABASE_URLS:
+            return None
+        if SQLALCHEMY_READ_SELECT_POLICY == "least_connections":
+            engines = [self.get_engine(url) for url in SQLALCHEMY_READ_DATABASE_URLS]
+            return min(engines, key=lambda engine: engine.sync_engine.pool.checkedout())
+        return self.get_engine(next(self.read_urls_cycle))
+
+    def get_pool_status(self) -> List[dict]:
+        """
+        获取连接池状态
+
+        checked_out：已被取出正在使用的连接数
+        overflow：超出 pool_size 额外创建的连接数
+        wait_time_avg：获取连接平均等待时间（秒）
+        wait_time_max：获取连接最长等待时间（秒）
+        """
+        result = []
+        for database_url, engine in self.engines.items():
+            pool = engine.sync_engine.pool
+            checkout_number = getattr(pool, "checkout_number", 0)
+            wait_time_total = getattr(pool, "wait_time_total", 0)
+            result.append({
+                "database": engine.url.render_as_string(hide_password=True),
+                "pool_size": pool.size() if hasattr(pool, "size") else None,
+                "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else None,
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                "checkout_number": checkout_number,
+                "wait_time_avg": wait_time_total / checkout_number if checkout_number else 0,
+                "wait_time_max": getattr(pool, "wait_time_max", 0)
+            })
+        return result
+
+    async def dispose(self) -> None:
+        """
+        释放所有数据库引擎的连接池
+        """
+        for engine in self.engines.values():
+            await engine.dispose()
+        self.engines.clear()
+        self.session_factories.clear()
+
+
+engine_manage = AsyncEngineManage()
+
+
 class Base:
     """将表名改为小写"""
 
@@ -78,12 +268,57 @@ SQLAlchemy基础知识 Autoflush和Autocommit
 """
 
 
-async def db_getter():
+async def db_getter(request: Request):
     """
     获取主数据库
 
     数据库依赖项，它将在单个请求中使用，然后在请求完成后将其关闭。
+    配置了从库时，GET 请求中的查询会路由到从库。
+    客户端携带主库粘滞 Cookie 或请求头时，查询仍然走主库，由 core.middleware.register_read_sticky_middleware 设置
     """
-    async with create_async_engine_session(SQLALCHEMY_DATABASE_URL, SQLALCHEMY_DATABASE_TYPE)() as session:
+    async with engine_manage.get_session_factory()() as session:
+        session.sync_session.info["read_only"] = request.method == "GET"
+        session.sync_session.info["sticky"] = is_read_sticky(request)
+        # 供中间件在响应开始时判断本次请求是否发生了写入
+        request.scope.setdefault("db_sessions", []).append(session.sync_session)
         async with session.begin():
             yield session
+        await run_commit_callbacks(session, request.app)
+
+
+def is_read_sticky(request: Request) -> bool:
+    """
+    客户端是否处于写入后的主库粘滞时间内
+    """
+    if READ_STICKY_COOKIE in request.cookies:
+        return True
+    try:
+        return float(request.headers.get(READ_STICKY_HEADER, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def add_commit_callback(db: AsyncSession, callback: Callable[[FastAPI], Awaitable]) -> None:
+    """
+    添加事务提交后执行的回调，常用于数据变更后清除缓存
+
+    回调只会在事务成功提交后执行，事务回滚则丢弃
+    :param db: 数据库会话
+    :param callback: 异步回调函数，接收 app 对象作为参数
+    """
+    db.sync_session.info.setdefault("commit_callbacks", []).append(callback)
+
+
+async def run_commit_callbacks(db: AsyncSession, app: FastAPI) -> None:
+    """
+    执行事务提交后的回调
+
+    :param db: 数据库会话
+    :param app: FastAPI 对象
+    """
+    callbacks = db.sync_session.info.pop("commit_callbacks", [])
+    for callback in callbacks:
+        try:
+            await callback(app)
+        except Exception as e:
+            logger.error(f"执行事务提交后回调失败：{e}")
@@ -11,8 +11,12 @@
 """
 
 from typing import List
-from fastapi import Body
+from fastapi import Body, Request
 import copy
+from application import settings
+from core.exception import CustomException
+from utils import status
+from utils.count import RateLimiter
 
 
 class QueryParams:
@@ -23,6 +27,7 @@ class QueryParams:
             self.limit = params.limit
             self.v_order = params.v_order
             self.v_order_field = params.v_order_field
+            self.v_after = params.v_after
 
     def dict(self, exclude: List[str] = None) -> dict:
         result = copy.deepcopy(self.__dict__)
@@ -40,19 +45,31 @@ class QueryParams:
         del params["limit"]
         del params["v_order"]
         del params["v_order_field"]
+        params.pop("v_after", None)
         return params
 
 
 class Paging(QueryParams):
     """
     列表分页
+
+    after：游标分页，为 None 时使用页码分页，为空字符串时获取游标分页的第一页，
+    之后每次传入上一页返回的 next_cursor，游标分页时 page 参数无效
     """
-    def __init__(self, page: int = 1, limit: int = 10, v_order_field: str = "id", v_order: str = None):
+    def __init__(
+            self,
+            page: int = 1,
+            limit: int = 10,
+            v_order_field: str = "id",
+            v_order: str = None,
+            after: str = None
+    ):
         super().__init__()
         self.page = page
         self.limit = limit
         self.v_order = v_order
         self.v_order_field = v_order_field
+        self.v_after = after
 
 
 class IdList:
@@ -61,3 +78,19 @@ class IdList:
     """
     def __init__(self, ids: List[int] = Body(..., title="ID 列表")):
         self.ids = ids
+
+
+class IpThrottle:
+    """
+    按照客户端 IP 限制访问频率，滑动窗口，频率配置见 IP_THROTTLE_RATES
+    """
+    def __init__(self, scope: str):
+        self.scope = scope
+
+    async def __call__(self, request: Request):
+        if not settings.IP_THROTTLE_ENABLE:
+            return
+        limit, window = settings.IP_THROTTLE_RATES[self.scope]
+        key = f"ip_throttle:{self.scope}:{request.client.host}"
+        if not await RateLimiter(request.app.state.redis, key, limit, window).acquire():
+            raise CustomException("请求过于频繁，请稍后再试", code=status.HTTP_ERROR)
@@ -8,9 +8,18 @@
 
 
 from fastapi import FastAPI
-from application.settings import REDIS_DB_URL, MONGO_DB_URL, MONGO_DB_NAME, EVENTS
+from application.settings import REDIS_DB_URL, MONGO_DB_URL, MONGO_DB_NAME, EVENTS, OPERATION_LOG_RECORD
+from application import settings
 from core.mongo import db
+from core.middleware import operation_record_writer
+from core.database import engine_manage
+from core.job import job_manage
 from utils.cache import Cache
+from utils.http_client import HttpClient
+from utils.ip_manage import IPManage
+from utils.file.compress.image_pipeline import ImagePipeline
+from utils.file.storage import StorageBackend
+from utils.password_hash import PasswordHash
 import aioredis
 from contextlib import asynccontextmanager
 from utils.tools import import_modules_async
@@ -23,7 +32,31 @@ async def lifespan(app: FastAPI):
 
     yield
 
-    await import_modules_async(EVENTS, "全局事件", app=app, status=False)
+    # 按照启动的相反顺序关闭，后启动的事件可能依赖先启动的连接
+    await import_modules_async(EVENTS[::-1], "全局事件", app=app, status=False)
+
+    await HttpClient.close()
+    PasswordHash.shutdown()
+    StorageBackend.shutdown()
+    ImagePipeline.shutdown()
+
+
+async def connect_mysql(app: FastAPI, status: bool):
+    """
+    把数据库引擎管理挂载到 app 对象上面
+
+    每个数据库地址在进程内只创建一个引擎与连接池，项目关闭时释放所有连接
+    :param app:
+    :param status:
+    :return:
+    """
+    if status:
+        print("Connecting to Mysql")
+        engine_manage.get_session_factory()
+        app.state.engine_manage = engine_manage
+    else:
+        print("Mysql connection closed")
+        await engine_manage.dispose()
 
 
 async def connect_redis(app: FastAPI, status: bool):
@@ -85,10 +118,39 @@ async def connect_mongo(app: FastAPI, status: bool):
     if status:
         print("Connecting to Mongo")
         await db.connect_to_database(path=MONGO_DB_URL, db_name=MONGO_DB_NAME)
+        if OPERATION_LOG_RECORD:
+            operation_record_writer.start()
     else:
         print("Mongo connection closed")
+        # 关闭连接前将队列中剩余的操作日志全部写入
+        await operation_record_writer.stop()
         await db.close_database_connection()
 
 
+async def start_job_workers(app: FastAPI, status: bool):
+    """
+    启动后台任务工作协程
+
+    redis 类型需要在 connect_redis 之后启动
+    :param app:
+    :param status:
+    :return:
+    """
+    if status:
+        print("Starting job workers")
+        job_manage.start(app, settings.JOB_QUEUE_BACKEND, settings.JOB_WORKERS, settings.JOB_RESULT_EXPIRE)
+    else:
+        print("Job workers stopped")
+        await job_manage.stop()
 
 
+async def load_ip_offline(app: FastAPI, status: bool):
+    """
+    在线程中加载离线IP数据，不在第一次解析IP时加载
+    :param app:
+    :param status:
+    :return:
+    """
+    if status:
+        print("Loading offline IP database")
+        await IPManage.load_offline()
@@ -0,0 +1,3 @@
+from .job_manage import JobManage, Job
+
+job_manage = JobManage()
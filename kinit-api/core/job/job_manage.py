@@ -0,0 +1,226 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/16 10:12
+# @File           : job_manage.py
+# @IDE            : PyCharm
+# @desc           : 后台任务队列
+
+"""
+耗时较长的管理操作（导出、导入、批量发送通知等）不在请求中执行，接口只提交任务并返回任务编号，
+由后台工作协程执行，前端通过任务编号查询任务状态、进度与执行结果
+
+队列类型：
+    redis：任务放入 Redis 列表中，所有进程的工作协程共同消费，任务状态保存在 Redis 中，任意进程都可以查询
+    memory：任务放入进程内队列，任务状态保存在进程内，只适用于单进程部署
+
+redis 队列在多台服务器上部署时，任务可能由任意服务器的工作协程执行，而导入任务读取的上传文件与导出任务生成的结果文件
+都保存在本机的 TEMP_DIR 中，所以 TEMP_DIR 必须是所有服务器共享的存储（例如 NFS），否则只能部署在一台服务器上
+
+任务状态：pending：等待执行，running：执行中，success：执行成功，failed：执行失败
+
+任务函数使用 register 注册，参数必须可以 JSON 序列化，第一个参数为 Job 对象，用于更新进度与获取数据库会话
+任务生成的结果文件保存在 TEMP_DIR 中，结果中返回文件链接
+"""
+
+import asyncio
+import datetime
+import json
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, Awaitable, Dict, AsyncIterator
+from aioredis import Redis
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.database import engine_manage, run_commit_callbacks
+from core.logger import logger
+
+
+class Job:
+    """
+    任务执行上下文
+    """
+
+    def __init__(self, manage: "JobManage", data: dict):
+        self.manage = manage
+        self.data = data
+        self.id = data["id"]
+        self.app = manage.app
+
+    @property
+    def redis(self) -> Redis | None:
+        return getattr(self.app.state, "redis", None)
+
+    async def set_progress(self, current: int, total: int = None) -> None:
+        """
+        更新任务进度
+        """
+        self.data["progress"] = {"current": current, "total": total if total is not None else self.total}
+        await self.manage.save(self.data)
+
+    @property
+    def total(self) -> int | None:
+        return (self.data.get("progress") or {}).get("total")
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """
+        获取数据库会话，退出时提交事务并执行事务提交后的回调
+
+        耗时较长的外部调用（发送短信、邮件等）应放在会话之外执行，避免长时间占用事务
+        """
+        async with engine_manage.get_session_factory()() as session:
+            async with session.begin():
+                yield session
+            await run_commit_callbacks(session, self.app)
+
+
+class JobManage:
+
+    QUEUE_KEY = "job_queue"
+    DATA_KEY = "job_data"
+
+    def __init__(self):
+        self.app: FastAPI | None = None
+        self.backend = "memory"
+        self.expire = 86400
+        self.handlers: Dict[str, Callable[..., Awaitable]] = {}
+        self.queue: asyncio.Queue | None = None
+        self.tasks = []
+        # memory 类型时保存任务状态，最多保存 1000 个任务
+        self.datas: OrderedDict = OrderedDict()
+
+    def register(self, name: str):
+        """
+        注册任务函数
+
+        @job_manage.register("export_users")
+        async def export_users(job: Job, **kwargs) -> dict:
+            ...
+        """
+        def decorator(func: Callable[..., Awaitable]):
+            self.handlers[name] = func
+            return func
+        return decorator
+
+    def start(self, app: FastAPI, backend: str = "memory", workers: int = 2, expire: int = 86400) -> None:
+        """
+        启动工作协程，需要在事件循环中调用
+        """
+        if self.tasks:
+            return
+        self.app = app
+        self.backend = backend
+        self.expire = expire
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self.__run()) for _ in range(workers)]
+
+    async def stop(self) -> None:
+        """
+        停止工作协程，正在执行的任务会被取消并标记为失败
+        """
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def submit(self, name: str, user_id: int = None, **kwargs) -> str:
+        """
+        提交任务，返回任务编号
+        """
+        assert name in self.handlers, f"未注册的任务：{name}"
+        assert self.tasks, "后台任务未启动，请在 EVENTS 中添加 core.event.start_job_workers"
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        data = {
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "user_id": user_id,
+            "status": "pending",
+            "progress": None,
+            "result": None,
+            "error": None,
+            "create_datetime": now,
+            "update_datetime": now
+        }
+        await self.save(data)
+        payload = json.dumps({"id": data["id"], "name": name, "kwargs": kwargs})
+        if self.backend == "redis":
+            await self.app.state.redis.rpush(self.QUEUE_KEY, payload)
+        else:
+            self.queue.put_nowait(payload)
+        return data["id"]
+
+    async def get(self, job_id: str) -> dict | None:
+        """
+        获取任务状态
+        """
+        if self.backend == "redis":
+            result = await self.app.state.redis.get(f"{self.DATA_KEY}:{job_id}")
+            return json.loads(result) if result else None
+        return self.datas.get(job_id)
+
+    async def save(self, data: dict) -> None:
+        data["update_datetime"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.backend == "redis":
+            await self.app.state.redis.set(f"{self.DATA_KEY}:{data['id']}", json.dumps(data), ex=self.expire)
+            return
+        self.datas[data["id"]] = data
+        self.datas.move_to_end(data["id"])
+        while len(self.datas) > 1000:
+            self.datas.popitem(last=False)
+
+    async def __get_payload(self) -> str | None:
+        if self.backend == "redis":
+            result = await self.app.state.redis.blpop(self.QUEUE_KEY, timeout=1)
+            return result[1] if result else None
+        return await self.queue.get()
+
+    async def __run(self) -> None:
+        while True:
+            try:
+                payload = await self.__get_payload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"获取后台任务失败：{e}")
+                await asyncio.sleep(1)
+                continue
+            if not payload:
+                continue
+            try:
+                await self.__execute(json.loads(payload))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 任务状态读取或保存失败时记录日志，工作协程继续执行后续任务
+                logger.exception(e)
+
+    async def __execute(self, payload: dict) -> None:
+        data = await self.get(payload["id"])
+        if data is None:
+            return
+        job = Job(self, data)
+        data["status"] = "running"
+        await self.save(data)
+        try:
+            data["result"] = await self.handlers[payload["name"]](job, **payload["kwargs"])
+            data["status"] = "success"
+        except asyncio.CancelledError:
+            data["status"] = "failed"
+            data["error"] = "任务被取消"
+            await self.save(data)
+            raise
+        except Exception as e:
+            logger.exception(e)
+            data["status"] = "failed"
+            data["error"] = getattr(e, "msg", None) or str(e)
+        try:
+            await self.save(data)
+        except Exception as e:
+            # 执行结果无法保存（例如无法 JSON 序列化），记录为执行失败，避免任务一直处于执行中
+            logger.exception(e)
+            data["status"] = "failed"
+            data["result"] = None
+            data["error"] = f"保存任务结果失败：{e}"
+            await self.save(data)
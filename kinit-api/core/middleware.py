@@ -8,27 +8,109 @@
 """
 官方文档——中间件：https://fastapi.tiangolo.com/tutorial/middleware/
 官方文档——高级中间件：https://fastapi.tiangolo.com/advanced/middleware/
+ASGI 中间件：https://www.starlette.io/middleware/#pure-asgi-middleware
+
+所有中间件使用同一个纯 ASGI 中间件 HookMiddleware 实现，不再使用 @app.middleware("http")：
+    @app.middleware("http") 基于 BaseHTTPMiddleware，每个中间件都会增加一次任务切换与响应包装，并且会破坏文件下载等流式响应
+    MIDDLEWARES 中配置的 register_* 函数只向 HookMiddleware 注册钩子，所有钩子共用一次计时与一次响应头注入
+
+钩子类型：
+    before：请求处理前执行，返回 Response 时直接返回该响应，不再继续处理请求
+    headers：响应开始时执行，用于修改响应头
+    after：响应发送完成后执行，不会增加响应时间
 """
 import datetime
 import json
 import time
+from typing import Callable, Awaitable, List
 from fastapi import Request, Response
 from core.logger import logger
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
 from user_agents import parse
 from application.settings import OPERATION_RECORD_METHOD, MONGO_DB_ENABLE, IGNORE_OPERATION_FUNCTION,\
-    DEMO_WHITE_LIST_PATH, DEMO
-from core.mongo import get_database
+    DEMO_WHITE_LIST_PATH, DEMO, OPERATION_RECORD_QUEUE_SIZE, OPERATION_RECORD_BATCH_SIZE, \
+    OPERATION_RECORD_FLUSH_INTERVAL, OPERATION_RECORD_DROP_POLICY, SQLALCHEMY_READ_STICKY_SECONDS
+from core.database import READ_STICKY_COOKIE, READ_STICKY_HEADER
+from core.mongo.batch_writer import MongoBatchWriter
 from utils.response import ErrorResponse
 
 
-def write_request_log(request: Request, response: Response):
+class ResponseInfo:
+    """
+    响应信息，在 headers 与 after 钩子中使用
+    """
+
+    def __init__(self):
+        self.status_code: int | None = None
+        self.content_length: str | None = None
+        self.process_time: float = 0
+
+
+class MiddlewareHooks:
+
+    def __init__(self):
+        self.before: List[Callable[[Request], Awaitable[Response | None]]] = []
+        self.headers: List[Callable[[Request, MutableHeaders], None]] = []
+        self.after: List[Callable[[Request, ResponseInfo], Awaitable[None]]] = []
+
+
+class HookMiddleware:
+    """
+    纯 ASGI 中间件，依次执行注册的钩子
+    """
+
+    def __init__(self, app: ASGIApp, hooks: MiddlewareHooks):
+        self.app = app
+        self.hooks = hooks
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope, receive)
+        for hook in self.hooks.before:
+            response = await hook(request)
+            if response is not None:
+                await response(scope, receive, send)
+                return
+        start_time = time.time()
+        info = ResponseInfo()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                info.process_time = time.time() - start_time
+                info.status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["X-Process-Time"] = str(info.process_time)
+                for header_hook in self.hooks.headers:
+                    header_hook(request, headers)
+                info.content_length = headers.get("content-length")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        for after_hook in self.hooks.after:
+            await after_hook(request, info)
+
+
+def get_middleware_hooks(app: FastAPI) -> MiddlewareHooks:
+    """
+    获取钩子集合，第一次获取时向 app 中添加 HookMiddleware
+    """
+    hooks = getattr(app.state, "middleware_hooks", None)
+    if hooks is None:
+        hooks = MiddlewareHooks()
+        app.state.middleware_hooks = hooks
+        app.add_middleware(HookMiddleware, hooks=hooks)
+    return hooks
+
+
+async def write_request_log(request: Request, info: ResponseInfo):
     http_version = f"http/{request.scope['http_version']}"
-    content_length = response.raw_headers[0][1]
-    process_time = response.headers["X-Process-Time"]
-    content = f"basehttp.log_message: '{request.method} {request.url} {http_version}' {response.status_code}" \
-              f"{response.charset} {content_length} {process_time}"
+    content = f"basehttp.log_message: '{request.method} {request.url} {http_version}' {info.status_code} " \
+              f"{info.content_length} {info.process_time}"
     logger.info(content)
 
 
@@ -38,83 +120,90 @@ def register_request_log_middleware(app: FastAPI):
     :param app:
     :return:
     """
+    get_middleware_hooks(app).after.append(write_request_log)
+
+
+def format_operation_record(record: dict) -> dict:
+    """
+    格式化操作日志，在后台写入任务中执行
+    """
+    user_agent = parse(record.pop("user_agent"))
+    record["system"] = f"{user_agent.os.family} {user_agent.os.version_string}"
+    record["browser"] = f"{user_agent.browser.family} {user_agent.browser.version_string}"
+    body = record.pop("body")
+    query_params = record.pop("query_params")
+    path_params = record.pop("path_params")
+    if not isinstance(body, str):
+        body = body.decode()
+        if body:
+            body = json.loads(body)
+    params = {
+        "body": body,
+        "query_params": query_params if query_params else None,
+        "path_params": path_params if path_params else None,
+    }
+    record["params"] = json.dumps(params)
+    return record
 
-    @app.middleware("http")
-    async def request_log_middleware(request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        response.headers["X-Process-Time"] = str(process_time)
-        write_request_log(request, response)
-        return response
+
+operation_record_writer = MongoBatchWriter(
+    "operation_record",
+    formatter=format_operation_record,
+    queue_size=OPERATION_RECORD_QUEUE_SIZE,
+    batch_size=OPERATION_RECORD_BATCH_SIZE,
+    flush_interval=OPERATION_RECORD_FLUSH_INTERVAL,
+    drop_policy=OPERATION_RECORD_DROP_POLICY
+)
 
 
 def register_operation_record_middleware(app: FastAPI):
     """
     操作记录中间件
     用于将使用认证的操作全部记录到 mongodb 数据库中
+    操作日志放入队列后立即返回，由 operation_record_writer 后台批量写入
     :param app:
     :return:
     """
 
-    @app.middleware("http")
-    async def operation_record_middleware(request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
+    async def operation_record_hook(request: Request, info: ResponseInfo):
         if not MONGO_DB_ENABLE:
-            return response
+            return
         telephone = request.scope.get('telephone', None)
         user_id = request.scope.get('user_id', None)
         user_name = request.scope.get('user_name', None)
         route = request.scope.get('route')
         if not telephone:
-            return response
+            return
         elif request.method not in OPERATION_RECORD_METHOD:
-            return response
+            return
         elif route.name in IGNORE_OPERATION_FUNCTION:
-            return response
-        process_time = time.time() - start_time
-        user_agent = parse(request.headers.get("user-agent"))
-        system = f"{user_agent.os.family} {user_agent.os.version_string}"
-        browser = f"{user_agent.browser.family} {user_agent.browser.version_string}"
-        query_params = dict(request.query_params.multi_items())
-        path_params = request.path_params
-        if isinstance(request.scope.get('body'), str):
-            body = request.scope.get('body')
-        else:
-            body = request.scope.get('body').decode()
-            if body:
-                body = json.loads(body)
-        params = {
-            "body": body,
-            "query_params": query_params if query_params else None,
-            "path_params": path_params if path_params else None,
-        }
-        content_length = response.raw_headers[0][1]
+            return
         assert isinstance(route, APIRoute)
-        document = {
-            "process_time": process_time,
+        # 只保存原始数据，解析 user-agent 与序列化参数在后台写入任务中执行
+        record = {
+            "process_time": info.process_time,
             "telephone": telephone,
             "user_id": user_id,
             "user_name": user_name,
             "request_api": request.url.__str__(),
             "client_ip": request.client.host,
-            "system": system,
-            "browser": browser,
+            "user_agent": request.headers.get("user-agent"),
             "request_method": request.method,
             "api_path": route.path,
             "summary": route.summary,
             "description": route.description,
             "tags": route.tags,
             "route_name": route.name,
-            "status_code": response.status_code,
-            "content_length": content_length,
+            "status_code": info.status_code,
+            "content_length": info.content_length,
             "create_datetime": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "params": json.dumps(params)
+            "body": request.scope.get('body'),
+            "query_params": dict(request.query_params.multi_items()),
+            "path_params": request.path_params
         }
-        db = await get_database()
-        await db.create_data("operation_record", document)
-        return response
+        await operation_record_writer.put(record)
+
+    get_middleware_hooks(app).after.append(operation_record_hook)
 
 
 def register_demo_env_middleware(app: FastAPI):
@@ -124,14 +213,15 @@ def register_demo_env_middleware(app: FastAPI):
     :return:
     """
 
-    @app.middleware("http")
-    async def demo_env_middleware(request: Request, call_next):
+    async def demo_env_hook(request: Request):
         path = request.scope.get("path")
         if request.method != "GET":
             print("路由：", path, request.method)
         if DEMO and request.method != "GET" and path not in DEMO_WHITE_LIST_PATH:
             return ErrorResponse(msg="演示环境，禁止操作")
-        return await call_next(request)
+        return None
+
+    get_middleware_hooks(app).before.append(demo_env_hook)
 
 
 def register_jwt_refresh_middleware(app: FastAPI):
@@ -141,9 +231,32 @@ def register_jwt_refresh_middleware(app: FastAPI):
     :return:
     """
 
-    @app.middleware("http")
-    async def jwt_refresh_middleware(request: Request, call_next):
-        response = await call_next(request)
+    def jwt_refresh_hook(request: Request, headers: MutableHeaders):
         refresh = request.scope.get('if-refresh', 0)
-        response.headers["if-refresh"] = str(refresh)
-        return response
+        headers["if-refresh"] = str(refresh)
+
+    get_middleware_hooks(app).headers.append(jwt_refresh_hook)
+
+
+def register_read_sticky_middleware(app: FastAPI):
+    """
+    主库粘滞中间件
+
+    请求中发生了数据库写入时，设置 SQLALCHEMY_READ_STICKY_SECONDS 秒后过期的主库粘滞 Cookie，
+    同时在响应头中返回粘滞结束的时间戳，不保存 Cookie 的客户端在之后的请求中通过请求头带上，
+    该客户端在有效期内的查询走主库，避免因主从延迟读到自己刚写入之前的旧数据，不影响其他客户端
+    :param app:
+    :return:
+    """
+
+    def read_sticky_hook(request: Request, headers: MutableHeaders):
+        for session in request.scope.get("db_sessions", []):
+            if session.info.get("has_write") or session.new or session.dirty or session.deleted:
+                headers.append(
+                    "set-cookie",
+                    f"{READ_STICKY_COOKIE}=1; Max-Age={SQLALCHEMY_READ_STICKY_SECONDS}; Path=/; HttpOnly; SameSite=Lax"
+                )
+                headers[READ_STICKY_HEADER] = str(int(time.time()) + SQLALCHEMY_READ_STICKY_SECONDS)
+                return
+
+    get_middleware_hooks(app).headers.append(read_sticky_hook)
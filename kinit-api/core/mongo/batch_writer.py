@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/12 15:20
+# @File           : batch_writer.py
+# @IDE            : PyCharm
+# @desc           : MongoDB 异步批量写入
+
+"""
+请求中只将数据放入进程内的有界队列，由后台任务按照数量或时间间隔批量写入 MongoDB
+
+队列已满时的处理策略：
+    drop_new：丢弃新数据
+    drop_old：丢弃队列中最早的数据
+    block：等待队列空闲，最多等待 flush_interval 秒，超时后丢弃新数据
+"""
+
+import asyncio
+from typing import Callable, List
+from core.logger import logger
+from core.mongo import db
+
+
+class MongoBatchWriter:
+
+    DROP_POLICY = ["drop_new", "drop_old", "block"]
+
+    def __init__(
+            self,
+            collection: str,
+            formatter: Callable[[dict], dict] = None,
+            queue_size: int = 10000,
+            batch_size: int = 100,
+            flush_interval: float = 1,
+            drop_policy: str = "drop_new"
+    ):
+        """
+        :param collection: 写入的集合名称
+        :param formatter: 数据格式化函数，在后台任务中执行，不占用请求时间
+        :param queue_size: 队列最大长度
+        :param batch_size: 每批最多写入数量
+        :param flush_interval: 最长写入间隔（秒）
+        :param drop_policy: 队列已满时的处理策略
+        """
+        assert drop_policy in self.DROP_POLICY, f"不支持的队列处理策略：{drop_policy}"
+        self.collection = collection
+        self.formatter = formatter
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.queue: asyncio.Queue | None = None
+        self.task: asyncio.Task | None = None
+        self.written_number = 0
+        self.dropped_number = 0
+        self.failed_number = 0
+
+    def start(self) -> None:
+        """
+        启动后台写入任务，需要在事件循环中调用
+        """
+        if self.task:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.task = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        """
+        停止后台写入任务，并将队列中剩余的数据全部写入
+        """
+        if not self.task:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def put(self, record: dict) -> bool:
+        """
+        将数据放入队列，返回是否成功放入
+        """
+        if not self.queue:
+            self.dropped_number += 1
+            return False
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.drop_policy == "drop_old":
+            self.queue.get_nowait()
+            self.queue.put_nowait(record)
+        elif self.drop_policy == "block":
+            try:
+                await asyncio.wait_for(self.queue.put(record), self.flush_interval)
+                return True
+            except asyncio.TimeoutError:
+                pass
+        self.dropped_number += 1
+        return self.drop_policy == "drop_old"
+
+    def get_status(self) -> dict:
+        """
+        获取写入状态
+        """
+        return {
+            "collection": self.collection,
+            "running": self.task is not None and not self.task.done(),
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue_size,
+            "drop_policy": self.drop_policy,
+            "written_number": self.written_number,
+            "dropped_number": self.dropped_number,
+            "failed_number": self.failed_number
+        }
+
+    async def __run(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch.append(await self.queue.get())
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                records, batch = batch, []
+                # 写入过程中任务被取消时，不中断当前批次的写入
+                await asyncio.shield(self.__write(records))
+        except asyncio.CancelledError:
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            for i in range(0, len(batch), self.batch_size):
+                await self.__write(batch[i:i + self.batch_size])
+            raise
+
+    async def __write(self, records: List[dict]) -> None:
+        documents = self.__format(records) if self.formatter else records
+        if not documents:
+            return
+        try:
+            await db.create_datas(self.collection, documents)
+            self.written_number += len(documents)
+        except Exception as e:
+            self.failed_number += len(documents)
+            logger.error(f"批量写入 MongoDB 失败，集合：{self.collection}，数量：{len(documents)}，报错：{e}")
+
+    def __format(self, records: List[dict]) -> List[dict]:
+        """
+        逐条格式化数据，格式化失败的数据记录日志并计入失败数量，不影响同一批次中的其他数据
+        """
+        documents = []
+        for record in records:
+            try:
+                documents.append(self.formatter(record))
+            except Exception as e:
+                self.failed_number += 1
+                logger.error(f"格式化数据失败，集合：{self.collection}，报错：{e!r}")
+        return documents
@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import Any
+from typing import Any, List
 
 
 class DatabaseManage:
@@ -29,6 +29,10 @@ class DatabaseManage:
     async def create_data(self, collection: str, data: dict):
         pass
 
+    @abstractmethod
+    async def create_datas(self, collection: str, datas: List[dict]):
+        pass
+
     @abstractmethod
     async def get_datas(
             self,
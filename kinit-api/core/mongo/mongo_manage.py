@@ -1,10 +1,10 @@
 import json
-from typing import Any
+from typing import Any, List
 
 from bson.json_util import dumps
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from core.mongo import DatabaseManage
-from pymongo.results import InsertOneResult
+from pymongo.results import InsertOneResult, InsertManyResult
 
 
 class MongoManage(DatabaseManage):
@@ -29,6 +29,12 @@ class MongoManage(DatabaseManage):
     async def create_data(self, collection: str, data: dict) -> InsertOneResult:
         return await self.db[collection].insert_one(data)
 
+    async def create_datas(self, collection: str, datas: List[dict]) -> InsertManyResult:
+        """
+        批量插入，ordered=False 时其中一条失败不会影响其他数据插入
+        """
+        return await self.db[collection].insert_many(datas, ordered=False)
+
     async def get_datas(
             self,
             collection: str,
@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/21 10:40
+# @File           : count.py
+# @IDE            : PyCharm
+# @desc           : 计数并发测试
+
+"""
+同时发起 --number 次计数，对比计数结果是否准确：
+    before：GET 之后再 SET（优化前的 Count.add），并发时会丢失计数，每次计数 3 次往返
+    count：Count.add，INCRBY 与 EXPIRE 在同一个事务中执行，每次计数 1 次往返
+    limiter：RateLimiter.hit，滑动窗口记录，每次计数 1 次往返
+    acquire：RateLimiter.acquire，上限为 --number 的一半，只允许上限数量的请求通过
+
+使用 REDIS_DB_URL 配置的 Redis，测试使用的键在结束后删除
+
+运行：python -m scripts.benchmark.count --number 1000
+"""
+
+import argparse
+import asyncio
+import time
+import aioredis
+from application.settings import REDIS_DB_URL
+from utils.count import Count, RateLimiter
+
+
+async def before_add(rd, key: str, ex: int) -> int:
+    """
+    优化前的 Count.add
+    """
+    number = await rd.get(key)
+    await rd.set(key, int(number or 0) + 1, ex=ex)
+    return int(await rd.get(key))
+
+
+async def run(name: str, number: int, func, result) -> None:
+    start = time.perf_counter()
+    outputs = await asyncio.gather(*[func() for _ in range(number)])
+    total = time.perf_counter() - start
+    expected, actual = await result(outputs)
+    print(f"{name:>8}: {number} 次并发计数，期望 {expected}，实际 {actual}，"
+          f"{'准确' if expected == actual else '不准确'}，耗时 {total * 1000:.0f}ms")
+
+
+async def main(rd, number: int) -> None:
+    key = "benchmark_count"
+    await rd.delete(key)
+
+    async def before_result(_):
+        return number, int(await rd.get(key))
+
+    await run("before", number, lambda: before_add(rd, key, 60), before_result)
+    await rd.delete(key)
+
+    count = Count(rd, key)
+
+    async def count_result(outputs):
+        # 每次返回的计数互不相同，说明没有两个请求读到同一个值
+        return (number, number), (await count.get_count(), len(set(outputs)))
+
+    await run("count", number, lambda: count.add(ex=60), count_result)
+    await rd.delete(key)
+
+    limiter = RateLimiter(rd, key, number // 2, 60)
+
+    async def limiter_result(outputs):
+        return (number, number), (await limiter.get_count(), len(set(outputs)))
+
+    await run("limiter", number, limiter.hit, limiter_result)
+    await limiter.reset()
+
+    async def acquire_result(outputs):
+        return number // 2, sum(outputs)
+
+    await run("acquire", number, limiter.acquire, acquire_result)
+    await limiter.reset()
+
+
+async def connect(number: int) -> None:
+    rd = aioredis.from_url(REDIS_DB_URL, decode_responses=True)
+    try:
+        await main(rd, number)
+    finally:
+        await rd.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="计数并发测试")
+    parser.add_argument("--number", type=int, default=1000, help="并发计数次数")
+    args = parser.parse_args()
+    asyncio.run(connect(args.number))
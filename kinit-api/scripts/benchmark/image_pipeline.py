@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/19 11:30
+# @File           : image_pipeline.py
+# @IDE            : PyCharm
+# @desc           : 图片压缩压测
+
+"""
+使用一组样例图片对比两种压缩方式：
+    before：优化前的处理方式，上传文件先写入临时文件，SSIM 二分查找每一步都写入并读取 tmp.jpg，在事件循环中串行执行
+    pipeline：ImagePipeline，全部在内存中编码，在进程池中执行，同一类图片只计算一次压缩质量，只生成一个版本，与 before 相同
+    renditions：ImagePipeline，一次解码生成 IMAGE_RENDITIONS 中的所有版本
+
+同时启动一个心跳任务，每 10ms 唤醒一次，记录事件循环最大延迟，代表其他请求被阻塞的时间
+
+样例图片：--dir 指定图片目录，不指定时生成 --number 张 2400x1600 的合成图片（渐变、色块与噪点）
+
+运行：python -m scripts.benchmark.image_pipeline --number 20
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import tempfile
+import time
+from PIL import Image, ImageDraw, ImageFilter
+from SSIM_PIL import compare_ssim
+from utils.file.compress.image_pipeline import ImagePipeline
+
+
+def generate_corpus(number: int) -> list:
+    """
+    生成合成样例图片
+    """
+    corpus = []
+    rd = random.Random(2023)
+    for _ in range(number):
+        gradient = Image.linear_gradient("L").resize((2400, 1600))
+        im = Image.merge("RGB", (gradient, gradient.rotate(90, expand=False), gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+        draw = ImageDraw.Draw(im)
+        for _ in range(40):
+            x, y = rd.randint(0, 2400), rd.randint(0, 1600)
+            color = tuple(rd.randint(0, 255) for _ in range(3))
+            draw.ellipse((x, y, x + rd.randint(50, 600), y + rd.randint(50, 600)), fill=color)
+        noise = Image.effect_noise((2400, 1600), 40).convert("RGB")
+        im = Image.blend(im, noise, 0.15).filter(ImageFilter.SMOOTH)
+        buffer = io.BytesIO()
+        im.save(buffer, format="JPEG", quality=95)
+        corpus.append(buffer.getvalue())
+    return corpus
+
+
+def load_corpus(path: str) -> list:
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if os.path.splitext(name)[-1].lower() in (".jpg", ".jpeg", ".png"):
+            with open(os.path.join(path, name), "rb") as f:
+                corpus.append(f.read())
+    return corpus
+
+
+def before_compress(data: bytes, work_dir: str) -> int:
+    """
+    优化前的处理方式：写入临时文件，SSIM 二分查找每一步都通过 tmp.jpg 编码与解码
+    """
+    filename = os.path.join(work_dir, f"{time.time_ns()}.jpg")
+    with open(filename, "wb") as f:
+        f.write(data)
+    im = Image.open(filename).convert("RGB")
+    photo = im.resize((200, 200))
+    ssim_photo = os.path.join(work_dir, "tmp.jpg")
+
+    def get_ssim_at_quality(quality):
+        photo.save(ssim_photo, format="JPEG", quality=quality, progressive=True)
+        return compare_ssim(photo, Image.open(ssim_photo))
+
+    normalized_ssim = get_ssim_at_quality(10)
+    lo, hi, selected = 30, 35, None
+    for _ in range(3):
+        quality = (lo + hi) // 2
+        if get_ssim_at_quality(quality) / normalized_ssim >= 0.9:
+            selected, hi = quality, quality
+        else:
+            lo = quality
+    new_photo = im.copy()
+    new_photo.thumbnail(im.size)
+    new_file = os.path.join(work_dir, f"{time.time_ns()}_new.jpg")
+    new_photo.save(new_file, format="JPEG", quality=selected or hi, optimize=True, progressive=True)
+    return os.path.getsize(new_file)
+
+
+async def heartbeat(stop: asyncio.Event, delays: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        delays.append(time.perf_counter() - start - 0.01)
+
+
+async def run(name: str, corpus: list, func) -> None:
+    stop = asyncio.Event()
+    delays = []
+    beat = asyncio.create_task(heartbeat(stop, delays))
+    # 等待心跳任务开始计时
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    outputs = await func()
+    total = time.perf_counter() - start
+    stop.set()
+    await beat
+    print(
+        f"{name:>10}: {len(corpus)} 张图片，{outputs} 个输出文件，耗时 {total:.2f}s，"
+        f"平均 {total / len(corpus) * 1000:.0f}ms/张，事件循环最大延迟 {max(delays, default=0) * 1000:.0f}ms"
+    )
+
+
+async def main(corpus: list):
+    with tempfile.TemporaryDirectory() as work_dir:
+        async def before():
+            for data in corpus:
+                before_compress(data, work_dir)
+            return len(corpus)
+
+        await run("before", corpus, before)
+
+    # 预先启动进程池，不计入耗时
+    await ImagePipeline.process(corpus[0], "warmup", {"default": {"max_size": 64}})
+
+    async def pipeline():
+        renditions = {"default": {"format": "JPEG"}}
+        await asyncio.gather(*[ImagePipeline.process(data, "benchmark", renditions) for data in corpus])
+        return len(corpus)
+
+    await run("pipeline", corpus, pipeline)
+
+    async def renditions():
+        results = await asyncio.gather(*[ImagePipeline.process(data, "benchmark_renditions") for data in corpus])
+        return sum(len(result) for result in results)
+
+    await run("renditions", corpus, renditions)
+    ImagePipeline.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="图片压缩压测")
+    parser.add_argument("--dir", type=str, default=None, help="样例图片目录")
+    parser.add_argument("--number", type=int, default=20, help="合成样例图片数量，未指定 --dir 时使用")
+    args = parser.parse_args()
+    images = load_corpus(args.dir) if args.dir else generate_corpus(args.number)
+    asyncio.run(main(images))
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/22 10:30
+# @File           : middleware.py
+# @IDE            : PyCharm
+# @desc           : 中间件单次请求开销压测
+
+"""
+对比 0 ~ 4 个中间件时每次请求的平均耗时：
+    before：每个中间件使用 @app.middleware("http")（BaseHTTPMiddleware）叠加（优化前）
+    hooks：所有中间件作为钩子注册到同一个 HookMiddleware（优化后）
+
+中间件依次为：请求日志、操作记录、演示环境、JWT 刷新，与 MIDDLEWARES 中的顺序相同，
+逻辑与项目中的中间件相同，但请求日志只生成日志内容不写入文件，请求未登录所以操作记录直接返回，不访问 MongoDB
+
+直接调用 ASGI 应用，不经过网络与服务器，只统计中间件与路由本身的开销
+
+运行：python -m scripts.benchmark.middleware --number 5000
+"""
+
+import argparse
+import asyncio
+import time
+from fastapi import FastAPI, Request
+from starlette.datastructures import MutableHeaders
+from core.middleware import ResponseInfo, get_middleware_hooks
+from utils.response import ErrorResponse
+
+
+def format_log(request: Request, status_code: int, content_length, process_time) -> str:
+    http_version = f"http/{request.scope['http_version']}"
+    return f"basehttp.log_message: '{request.method} {request.url} {http_version}' {status_code} " \
+           f"{content_length} {process_time}"
+
+
+def add_before_middlewares(app: FastAPI, number: int) -> None:
+    """
+    优化前：每个中间件一个 BaseHTTPMiddleware
+    """
+
+    async def request_log_middleware(request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        response.headers["X-Process-Time"] = str(process_time)
+        format_log(request, response.status_code, response.headers.get("content-length"), process_time)
+        return response
+
+    async def operation_record_middleware(request: Request, call_next):
+        response = await call_next(request)
+        if not request.scope.get("telephone"):
+            return response
+        return response
+
+    async def demo_env_middleware(request: Request, call_next):
+        if request.method != "GET":
+            return ErrorResponse(msg="演示环境，禁止操作")
+        return await call_next(request)
+
+    async def jwt_refresh_middleware(request: Request, call_next):
+        response = await call_next(request)
+        response.headers["if-refresh"] = str(request.scope.get("if-refresh", 0))
+        return response
+
+    middlewares = [request_log_middleware, operation_record_middleware, demo_env_middleware, jwt_refresh_middleware]
+    for middleware in middlewares[:number]:
+        app.middleware("http")(middleware)
+
+
+def add_hooks(app: FastAPI, number: int) -> None:
+    """
+    优化后：所有中间件作为钩子注册到同一个 HookMiddleware
+    """
+
+    async def request_log_hook(request: Request, info: ResponseInfo):
+        format_log(request, info.status_code, info.content_length, info.process_time)
+
+    async def operation_record_hook(request: Request, info: ResponseInfo):
+        if not request.scope.get("telephone"):
+            return
+
+    async def demo_env_hook(request: Request):
+        if request.method != "GET":
+            return ErrorResponse(msg="演示环境，禁止操作")
+        return None
+
+    def jwt_refresh_hook(request: Request, headers: MutableHeaders):
+        headers["if-refresh"] = str(request.scope.get("if-refresh", 0))
+
+    hooks = get_middleware_hooks(app) if number else None
+    registers = [
+        lambda: hooks.after.append(request_log_hook),
+        lambda: hooks.after.append(operation_record_hook),
+        lambda: hooks.before.append(demo_env_hook),
+        lambda: hooks.headers.append(jwt_refresh_hook)
+    ]
+    for register in registers[:number]:
+        register()
+
+
+def create_app(mode: str, number: int) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"code": 200, "message": "success", "data": {"id": item_id, "name": "item"}}
+
+    if mode == "before":
+        add_before_middlewares(app, number)
+    else:
+        add_hooks(app, number)
+    return app
+
+
+async def request(app: FastAPI) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/items/1",
+        "raw_path": b"/items/1",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"127.0.0.1"), (b"user-agent", b"benchmark")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 9000),
+    }
+    status = 0
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        # 请求体读取完成后，再次读取时表示连接已断开
+        if messages:
+            return messages.pop()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run(mode: str, number: int, count: int) -> float:
+    app = create_app(mode, number)
+    # 预热，并确认请求成功
+    for _ in range(100):
+        assert await request(app) == 200
+    start = time.perf_counter()
+    for _ in range(count):
+        await request(app)
+    return (time.perf_counter() - start) / count * 1000000
+
+
+async def main(count: int) -> None:
+    print(f"{'中间件数量':>6} {'before(μs)':>12} {'hooks(μs)':>12}")
+    for number in range(5):
+        before = await run("before", number, count)
+        hooks = await run("hooks", number, count)
+        print(f"{number:>10} {before:>12.1f} {hooks:>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="中间件单次请求开销压测")
+    parser.add_argument("--number", type=int, default=5000, help="每种情况的请求次数")
+    args = parser.parse_args()
+    asyncio.run(main(args.number))
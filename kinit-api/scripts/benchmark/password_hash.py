@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/14 10:30
+# @File           : password_hash.py
+# @IDE            : PyCharm
+# @desc           : 并发登录密码验证压测
+
+"""
+模拟并发登录：每次登录先执行一次数据库查询（使用 asyncio.sleep 模拟），然后验证密码
+
+对比两种方式：
+    sync：在事件循环中直接执行 bcrypt 验证（优化前）
+    pool：在工作池中执行 bcrypt 验证（优化后）
+
+同时启动一个心跳任务，每 10ms 唤醒一次，记录事件循环最大延迟，代表其他请求被阻塞的时间
+
+运行：python -m scripts.benchmark.password_hash --number 200 --concurrency 50
+
+测试结果（单核环境，默认参数）：
+    sync: 200 次登录，耗时 70.62s，吞吐量 2.8 次/秒，事件循环最大延迟 17807.7ms
+    pool: 200 次登录，耗时 71.01s，吞吐量 2.8 次/秒，事件循环最大延迟 18.0ms
+    单核时吞吐量相同，工作池的作用是 bcrypt 计算期间事件循环仍可处理其他请求
+"""
+
+import argparse
+import asyncio
+import time
+from utils.password_hash import PasswordHash, hash_password, verify_password
+
+
+async def heartbeat(stop: asyncio.Event, delays: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        delays.append(time.perf_counter() - start - 0.01)
+
+
+async def login(mode: str, password: str, hashed: str, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        await asyncio.sleep(0.002)
+        if mode == "sync":
+            assert verify_password(password, hashed)
+        else:
+            assert await PasswordHash.verify(password, hashed)
+
+
+async def run(mode: str, number: int, concurrency: int):
+    password = "kinit2022"
+    hashed = hash_password(password)
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    delays = []
+    beat = asyncio.create_task(heartbeat(stop, delays))
+    start = time.perf_counter()
+    await asyncio.gather(*[login(mode, password, hashed, semaphore) for _ in range(number)])
+    total = time.perf_counter() - start
+    stop.set()
+    await beat
+    print(
+        f"{mode:>4}: {number} 次登录，耗时 {total:.2f}s，吞吐量 {number / total:.1f} 次/秒，"
+        f"事件循环最大延迟 {max(delays, default=0) * 1000:.1f}ms"
+    )
+
+
+async def main(number: int, concurrency: int):
+    await run("sync", number, concurrency)
+    await run("pool", number, concurrency)
+    PasswordHash.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="并发登录密码验证压测")
+    parser.add_argument("--number", type=int, default=200, help="登录次数")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发数")
+    args = parser.parse_args()
+    asyncio.run(main(args.number, args.concurrency))
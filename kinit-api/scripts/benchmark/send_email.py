@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/17 15:20
+# @File           : send_email.py
+# @IDE            : PyCharm
+# @desc           : 邮件发送压测
+
+"""
+使用本地 SMTP 替身 utils.local_smtp.LocalSMTPServer，对比两种方式发送 1000 封邮件：
+    before：每封邮件新建连接并在事件循环中直接发送（优化前）
+    pool：连接池复用连接，在线程中并发发送（优化后）
+
+运行：python -m scripts.benchmark.send_email --number 1000 --latency 0.005
+"""
+
+import argparse
+import asyncio
+import smtplib
+import time
+from email.mime.text import MIMEText
+from utils.local_smtp import LocalSMTPServer
+from utils.send_email import SMTPConnectionPool
+
+
+async def before(server: LocalSMTPServer, number: int) -> None:
+    for i in range(number):
+        conn = smtplib.SMTP(server.host, server.port)
+        message = MIMEText(f"您好，您的密码已经重置为{i}，请及时登录并修改密码。")
+        message["Subject"] = "密码已重置"
+        conn.sendmail("admin@localhost", [f"user{i}@localhost"], message.as_string())
+        conn.quit()
+
+
+async def pool(server: LocalSMTPServer, number: int, size: int) -> None:
+    smtp_pool = SMTPConnectionPool(server.host, server.port, "admin@localhost", "", size=size, starttls=False)
+    await asyncio.gather(*[
+        smtp_pool.send([f"user{i}@localhost"], "密码已重置", f"您好，您的密码已经重置为{i}，请及时登录并修改密码。")
+        for i in range(number)
+    ])
+    for conn, _ in smtp_pool.idle:
+        smtp_pool.close(conn)
+
+
+async def main(number: int, latency: float, size: int) -> None:
+    server = LocalSMTPServer(latency=latency)
+    server.start()
+    for name, coro in (("before", before(server, number)), ("pool", pool(server, number, size))):
+        server.messages.clear()
+        start = time.perf_counter()
+        await coro
+        total = time.perf_counter() - start
+        print(f"{name:>6}: {len(server.messages)} 封邮件，耗时 {total:.2f}s，吞吐量 {number / total:.1f} 封/秒")
+    server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="邮件发送压测")
+    parser.add_argument("--number", type=int, default=1000, help="邮件数量")
+    parser.add_argument("--latency", type=float, default=0.005, help="SMTP 替身每条命令的延迟（秒）")
+    parser.add_argument("--size", type=int, default=5, help="连接池大小")
+    args = parser.parse_args()
+    asyncio.run(main(args.number, args.latency, args.size))
@@ -7,7 +7,7 @@
 # @desc           : 简要说明
 
 from enum import Enum
-from core.database import db_getter
+from core.database import engine_manage
 from utils.excel.excel_manage import ExcelManage
 from application.settings import BASE_DIR, VERSION
 import os
@@ -79,17 +79,16 @@ class InitializeData:
         @params table_name: 表名
         @params model: 数据表模型
         """
-        async_session = db_getter()
-        db = await async_session.__anext__()
-        if isinstance(model, Table):
-            for data in self.datas.get(table_name):
-                await db.execute(model.insert().values(**data))
-        else:
-            for data in self.datas.get(table_name):
-                db.add(model(**data))
-        print(f"{table_name} 表数据已生成")
-        await db.flush()
-        await db.commit()
+        async with engine_manage.get_session_factory()() as db:
+            if isinstance(model, Table):
+                for data in self.datas.get(table_name):
+                    await db.execute(model.insert().values(**data))
+            else:
+                for data in self.datas.get(table_name):
+                    db.add(model(**data))
+            print(f"{table_name} 表数据已生成")
+            await db.flush()
+            await db.commit()
 
     async def generate_menu(self):
         """
@@ -152,4 +151,5 @@ class InitializeData:
         await self.generate_dict_type()
         await self.generate_system_config()
         await self.generate_dict_details()
+        await engine_manage.dispose()
         print(f"环境：{env} {VERSION} 数据已初始化完成")
@@ -0,0 +1,17 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/22 15:00
+# @File           : conftest.py
+# @IDE            : PyCharm
+# @desc           : 测试配置
+
+"""
+安装测试依赖：pip3 install -r requirements-dev.txt（pytest、fakeredis，以及 fakeredis 执行 Lua 脚本所需的 lupa）
+运行：在 kinit-api 目录下执行 python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/23 11:00
+# @File           : test_count.py
+# @IDE            : PyCharm
+# @desc           : 计数并发测试
+
+"""
+同时发起 1000 次计数，检查 Count 与 RateLimiter 的计数结果准确，RateLimiter.acquire 只放行上限数量的请求
+
+Redis 使用 fakeredis（RateLimiter 的 Lua 脚本需要 lupa），安装 requirements-dev.txt 中的测试依赖
+"""
+
+import asyncio
+import fakeredis.aioredis as fakeredis
+from utils.count import Count, RateLimiter
+
+NUMBER = 1000
+
+
+def create_redis():
+    # 1000 个并发请求同时占用连接
+    return fakeredis.FakeRedis(decode_responses=True, max_connections=NUMBER)
+
+
+async def gather(func) -> list:
+    return await asyncio.gather(*[func() for _ in range(NUMBER)])
+
+
+def test_count_add():
+    async def run():
+        count = Count(create_redis(), "count")
+        return await gather(lambda: count.add(ex=60)), await count.get_count()
+
+    outputs, total = asyncio.run(run())
+    # 每次返回的计数互不相同，说明没有两个请求读到同一个值
+    assert sorted(outputs) == list(range(1, NUMBER + 1))
+    assert total == NUMBER
+
+
+def test_rate_limiter_hit():
+    async def run():
+        limiter = RateLimiter(create_redis(), "limiter", 0, 60)
+        return await gather(limiter.hit), await limiter.get_count()
+
+    outputs, total = asyncio.run(run())
+    assert sorted(outputs) == list(range(1, NUMBER + 1))
+    assert total == NUMBER
+
+
+def test_rate_limiter_acquire():
+    async def run():
+        limiter = RateLimiter(create_redis(), "limiter", 500, 60)
+        return await gather(limiter.acquire), await limiter.get_count()
+
+    outputs, total = asyncio.run(run())
+    assert sum(outputs) == 500
+    assert total == 500
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/23 10:00
+# @File           : test_job_manage.py
+# @IDE            : PyCharm
+# @desc           : 后台任务队列测试
+
+"""
+使用 redis 队列（fakeredis）测试 JobManage：任务执行结果无法保存时标记为失败，工作协程不会因此退出
+"""
+
+import asyncio
+import fakeredis.aioredis as fakeredis
+from fastapi import FastAPI
+from core.job.job_manage import JobManage
+
+
+async def wait_done(manage: JobManage, job_id: str) -> dict:
+    for _ in range(100):
+        data = await manage.get(job_id)
+        if data["status"] in ("success", "failed"):
+            return data
+        await asyncio.sleep(0.05)
+    raise AssertionError("任务未执行完成")
+
+
+def test_unserializable_result_marked_failed():
+    async def run():
+        app = FastAPI()
+        app.state.redis = fakeredis.FakeRedis(decode_responses=True)
+        manage = JobManage()
+
+        @manage.register("bad")
+        async def bad(job):
+            return object()
+
+        @manage.register("good")
+        async def good(job, value: int):
+            return value
+
+        manage.start(app, backend="redis", workers=1)
+        try:
+            bad_data = await wait_done(manage, await manage.submit("bad"))
+            good_data = await wait_done(manage, await manage.submit("good", value=1))
+        finally:
+            await manage.stop()
+        return bad_data, good_data
+
+    bad_data, good_data = asyncio.run(run())
+    assert bad_data["status"] == "failed"
+    assert bad_data["error"].startswith("保存任务结果失败")
+    assert good_data["status"] == "success"
+    assert good_data["result"] == 1
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/23 14:30
+# @File           : test_send_email.py
+# @IDE            : PyCharm
+# @desc           : 邮件连接池测试
+
+"""
+使用本地 SMTP 替身 LocalSMTPServer 测试 SMTPConnectionPool：连接复用、空闲重连、连接断开重试、附件分块发送
+"""
+
+import asyncio
+import email
+import os
+from email.header import decode_header, make_header
+import pytest
+from application import settings
+from utils.local_smtp import LocalSMTPServer
+from utils.send_email import SMTPConnectionPool, SMTPDataDisconnected
+
+
+@pytest.fixture
+def server():
+    server = LocalSMTPServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+def create_pool(server: LocalSMTPServer) -> SMTPConnectionPool:
+    return SMTPConnectionPool(server.host, server.port, "admin@localhost", "", size=1, starttls=False)
+
+
+def send(pool: SMTPConnectionPool, number: int = 1, attachments: list = None, before=None) -> list:
+    async def run():
+        results = []
+        for i in range(number):
+            if before:
+                before()
+            results.append(await pool.send([f"user{i}@localhost"], "测试", f"内容{i}", attachments))
+        for conn, _ in pool.idle:
+            pool.close(conn)
+        return results
+
+    return asyncio.run(run())
+
+
+def test_pool_reuse(server):
+    assert send(create_pool(server), 3) == [True, True, True]
+    assert len(server.messages) == 3
+    assert server.connections == 1
+
+
+def test_idle_reconnect(server, monkeypatch):
+    monkeypatch.setattr(settings, "EMAIL_POOL_IDLE_TIMEOUT", 0)
+    assert send(create_pool(server), 2) == [True, True]
+    assert len(server.messages) == 2
+    assert server.connections == 2
+
+
+def test_disconnect_before_data_retried(server):
+    # 每封邮件发送前服务器断开所有连接，连接池中的连接已失效，重新连接发送
+    assert send(create_pool(server), 2, before=server.disconnect_all) == [True, True]
+    assert len(server.messages) == 2
+    assert server.connections == 2
+
+
+def test_disconnect_after_data_not_retried(server):
+    server.drop_after_data = 1
+    with pytest.raises(SMTPDataDisconnected):
+        send(create_pool(server))
+    # 服务器已经收到邮件，不能重新发送
+    assert len(server.messages) == 1
+    assert server.connections == 1
+
+
+def test_chunked_attachment(server, tmp_path):
+    content = os.urandom(SMTPConnectionPool.CHUNK_SIZE * 2 + 100)
+    path = tmp_path / "附件.bin"
+    path.write_bytes(content)
+    assert send(create_pool(server), attachments=[str(path)]) == [True]
+    message = email.message_from_bytes(server.messages[0])
+    body, attachment = message.get_payload()
+    assert body.get_payload(decode=True).decode() == "内容0"
+    assert attachment.get_payload(decode=True) == content
+    assert str(make_header(decode_header(attachment.get_filename()))) == "附件.bin"
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/22 15:00
+# @File           : test_sms_dispatcher.py
+# @IDE            : PyCharm
+# @desc           : 批量短信发送测试
+
+"""
+使用本地短信替身 LocalSMSProvider 测试 SMSDispatcher.send_many：发送间隔限制、临时错误重试、永久错误不重试、令牌桶限速
+
+Redis 使用 fakeredis（RateLimiter 的 Lua 脚本需要 lupa），安装 requirements-dev.txt 中的测试依赖
+"""
+
+import asyncio
+import json
+import time
+import fakeredis.aioredis as fakeredis
+from application import settings
+from utils.aliyun_sms import AliyunSMS
+from utils.sms_dispatcher import SMSDispatcher, LocalSMSProvider, TokenBucket
+
+ALIYUN_SMS = {
+    "sms_send_interval": "60",
+    "sms_valid_time": "300",
+    "sms_sign_name_1": "登录签名",
+    "sms_sign_name_2": "通知签名",
+    "sms_template_code_1": "SMS_1",
+    "sms_template_code_2": "SMS_2",
+    "sms_access_key": "",
+    "sms_access_key_secret": ""
+}
+
+
+async def create_redis():
+    rd = fakeredis.FakeRedis(decode_responses=True)
+    await rd.set("aliyun_sms", json.dumps(ALIYUN_SMS))
+    return rd
+
+
+def send_many(provider: LocalSMSProvider, messages: list, rate: float = 100) -> list:
+    async def run():
+        rd = await create_redis()
+        dispatcher = SMSDispatcher(rd, AliyunSMS.Scene.reset_password, provider)
+        dispatcher.bucket = TokenBucket(rate)
+        results = await dispatcher.send_many(messages)
+        return results, await rd.get(messages[0][0])
+
+    return asyncio.run(run())
+
+
+def test_send_many_success():
+    provider = LocalSMSProvider()
+    messages = [(f"1380000000{i}", {"password": f"pw{i}"}) for i in range(5)]
+    results, value = send_many(provider, messages)
+    assert [i["telephone"] for i in results] == [i[0] for i in messages]
+    assert all(i["status"] for i in results)
+    assert len(provider.messages) == 5
+    assert provider.messages[0][1:3] == ("通知签名", "SMS_2")
+    assert value == "pw0"
+
+
+def test_send_interval_limit():
+    provider = LocalSMSProvider()
+    results, _ = send_many(provider, [("13800000000", {"password": "a"}), ("13800000000", {"password": "b"})])
+    assert sorted(i["status"] for i in results) == [False, True]
+    assert [i["msg"] for i in results if not i["status"]] == ["短信发送频繁"]
+    assert len(provider.messages) == 1
+
+
+def test_transient_error_retry(monkeypatch):
+    monkeypatch.setattr(settings, "SMS_SEND_RETRY", 2)
+    provider = LocalSMSProvider(codes={"13800000000": ["Throttling", "isp.SYSTEM_ERROR"]})
+    results, _ = send_many(provider, [("13800000000", {"password": "a"})])
+    assert results[0]["status"]
+    assert provider.codes["13800000000"] == []
+    assert len(provider.messages) == 1
+
+
+def test_transient_error_retry_exhausted(monkeypatch):
+    monkeypatch.setattr(settings, "SMS_SEND_RETRY", 1)
+    provider = LocalSMSProvider(codes={"13800000000": ["Throttling", "Throttling", "OK"]})
+    results, _ = send_many(provider, [("13800000000", {"password": "a"})])
+    assert not results[0]["status"]
+    # 重试 1 次，第 3 个返回码没有使用
+    assert provider.codes["13800000000"] == ["OK"]
+    assert provider.messages == []
+
+
+def test_permanent_error_not_retried(monkeypatch):
+    monkeypatch.setattr(settings, "SMS_SEND_RETRY", 3)
+    provider = LocalSMSProvider(codes={"13800000000": ["isv.MOBILE_NUMBER_ILLEGAL", "OK"]})
+    results, value = send_many(provider, [("13800000000", {"password": "a"})])
+    assert not results[0]["status"]
+    assert provider.codes["13800000000"] == ["OK"]
+    assert value is None
+
+
+def test_token_bucket_pacing():
+    provider = LocalSMSProvider()
+    messages = [(f"138000{i:05d}", {"password": "a"}) for i in range(30)]
+    start = time.monotonic()
+    results, _ = send_many(provider, messages, rate=20)
+    elapsed = time.monotonic() - start
+    assert all(i["status"] for i in results)
+    # 令牌桶容量为 20，其余 10 条按照每秒 20 条发送
+    assert elapsed >= 0.45
@@ -24,13 +24,14 @@ import re
 from enum import Enum, unique
 from core.exception import CustomException
 from alibabacloud_dysmsapi20170525.client import Client as Dysmsapi20170525Client
-from alibabacloud_tea_openapi import models as open_api_models
 from alibabacloud_dysmsapi20170525 import models as dysmsapi_20170525_models
 from alibabacloud_tea_util import models as util_models
 from core.logger import logger
 import datetime
 from aioredis.client import Redis
 from utils.cache import Cache
+from utils.count import RateLimiter
+from utils.sms_dispatcher import AliyunSMSProvider
 from utils import status
 
 
@@ -71,13 +72,26 @@ class AliyunSMS:
         主程序入口，异步方式
         """
         send_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if await self.rd.get(self.telephone + "_flag_"):
+        self.scene = scene
+        await self.__get_settings()
+        # 发送间隔内只允许发送一次，先记录再发送，同时提交的请求只有一个能够发送
+        limiter = self.get_send_limiter(self.rd, self.telephone, self.send_interval)
+        if not await limiter.acquire():
             logger.error(f'{send_time} {self.telephone} 短信发送失败，短信发送过于频繁')
             print(f"{self.telephone} 短信发送频繁")
             raise CustomException(msg="短信发送频繁", code=status.HTTP_ERROR)
-        self.scene = scene
-        await self.__get_settings()
-        return await self.__send(**kwargs)
+        result = await self.__send(**kwargs)
+        if not result:
+            # 发送失败不占用发送间隔
+            await limiter.reset()
+        return result
+
+    @staticmethod
+    def get_send_limiter(rd: Redis, telephone: str, send_interval: int = 0) -> RateLimiter:
+        """
+        短信发送间隔限制，批量发送（SMSDispatcher）使用同一个键
+        """
+        return RateLimiter(rd, telephone + "_send_flag", 1, send_interval)
 
     async def __send(self, **kwargs) -> bool:
         """
@@ -121,7 +135,6 @@ class AliyunSMS:
         if resp.body.code == "OK":
             logger.info(f'{send_time} {self.telephone} 短信发送成功，返回code：{resp.body.code}')
             await self.rd.set(self.telephone, self.code, self.valid_time)
-            await self.rd.set(self.telephone + "_flag_", self.code, self.send_interval)
             return True
         else:
             logger.error(f'{send_time} {self.telephone} 短信发送失败，返回code：{resp.body.code}，请参考文档：{self.doc}')
@@ -133,7 +146,7 @@ class AliyunSMS:
         """
         if code and code == await self.rd.get(self.telephone):
             await self.rd.delete(self.telephone)
-            await self.rd.delete(self.telephone + "_flag_")
+            await self.get_send_limiter(self.rd, self.telephone).reset()
             return True
         return False
 
@@ -181,14 +194,8 @@ class AliyunSMS:
         :param access_key_secret:
         :return: Client
         :throws Exception
+
+        每个 AccessKey 在进程内只创建一个客户端
         """
-        config = open_api_models.Config(
-            # 您的 AccessKey ID,
-            access_key_id=access_key_id,
-            # 您的 AccessKey Secret,
-            access_key_secret=access_key_secret
-        )
-        # 访问的域名
-        config.endpoint = f'dysmsapi.aliyuncs.com'
-        return Dysmsapi20170525Client(config)
+        return AliyunSMSProvider.get_client(access_key_id, access_key_secret)
 
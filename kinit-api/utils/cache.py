@@ -6,10 +6,17 @@
 # @IDE            : PyCharm
 # @desc           : 缓存
 
-from typing import List
-from core import logger
-from core.database import db_getter
-from apps.vadmin.system.crud import SettingsTabDal
+"""
+系统配置缓存，每个配置标签（tab_name）在 Redis 中保存为一个键
+
+加载：一次查询获取所有配置标签，一次 MSET 写入 Redis
+缓存未命中：同一个配置标签在进程内同时只加载一次，其他请求等待加载完成后重新读取，避免缓存为空时大量请求同时查询数据库
+"""
+
+import asyncio
+from typing import Dict, List
+from core.logger import logger
+from core.database import engine_manage
 import json
 from aioredis.client import Redis
 from core.exception import CustomException
@@ -20,36 +27,60 @@ class Cache:
 
     DEFAULT_TAB_NAMES = ["wx_server", "aliyun_sms", "aliyun_oss"]
 
+    # 正在加载的配置标签，加载完成后设置结果
+    pending: Dict[str, asyncio.Future] = {}
+
     def __init__(self, rd: Redis):
         self.rd = rd
 
-    async def cache_tab_names(self, tab_names: List[str] = None):
+    async def cache_tab_names(self, tab_names: List[str] = None) -> dict:
         """
         缓存系统配置
         如果手动修改了mysql数据库中的配置
         那么需要在redis中将对应的tab_name删除
+
+        :return: {配置标签: 配置信息}，不包括数据库中不存在的配置标签
         """
-        async_session = db_getter()
-        session = await async_session.__anext__()
-        if tab_names:
-            datas = await SettingsTabDal(session).get_tab_name_values(tab_names, hidden=None)
-        else:
-            datas = await SettingsTabDal(session).get_tab_name_values(self.DEFAULT_TAB_NAMES, hidden=None)
-        for k, v in datas.items():
-            await self.rd.client().set(k, json.dumps(v))
+        # 在使用时导入，避免 utils.cache -> apps -> utils.aliyun_sms -> utils.cache 循环导入
+        from apps.vadmin.system.crud import SettingsTabDal
+        async with engine_manage.get_session_factory()() as session:
+            datas = await SettingsTabDal(session).get_tab_name_values(tab_names or self.DEFAULT_TAB_NAMES, hidden=None)
+        if datas:
+            await self.rd.mset({k: json.dumps(v) for k, v in datas.items()})
+        return datas
 
     async def get_tab_name(self, tab_name: str, retry: int = 3):
         """
         获取系统配置
         :params tab_name: 配置表标签名称
-        :params retry_num: 重试次数
+        :params retry: 加载失败（例如数据库连接异常）时的重试次数
         """
-        result = await self.rd.get(tab_name)
-        if not result and retry > 0:
-            logger.error(f"未从Redis中获取到{tab_name}配置信息，正在重新更新配置信息，重试次数：{retry}。")
-            await self.cache_tab_names([tab_name])
-            return await self.get_tab_name(tab_name, retry - 1)
-        elif not result and retry == 0:
-            raise CustomException(f"获取{tab_name}配置信息失败，请联系管理员！", code=status.HTTP_ERROR)
-        else:
-            return json.loads(result)
+        attempt = 0
+        while True:
+            result = await self.rd.get(tab_name)
+            if result:
+                return json.loads(result)
+            future = self.pending.get(tab_name)
+            if future is not None:
+                # 其他请求正在加载，加载完成后重新读取
+                await future
+                continue
+            if attempt > retry:
+                break
+            attempt += 1
+            logger.error(f"未从Redis中获取到{tab_name}配置信息，正在重新更新配置信息，第 {attempt} 次。")
+            future = asyncio.get_running_loop().create_future()
+            self.pending[tab_name] = future
+            try:
+                datas = await self.cache_tab_names([tab_name])
+            except Exception as e:
+                logger.error(f"更新{tab_name}配置信息失败，报错：{e!r}")
+                continue
+            finally:
+                future.set_result(None)
+                self.pending.pop(tab_name, None)
+            if tab_name not in datas:
+                # 数据库中不存在该配置，不再重试
+                break
+            return datas[tab_name]
+        raise CustomException(f"获取{tab_name}配置信息失败，请联系管理员！", code=status.HTTP_ERROR)
@@ -6,7 +6,14 @@
 # @IDE            : PyCharm
 # @desc           : 计数
 
+"""
+Count：计数，INCRBY/DECRBY 与 EXPIRE 在同一个事务中执行，一次往返，并发时不会丢失计数
+RateLimiter：滑动窗口限流，使用有序集合记录窗口内每次请求的时间，清理、计数与记录在同一个 Lua 脚本中原子执行
+"""
 
+import time
+import uuid
+from typing import Tuple
 from aioredis.client import Redis
 
 
@@ -19,13 +26,22 @@ class Count:
         self.rd = rd
         self.key = key
 
-    async def add(self, ex: int = None) -> int:
-        await self.rd.set(self.key, await self.get_count() + 1, ex=ex)
-        return await self.get_count()
+    async def add(self, ex: int = None, amount: int = 1) -> int:
+        return await self.__incr(amount, ex)
 
-    async def subtract(self, ex: int = None) -> int:
-        await self.rd.set(self.key, await self.get_count() - 1, ex=ex)
-        return await self.get_count()
+    async def subtract(self, ex: int = None, amount: int = 1) -> int:
+        return await self.__incr(-amount, ex)
+
+    async def __incr(self, amount: int, ex: int = None) -> int:
+        """
+        原子增减计数，并在同一个事务中设置过期时间
+        """
+        async with self.rd.pipeline(transaction=True) as pipe:
+            pipe.incrby(self.key, amount)
+            if ex:
+                pipe.expire(self.key, ex)
+            result = await pipe.execute()
+        return int(result[0])
 
     async def get_count(self) -> int:
         number = await self.rd.get(self.key)
@@ -38,3 +54,64 @@ class Count:
 
     async def delete(self) -> None:
         await self.rd.delete(self.key)
+
+
+class RateLimiter:
+    """
+    滑动窗口限流
+
+    :param rd: Redis
+    :param key: 限流键
+    :param limit: 窗口内最多允许的次数
+    :param window: 窗口大小（秒）
+    """
+
+    # 清理窗口外的记录，次数未达到上限（或 ARGV[3] 为 0，只记录不限制）时记录本次请求
+    # 返回 {是否记录, 窗口内次数}
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local window = tonumber(ARGV[2])
+    local limit = tonumber(ARGV[3])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+    local count = redis.call('ZCARD', KEYS[1])
+    if limit > 0 and count >= limit then
+        return {0, count}
+    end
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, count + 1}
+    """
+
+    def __init__(self, rd: Redis, key: str, limit: int, window: int):
+        self.rd = rd
+        self.key = key
+        self.limit = limit
+        self.window = window
+        self.script = rd.register_script(self.SCRIPT)
+
+    async def __call(self, limit: int) -> Tuple[bool, int]:
+        now = int(time.time() * 1000)
+        member = f"{now}-{uuid.uuid4().hex[:8]}"
+        allowed, count = await self.script(keys=[self.key], args=[now, self.window * 1000, limit, member])
+        return bool(allowed), int(count)
+
+    async def acquire(self) -> bool:
+        """
+        窗口内次数未达到上限时记录本次请求并返回 True，否则返回 False
+        """
+        allowed, _ = await self.__call(self.limit)
+        return allowed
+
+    async def hit(self) -> int:
+        """
+        记录一次，不限制次数，返回记录后窗口内的次数，用于累计失败次数
+        """
+        _, count = await self.__call(0)
+        return count
+
+    async def get_count(self) -> int:
+        now = int(time.time() * 1000)
+        return await self.rd.zcount(self.key, now - self.window * 1000 + 1, "+inf")
+
+    async def reset(self) -> None:
+        await self.rd.delete(self.key)
@@ -37,15 +37,20 @@ class ImportManage:
 
     file_type = ["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"]
 
-    def __init__(self, file: UploadFile, headers: List[dict]):
+    def __init__(self, file: UploadFile | str, headers: List[dict]):
+        """
+        :param file: 上传文件，或者已经保存到本地的文件路径（后台任务中使用）
+        :param headers: 表头
+        """
         self.__table_data = None
         self.__table_header = None
-        self.__filename = None
+        self.__filename = file if isinstance(file, str) else None
         self.errors = []
         self.success = []
         self.success_number = 0
         self.error_number = 0
-        self.check_file_type(file)
+        if not self.__filename:
+            self.check_file_type(file)
         self.file = file
         self.headers = headers
 
@@ -61,7 +66,8 @@ class ImportManage:
         """
         获取表格数据与表头
         """
-        self.__filename = await FileManage.save_tmp_file(self.file)
+        if not self.__filename:
+            self.__filename = await FileManage.save_tmp_file(self.file)
         es = ExcelManage()
         es.open_sheet(self.__filename, read_only=True)
         self.__table_header = es.get_header(1, len(self.headers), asterisk=True)
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/15 14:20
+# @File           : stream_xlsx.py
+# @IDE            : PyCharm
+# @desc           : 流式写入xlsx文件
+
+"""
+XlsxWriter constant_memory 模式：https://xlsxwriter.readthedocs.io/working_with_memory.html
+
+用于大数据量导出：
+1. constant_memory 模式下每写完一行就写入临时文件，内存中只保留当前行
+2. 所有单元格共用同一个样式对象
+3. 列宽只根据前 sample_size 行数据估算，不需要遍历全部数据
+4. 文件写入系统临时目录，通过 iter_bytes 分块读取后返回给客户端，读取完成后删除
+"""
+
+import datetime
+import os
+import re
+import tempfile
+from typing import Iterator, List
+import xlsxwriter
+
+
+class StreamXlsx:
+    """
+    流式写入xlsx文件，行数据必须按顺序写入
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, sheet_name: str = "sheet1", header: List[str] = None, sample_size: int = 100):
+        """
+        :param sheet_name: 表单名称
+        :param header: 表头
+        :param sample_size: 估算列宽使用的行数
+        """
+        fd, self.filename = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        self.wb = xlsxwriter.Workbook(self.filename, {"constant_memory": True})
+        self.sheet = self.wb.add_worksheet(sheet_name)
+        font_format = {
+            'bold': False,  # 字体加粗
+            'align': 'center',  # 水平位置设置：居中
+            'valign': 'vcenter',  # 垂直位置设置，居中
+            'font_size': 11,  # '字体大小设置'
+        }
+        self.cell_format = self.wb.add_format(font_format)
+        self.date_format = self.wb.add_format({**font_format, "num_format": "yyyy/mm/dd h:mm:ss"})
+        self.sample_size = sample_size
+        self.widths = {}
+        self.row_number = 0
+        if header:
+            self.write_row(header)
+
+    def write_row(self, row: list) -> None:
+        """
+        写入一行数据
+        """
+        sample = self.row_number <= self.sample_size
+        for col, value in enumerate(row):
+            if isinstance(value, datetime.datetime):
+                self.sheet.write_datetime(self.row_number, col, value, self.date_format)
+                if sample:
+                    self.widths[col] = max(self.widths.get(col, 0), 19)
+                continue
+            self.sheet.write(self.row_number, col, value, self.cell_format)
+            if sample and value is not None:
+                # 中文字符识别为1.7个长度
+                text = str(value)
+                width = 0.7 * len(re.findall('([\u4e00-\u9fa5])', text)) + len(text)
+                self.widths[col] = max(self.widths.get(col, 0), width)
+        self.row_number += 1
+
+    def write_rows(self, rows: List[list]) -> None:
+        """
+        写入多行数据
+        """
+        for row in rows:
+            self.write_row(row)
+
+    def close(self) -> None:
+        """
+        设置列宽并完成文件写入
+        """
+        for col, width in self.widths.items():
+            self.sheet.set_column(col, col, width + 10)
+        self.wb.close()
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        """
+        分块读取文件内容，读取完成后删除文件，用于 StreamingResponse
+        """
+        try:
+            with open(self.filename, "rb") as f:
+                while chunk := f.read(self.CHUNK_SIZE):
+                    yield chunk
+        finally:
+            self.remove()
+
+    def remove(self) -> None:
+        """
+        删除临时文件
+
+        写入失败时工作簿还没有关闭，先关闭工作簿，释放 constant_memory 模式下每个表单的行数据临时文件与文件句柄，
+        关闭失败时直接关闭并删除行数据临时文件
+        """
+        if not self.wb.fileclosed:
+            try:
+                self.wb.close()
+            except Exception:
+                pass
+            for sheet in self.wb.worksheets():
+                if sheet.row_data_fh and not sheet.row_data_fh.closed:
+                    sheet.row_data_fh.close()
+                if sheet.row_data_filename and os.path.exists(sheet.row_data_filename):
+                    os.remove(sheet.row_data_filename)
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
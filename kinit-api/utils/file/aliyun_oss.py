@@ -6,15 +6,13 @@
 # @IDE            : PyCharm
 # @desc           : 阿里云对象存储
 
+import asyncio
 import os.path
 from fastapi import UploadFile
 from pydantic import BaseModel
-import oss2  # 安装依赖库：pip install oss2
-from oss2.models import PutObjectResult
-from core.logger import logger
-from utils.file.compress.cpressJPG import compress_jpg_png
-from utils.file.file_manage import FileManage
+from utils.file.compress.image_pipeline import ImagePipeline
 from utils.file.file_base import FileBase
+from utils.file.storage import get_storage
 
 
 class BucketConf(BaseModel):
@@ -39,52 +37,63 @@ class AliyunOSS(FileBase):
 
     def __init__(self, bucket: BucketConf):
         # 阿里云账号AccessKey拥有所有API的访问权限，风险很高。强烈建议您创建并使用RAM用户进行API访问或日常运维，请登录RAM控制台创建RAM用户。
-        auth = oss2.Auth(bucket.accessKeyId, bucket.accessKeySecret)
         # yourEndpoint填写Bucket所在地域对应的Endpoint。以华东1（杭州）为例，Endpoint填写为https://oss-cn-hangzhou.aliyuncs.com。
-        # 填写Bucket名称。
-        self.bucket = oss2.Bucket(auth, bucket.endpoint, bucket.bucket)
-        self.baseUrl = bucket.baseUrl
+        # Bucket 客户端在进程内只创建一次，SDK 调用在线程池中执行，OSS_BACKEND 为 local 时保存到本地
+        self.storage = get_storage(
+            bucket.accessKeyId,
+            bucket.accessKeySecret,
+            bucket.endpoint,
+            bucket.bucket,
+            bucket.baseUrl
+        )
 
-    async def upload_image(self, path: str, file: UploadFile, compress: bool = False) -> str:
+    async def upload_image(self, path: str, file: UploadFile, compress: bool = False, media=None) -> str:
         """
         上传图片
 
         :param path: path由包含文件后缀，不包含Bucket名称组成的Object完整路径，例如abc/efg/123.jpg。
         :param file: 文件对象
         :param compress: 是否压缩该文件
+        :param media: 媒体文件存储 MediaDal，传入时按照文件内容去重保存，相同内容的图片直接返回已上传的链接，压缩时不去重
         :return: 上传后的文件oss链接
         """
-        path = self.generate_path(path, file.filename)
+        if media and not compress:
+            result = await media.save(file, self.storage)
+            return result.url if result else ""
         if compress:
-            # 压缩图片
-            file_path = await FileManage.save_tmp_file(file)
-            new_file = compress_jpg_png(file_path, originpath=os.path.abspath(file_path))
-            with open(new_file, "rb") as f:
-                file_data = f.read()
-        else:
-            file_data = await file.read()
-        result = self.bucket.put_object(path, file_data)
-        assert isinstance(result, PutObjectResult)
-        if result.status != 200:
-            logger.error(f"图片上传到OSS失败，状态码：{result.status}")
-            print("图片上传路径", path)
-            print(f"图片上传到OSS失败，状态码：{result.status}")
+            return await self.upload_image_renditions(path, file)
+        path = self.generate_path(path, file.filename)
+        if not await self.storage.put_file(path, file.file):
+            return ""
+        return self.storage.get_url(path)
+
+    async def upload_image_renditions(self, path: str, file: UploadFile) -> str:
+        """
+        压缩图片并上传所有版本（见 IMAGE_RENDITIONS），同一类图片（path）使用相同的压缩质量
+
+        :param path: 图片类别与保存目录，例如 avatar
+        :param file: 文件对象
+        :return: 第一个版本的oss链接
+        """
+        renditions = await ImagePipeline.process(await file.read(), image_class=path)
+        name = os.path.splitext(self.generate_path(path, file.filename))[0]
+        paths = [name + suffix for suffix, _ in renditions.values()]
+        results = await asyncio.gather(*[
+            self.storage.put_object(key, content) for key, (_, content) in zip(paths, renditions.values())
+        ])
+        if not all(results):
             return ""
-        return self.baseUrl + path
+        return self.storage.get_url(paths[0])
 
     async def upload_file(self, path: str, file: UploadFile) -> str:
         """
-        上传文件
+        上传文件，大文件使用分片上传
 
         :param path: path由包含文件后缀，不包含Bucket名称组成的Object完整路径，例如abc/efg/123.jpg。
         :param file: 文件对象
         :return: 上传后的文件oss链接
         """
         path = self.generate_path(path, file.filename)
-        file_data = await file.read()
-        result = self.bucket.put_object(path, file_data)
-        assert isinstance(result, PutObjectResult)
-        if result.status != 200:
-            logger.error(f"文件上传到OSS失败，状态码：{result.status}")
+        if not await self.storage.put_file(path, file.file):
             return ""
-        return self.baseUrl + path
+        return self.storage.get_url(path)
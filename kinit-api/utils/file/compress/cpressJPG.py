@@ -1,50 +1,32 @@
-from PIL import Image, ExifTags  # 安装依赖包：pip3 install pillow
-from utils.file.compress import dynamic_quality
 import os
 import time
+from utils.file.compress.image_pipeline import render
 
 
 """
 PIL读取的图像发生自动旋转：https://blog.csdn.net/mizhenpeng/article/details/82794112
 使用python批量压缩图片文件：https://blog.csdn.net/weixin_41855010/article/details/120723943
+
+同步压缩单张图片，异步接口中请使用 utils.file.compress.image_pipeline.ImagePipeline
 """
 
 
 def compress_jpg_png(filename, originpath):
-    name = filename.rstrip('.png').rstrip('.jpg')
-    im = Image.open(os.path.join(originpath, filename))
-    # 解决图像方向问题
-    try:
-        for orientation in ExifTags.TAGS.keys():
-            if ExifTags.TAGS[orientation] == 'Orientation': break
-            exif = dict(im._getexif().items())
-            if exif[orientation] == 3:
-                im = im.rotate(180, expand=True)
-            elif exif[orientation] == 6:
-                im = im.rotate(270, expand=True)
-            elif exif[orientation] == 8:
-                im = im.rotate(90, expand=True)
-    except:
-        pass
-    # print(im.format,im.size,im.mode)
-    im = im.convert('RGB')
-    im.format = "JPEG"
-    new_photo = im.copy()
-    new_photo.thumbnail(im.size, resample=Image.ANTIALIAS)
-    save_args = {'format': im.format}
-    # print(save_args)
-    # if im.format=='JPEG':
-    # save_args['quality']=20
-    save_args['quality'], value = dynamic_quality.jpeg_dynamic_quality(im)
-    save_args['optimize'] = True
-    save_args['progressive=True'] = True
-    # print("JPEG Quality Changed")
-    # elif im.format=='PNG':
-    #     save_args['format']='JPEG'
-    #     save_args['quality']=5
-    #     print("PNG Quality Changed")
-    new_file = os.path.join(originpath, name + str(int(time.time())) + ".jpg")
-    new_photo.save(new_file, **save_args)
+    """
+    压缩图片，压缩后的图片保存在原图片同一目录中
+
+    :param filename: 图片文件名
+    :param originpath: 图片所在目录，filename 为绝对路径时忽略
+    :return: 压缩后的图片路径
+    """
+    path = os.path.join(originpath, filename)
+    with open(path, "rb") as f:
+        data = f.read()
+    _, result = render(data, {"default": {"format": "JPEG"}})
+    suffix, content = result["default"]
+    new_file = os.path.splitext(path)[0] + str(int(time.time())) + suffix
+    with open(new_file, "wb") as f:
+        f.write(content)
     return new_file
 
 
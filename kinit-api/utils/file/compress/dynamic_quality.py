@@ -1,3 +1,4 @@
+import io
 import PIL.Image  # 安装依赖包：pip3 install pillow
 from math import log
 from SSIM_PIL import compare_ssim # 安装依赖包：pip3 install SSIM-PIL
@@ -5,11 +6,14 @@ from SSIM_PIL import compare_ssim # 安装依赖包：pip3 install SSIM-PIL
 
 def get_ssim_at_quality(photo, quality):
     """Return the ssim for this JPEG image saved at the specified quality"""
-    ssim_photo = "tmp.jpg"
+    # encode to an in-memory buffer, concurrent calls must not share a temp file
+    ssim_photo = io.BytesIO()
     # optimize is omitted here as it doesn't affect
     # quality but requires additional memory and cpu
     photo.save(ssim_photo, format="JPEG", quality=quality, progressive=True)
-    ssim_score = compare_ssim(photo, PIL.Image.open(ssim_photo))
+    ssim_photo.seek(0)
+    with PIL.Image.open(ssim_photo) as encoded:
+        ssim_score = compare_ssim(photo, encoded)
     return ssim_score
 
 
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/19 10:20
+# @File           : image_pipeline.py
+# @IDE            : PyCharm
+# @desc           : 图片处理
+
+"""
+图片压缩与生成多个版本：
+1. 所有编码都写入内存，不使用临时文件
+2. 图片只解码一次，所有版本（缩略图、webp、限制最大边长等）都从同一张解码后的图片生成，缩放结果按照边长复用
+3. 压缩质量通过 SSIM 二分查找确定，每类图片（例如 avatar）只计算一次，之后直接使用缓存的质量
+4. 在进程池中执行，不阻塞事件循环，也不受 GIL 限制
+
+版本配置见 IMAGE_RENDITIONS
+"""
+
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Tuple
+from PIL import Image, ImageOps  # 安装依赖包：pip3 install pillow
+from application import settings
+from utils.file.compress import dynamic_quality
+
+# 图片格式对应的文件后缀
+FORMAT_EXTENSIONS = {
+    "JPEG": ".jpg",
+    "WEBP": ".webp",
+    "PNG": ".png"
+}
+
+
+def render(data: bytes, renditions: dict, quality: int = None) -> Tuple[int, Dict[str, Tuple[str, bytes]]]:
+    """
+    解码一次图片并生成所有版本，在进程池中执行
+
+    :param data: 原始图片内容
+    :param renditions: 版本配置，{名称: {"max_size": 最大边长, "format": 图片格式, "suffix": 文件名后缀}}
+    :param quality: 压缩质量，为空时通过 SSIM 计算
+    :return: (压缩质量, {名称: (文件名后缀与扩展名, 图片内容)})
+    """
+    with Image.open(io.BytesIO(data)) as im:
+        # 根据 EXIF 信息旋转图片，解决图像方向问题
+        im = ImageOps.exif_transpose(im).convert("RGB")
+    if quality is None:
+        quality, _ = dynamic_quality.jpeg_dynamic_quality(im)
+    resized = {}
+    result = {}
+    # 从大到小缩放，小尺寸从已缩放的图片继续缩放
+    for name, conf in sorted(renditions.items(), key=lambda item: -(item[1].get("max_size") or 0)):
+        max_size = conf.get("max_size")
+        photo = im
+        if max_size and max(im.size) > max_size:
+            photo = resized.get(max_size)
+            if photo is None:
+                source = min(
+                    (image for size, image in resized.items() if size > max_size),
+                    key=lambda image: max(image.size),
+                    default=im
+                )
+                photo = source.copy()
+                photo.thumbnail((max_size, max_size), resample=Image.Resampling.LANCZOS)
+                resized[max_size] = photo
+        image_format = conf.get("format", "JPEG").upper()
+        buffer = io.BytesIO()
+        if image_format == "JPEG":
+            photo.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True)
+        else:
+            photo.save(buffer, format=image_format, quality=quality)
+        result[name] = (conf.get("suffix", "") + FORMAT_EXTENSIONS.get(image_format, ".jpg"), buffer.getvalue())
+    # 按照配置顺序返回
+    return quality, {name: result[name] for name in renditions}
+
+
+class ImagePipeline:
+
+    executor: ProcessPoolExecutor | None = None
+    # 每类图片的压缩质量
+    qualities: Dict[str, int] = {}
+    # 正在计算压缩质量的图片类别，同一类图片同时上传时只计算一次，其他请求等待计算结果
+    pending: Dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def get_executor(cls) -> ProcessPoolExecutor:
+        """
+        获取进程池，第一次使用时创建
+        """
+        if cls.executor is None:
+            cls.executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_WORKERS)
+        return cls.executor
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        关闭进程池，项目关闭时调用
+        """
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=False)
+            cls.executor = None
+
+    @classmethod
+    async def run(cls, data: bytes, renditions: dict, quality: int = None):
+        return await asyncio.get_running_loop().run_in_executor(cls.get_executor(), render, data, renditions, quality)
+
+    @classmethod
+    async def process(
+            cls,
+            data: bytes,
+            image_class: str = "default",
+            renditions: dict = None
+    ) -> Dict[str, Tuple[str, bytes]]:
+        """
+        压缩图片并生成所有版本
+
+        :param data: 原始图片内容
+        :param image_class: 图片类别，同一类图片使用相同的压缩质量
+        :param renditions: 版本配置，为空时使用 IMAGE_RENDITIONS
+        :return: {名称: (文件名后缀与扩展名, 图片内容)}
+        """
+        renditions = renditions or settings.IMAGE_RENDITIONS
+        if image_class not in cls.qualities:
+            future = cls.pending.get(image_class)
+            if future is not None:
+                await future
+            else:
+                future = asyncio.get_running_loop().create_future()
+                cls.pending[image_class] = future
+                try:
+                    quality, result = await cls.run(data, renditions)
+                    cls.qualities[image_class] = quality
+                    return result
+                finally:
+                    # 计算失败时等待的请求各自计算
+                    future.set_result(None)
+                    cls.pending.pop(image_class, None)
+        _, result = await cls.run(data, renditions, cls.qualities.get(image_class))
+        return result
@@ -7,8 +7,10 @@
 # @desc           : 简要说明
 
 import datetime
+import hashlib
 import os
 import uuid
+import anyio
 from fastapi import UploadFile
 from core.exception import CustomException
 from utils import status
@@ -20,6 +22,22 @@ class FileBase:
     VIDEO_ACCEPT = ["audio/mp4", "video/mp4", "video/mpeg"]
     ALL_ACCEPT = [*IMAGE_ACCEPT, *VIDEO_ACCEPT]
 
+    # 文件头魔数，用于识别文件的真实类型，不使用客户端传过来的 content_type
+    MAGIC_NUMBERS = [
+        (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+        (0, b"\xff\xd8\xff", "image/jpeg"),
+        (0, b"GIF87a", "image/gif"),
+        (0, b"GIF89a", "image/gif"),
+        (0, b"\x00\x00\x01\x00", "image/x-icon"),
+        (4, b"ftypM4A", "audio/mp4"),
+        (4, b"ftyp", "video/mp4"),
+        (0, b"\x00\x00\x01\xba", "video/mpeg"),
+        (0, b"\x00\x00\x01\xb3", "video/mpeg"),
+    ]
+
+    # 流式保存时每次读取的大小
+    CHUNK_SIZE = 64 * 1024
+
     @classmethod
     def generate_path(cls, path: str, filename):
         """
@@ -34,21 +52,77 @@ class FileBase:
         return f"{path}/{full_date}/{_filename}{os.path.splitext(filename)[-1]}"
 
     @classmethod
-    async def validate_file(cls, file: UploadFile, max_size: int = None, mime_types: list = None) -> bool:
+    def sniff_mime_type(cls, head: bytes) -> str | None:
+        """
+        根据文件头魔数识别文件类型
+        """
+        for offset, magic, mime_type in cls.MAGIC_NUMBERS:
+            if head[offset:offset + len(magic)] == magic:
+                return mime_type
+        return None
+
+    @classmethod
+    def check_mime_type(cls, head: bytes, mime_types: list) -> str:
+        """
+        验证文件真实类型，返回识别到的类型
+        """
+        mime_type = cls.sniff_mime_type(head)
+        if mime_type not in mime_types:
+            raise CustomException(f"上传文件格式错误，只支持 {'/'.join(mime_types)} 格式!", status.HTTP_ERROR)
+        return mime_type
+
+    @classmethod
+    async def stream_save(cls, file: UploadFile, save_path: str, max_size: int = None, mime_types: list = None) -> dict:
+        """
+        分块读取上传文件并写入 save_path，读取过程中验证文件大小、文件类型并计算 SHA-256
+
+        先写入同一目录下的临时文件，完成后重命名，验证失败或写入失败时删除临时文件，不会留下只写了一半的文件
+
+        :param file: 上传文件
+        :param save_path: 保存路径，绝对路径
+        :param max_size: 文件最大值，单位 MB
+        :param mime_types: 允许的文件类型，根据文件头魔数识别
+        :return: {"size": 文件大小, "sha256": 文件哈希, "content_type": 识别到的文件类型}
         """
-        验证文件是否符合格式
+        await anyio.Path(os.path.dirname(save_path)).mkdir(parents=True, exist_ok=True)
+        max_bytes = max_size * 1024 * 1024 if max_size else None
+        tmp_path = f"{save_path}.{uuid.uuid4().hex}.tmp"
+        sha256 = hashlib.sha256()
+        size = 0
+        content_type = None
+        await file.seek(0)
+        try:
+            async with await anyio.open_file(tmp_path, "wb") as f:
+                while chunk := await file.read(cls.CHUNK_SIZE):
+                    if size == 0:
+                        content_type = cls.sniff_mime_type(chunk)
+                        if mime_types:
+                            cls.check_mime_type(chunk, mime_types)
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise CustomException(f"上传文件过大，不能超过{max_size}MB", status.HTTP_ERROR)
+                    sha256.update(chunk)
+                    await f.write(chunk)
+            if mime_types and size == 0:
+                # 空文件没有文件头，无法识别类型
+                cls.check_mime_type(b"", mime_types)
+            await anyio.to_thread.run_sync(os.replace, tmp_path, save_path)
+        except BaseException:
+            await anyio.to_thread.run_sync(cls.__remove, tmp_path)
+            raise
+        return {"size": size, "sha256": sha256.hexdigest(), "content_type": content_type}
 
-        :params max_size: 文件最大值，单位 MB
+    @classmethod
+    async def remove(cls, path: str) -> None:
         """
-        if max_size:
-            size = len(await file.read()) / 1024 / 1024
-            if size > max_size:
-                raise CustomException(f"上传文件过大，不能超过{max_size}MB", status.HTTP_ERROR)
-            await file.seek(0)
-        if mime_types:
-            if file.content_type not in mime_types:
-                raise CustomException(f"上传文件格式错误，只支持 {'/'.join(mime_types)} 格式!", status.HTTP_ERROR)
-        return True
+        在线程中删除文件，文件不存在时忽略
+        """
+        await anyio.to_thread.run_sync(cls.__remove, path)
+
+    @staticmethod
+    def __remove(path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
 
     @classmethod
     def get_file_type(cls, content_type: str) -> str | None:
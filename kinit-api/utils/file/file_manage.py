@@ -12,6 +12,7 @@ from application.settings import TEMP_DIR, STATIC_ROOT, BASE_DIR, STATIC_URL, ST
 from fastapi import UploadFile
 import sys
 from utils.file.file_base import FileBase
+from utils.file.storage import LocalStorage
 
 
 class FileManage(FileBase):
@@ -19,9 +20,15 @@ class FileManage(FileBase):
     上传文件管理
     """
 
-    def __init__(self, file: UploadFile, path: str):
+    def __init__(self, file: UploadFile, path: str, media=None):
+        """
+        :param media: 媒体文件存储 MediaDal，传入时按照文件内容去重保存，相同内容的文件只保存一份
+        """
         self.path = self.generate_path(path, file.filename)
         self.file = file
+        self.media = media
+        # 保存后的文件信息：{"size": 文件大小, "sha256": 文件哈希, "content_type": 识别到的文件类型}
+        self.info: dict | None = None
 
     async def save_image_local(self, accept: list = None) -> dict:
         """
@@ -29,38 +36,42 @@ class FileManage(FileBase):
         """
         if accept is None:
             accept = self.IMAGE_ACCEPT
-        await self.validate_file(self.file, max_size=5, mime_types=accept)
-        return await self.save_local()
+        return await self.save_local(max_size=5, mime_types=accept)
 
-    async def save_local(self) -> dict:
+    async def save_local(self, max_size: int = None, mime_types: list = None) -> dict:
         """
-        保存文件到本地
+        保存文件到本地，分块写入，写入过程中验证文件大小与文件类型
+
+        :param max_size: 文件最大值，单位 MB
+        :param mime_types: 允许的文件类型
         """
+        if self.media:
+            result = await self.media.save(self.file, LocalStorage(STATIC_ROOT, STATIC_URL), max_size, mime_types)
+            self.path = result.path
+            self.info = {"size": result.size, "sha256": result.sha256, "content_type": result.content_type}
+            return {
+                "local_path": f"{STATIC_DIR}/{self.path}",
+                "remote_path": result.url
+            }
         path = self.path
         if sys.platform == "win32":
             path = self.path.replace("/", "\\")
         save_path = os.path.join(STATIC_ROOT, path)
-        if not os.path.exists(os.path.dirname(save_path)):
-            os.mkdir(os.path.dirname(save_path))
-        with open(save_path, "wb") as f:
-            f.write(await self.file.read())
+        self.info = await self.stream_save(self.file, save_path, max_size, mime_types)
         return {
             "local_path": f"{STATIC_DIR}/{self.path}",
             "remote_path": f"{STATIC_URL}/{self.path}"
         }
 
-    @staticmethod
-    async def save_tmp_file(file: UploadFile):
+    @classmethod
+    async def save_tmp_file(cls, file: UploadFile):
         """
         保存临时文件
         """
         date = datetime.datetime.strftime(datetime.datetime.now(), "%Y%m%d")
         file_dir = os.path.join(TEMP_DIR, date)
-        if not os.path.exists(file_dir):
-            os.mkdir(file_dir)
-        filename = os.path.join(file_dir, str(int(datetime.datetime.now().timestamp())) + file.filename)
-        with open(filename, "wb") as f:
-            f.write(await file.read())
+        filename = os.path.join(file_dir, str(int(datetime.datetime.now().timestamp())) + os.path.basename(file.filename))
+        await cls.stream_save(file, filename)
         return filename
 
     @staticmethod
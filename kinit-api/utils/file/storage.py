@@ -0,0 +1,287 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/18 10:30
+# @File           : storage.py
+# @IDE            : PyCharm
+# @desc           : 对象存储后端
+
+"""
+对象存储后端，SDK 为阻塞调用，所有调用都在线程池中执行，不阻塞事件循环
+
+上传方式：
+    文件小于 OSS_MULTIPART_THRESHOLD：一次请求上传，直接从文件对象中读取，不需要先读入内存
+    文件大于 OSS_MULTIPART_THRESHOLD：分片上传，按照 OSS_MULTIPART_PART_SIZE 顺序读取分片，
+        同时上传 OSS_MULTIPART_PARALLEL 个分片，内存中最多保留 OSS_MULTIPART_PARALLEL 个分片，上传失败时取消分片上传
+
+存储后端：
+    aliyun：阿里云 OSS，每个 Bucket 配置在进程内只创建一个 oss2.Bucket，复用 HTTP 连接
+    local：本地替身，文件保存到 STATIC_ROOT 中，通过 STATIC_URL 访问，用于本地开发与测试
+
+阿里云分片上传文档：https://help.aliyun.com/document_detail/88434.html
+"""
+
+import asyncio
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Tuple
+import oss2  # 安装依赖库：pip install oss2
+from application import settings
+from core.logger import logger
+
+
+class StorageBackend:
+    """
+    对象存储后端基类，子类实现阻塞的 _put_object 与分片上传方法
+    """
+
+    executor: ThreadPoolExecutor | None = None
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        # 存储位置名称，同一个名称的文件保存在同一个位置
+        self.name = ""
+
+    @classmethod
+    def get_executor(cls) -> ThreadPoolExecutor:
+        """
+        所有存储后端共用一个线程池，第一次使用时创建
+        """
+        if StorageBackend.executor is None:
+            StorageBackend.executor = ThreadPoolExecutor(
+                max_workers=settings.OSS_UPLOAD_WORKERS,
+                thread_name_prefix="storage"
+            )
+        return StorageBackend.executor
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        关闭线程池，项目关闭时调用
+        """
+        if StorageBackend.executor is not None:
+            StorageBackend.executor.shutdown(wait=False)
+            StorageBackend.executor = None
+
+    @classmethod
+    async def run(cls, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(cls.get_executor(), func, *args)
+
+    def get_url(self, path: str) -> str:
+        return self.base_url + path
+
+    async def put_object(self, path: str, data: bytes | BinaryIO) -> bool:
+        """
+        一次请求上传
+
+        :param path: 不包含 Bucket 名称的 Object 完整路径，例如abc/efg/123.jpg
+        :param data: 文件内容或文件对象
+        """
+        return await self.run(self._put_object, path, data)
+
+    async def delete_object(self, path: str) -> None:
+        """
+        删除文件
+        """
+        await self.run(self._delete_object, path)
+
+    async def put_file(self, path: str, file: str | BinaryIO) -> bool:
+        """
+        上传文件，大文件使用分片上传
+
+        :param path: 不包含 Bucket 名称的 Object 完整路径，例如abc/efg/123.jpg
+        :param file: 文件路径或文件对象，文件对象需要支持 seek
+        """
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                return await self.put_file(path, f)
+        size = await self.run(file.seek, 0, os.SEEK_END)
+        await self.run(file.seek, 0)
+        if size < settings.OSS_MULTIPART_THRESHOLD:
+            return await self.put_object(path, file)
+        return await self.multipart_upload(path, file)
+
+    async def multipart_upload(self, path: str, file: BinaryIO) -> bool:
+        """
+        分片上传，顺序读取分片，并行上传
+        """
+        upload_id = await self.run(self._init_multipart, path)
+        semaphore = asyncio.Semaphore(settings.OSS_MULTIPART_PARALLEL)
+        tasks: List[asyncio.Task] = []
+
+        async def upload_part(part_number: int, data: bytes) -> Tuple[int, str]:
+            try:
+                return part_number, await self.run(self._upload_part, path, upload_id, part_number, data)
+            finally:
+                semaphore.release()
+
+        try:
+            part_number = 1
+            while True:
+                # 先获取信号量再读取分片，限制内存中的分片数量
+                await semaphore.acquire()
+                data = await self.run(file.read, settings.OSS_MULTIPART_PART_SIZE)
+                if not data:
+                    semaphore.release()
+                    break
+                tasks.append(asyncio.create_task(upload_part(part_number, data)))
+                part_number += 1
+                # 提前发现失败的分片，不再继续读取
+                for task in tasks:
+                    if task.done() and task.exception():
+                        raise task.exception()
+            parts = await asyncio.gather(*tasks)
+            await self.run(self._complete_multipart, path, upload_id, sorted(parts))
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.run(self._abort_multipart, path, upload_id)
+            if isinstance(e, Exception):
+                logger.error(f"分片上传失败：{path}，报错：{e!r}")
+                return False
+            raise
+        return True
+
+    def _put_object(self, path: str, data: bytes | BinaryIO) -> bool:
+        raise NotImplementedError
+
+    def _delete_object(self, path: str) -> None:
+        raise NotImplementedError
+
+    def _init_multipart(self, path: str) -> str:
+        raise NotImplementedError
+
+    def _upload_part(self, path: str, upload_id: str, part_number: int, data: bytes) -> str:
+        raise NotImplementedError
+
+    def _complete_multipart(self, path: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        raise NotImplementedError
+
+    def _abort_multipart(self, path: str, upload_id: str) -> None:
+        raise NotImplementedError
+
+
+class AliyunStorage(StorageBackend):
+    """
+    阿里云对象存储
+
+    官方文档：https://help.aliyun.com/document_detail/32026.html
+    """
+
+    buckets: Dict[tuple, oss2.Bucket] = {}
+
+    def __init__(self, access_key_id: str, access_key_secret: str, endpoint: str, bucket: str, base_url: str):
+        super().__init__(base_url)
+        self.name = f"aliyun:{endpoint}/{bucket}"
+        self.bucket = self.get_bucket(access_key_id, access_key_secret, endpoint, bucket)
+
+    @classmethod
+    def get_bucket(cls, access_key_id: str, access_key_secret: str, endpoint: str, bucket: str) -> oss2.Bucket:
+        """
+        获取 Bucket 客户端，每个配置在进程内只创建一个
+        """
+        key = (access_key_id, access_key_secret, endpoint, bucket)
+        client = cls.buckets.get(key)
+        if client is None:
+            # 连接池大小与线程数量一致
+            oss2.defaults.connection_pool_size = settings.OSS_UPLOAD_WORKERS
+            client = oss2.Bucket(oss2.Auth(access_key_id, access_key_secret), endpoint, bucket)
+            cls.buckets[key] = client
+        return client
+
+    def _put_object(self, path: str, data: bytes | BinaryIO) -> bool:
+        result = self.bucket.put_object(path, data)
+        if result.status != 200:
+            logger.error(f"文件上传到OSS失败，状态码：{result.status}，路径：{path}")
+            return False
+        return True
+
+    def _delete_object(self, path: str) -> None:
+        self.bucket.delete_object(path)
+
+    def _init_multipart(self, path: str) -> str:
+        return self.bucket.init_multipart_upload(path).upload_id
+
+    def _upload_part(self, path: str, upload_id: str, part_number: int, data: bytes) -> str:
+        return self.bucket.upload_part(path, upload_id, part_number, data).etag
+
+    def _complete_multipart(self, path: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        parts = [oss2.models.PartInfo(part_number, etag) for part_number, etag in parts]
+        self.bucket.complete_multipart_upload(path, upload_id, parts)
+
+    def _abort_multipart(self, path: str, upload_id: str) -> None:
+        try:
+            self.bucket.abort_multipart_upload(path, upload_id)
+        except oss2.exceptions.OssError as e:
+            logger.error(f"取消分片上传失败：{path}，报错：{e!r}")
+
+
+class LocalStorage(StorageBackend):
+    """
+    本地替身，文件保存到 root 目录中，先写入临时文件再重命名，不会出现只写了一半的文件
+    """
+
+    def __init__(self, root: str, base_url: str):
+        super().__init__(base_url)
+        self.name = "local"
+        self.root = root
+
+    def get_url(self, path: str) -> str:
+        return f"{self.base_url}/{path}"
+
+    def __get_path(self, path: str) -> str:
+        save_path = os.path.join(self.root, *path.split("/"))
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        return save_path
+
+    def _put_object(self, path: str, data: bytes | BinaryIO) -> bool:
+        save_path = self.__get_path(path)
+        tmp_path = f"{save_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            if isinstance(data, bytes):
+                f.write(data)
+            else:
+                shutil.copyfileobj(data, f, settings.OSS_MULTIPART_PART_SIZE)
+        os.replace(tmp_path, save_path)
+        return True
+
+    def _delete_object(self, path: str) -> None:
+        save_path = os.path.join(self.root, *path.split("/"))
+        if os.path.exists(save_path):
+            os.remove(save_path)
+
+    def _init_multipart(self, path: str) -> str:
+        upload_id = uuid.uuid4().hex
+        os.makedirs(f"{self.__get_path(path)}.{upload_id}.parts")
+        return upload_id
+
+    def _upload_part(self, path: str, upload_id: str, part_number: int, data: bytes) -> str:
+        with open(os.path.join(f"{self.__get_path(path)}.{upload_id}.parts", str(part_number)), "wb") as f:
+            f.write(data)
+        return str(part_number)
+
+    def _complete_multipart(self, path: str, upload_id: str, parts: List[Tuple[int, str]]) -> None:
+        save_path = self.__get_path(path)
+        parts_dir = f"{save_path}.{upload_id}.parts"
+        tmp_path = f"{save_path}.{upload_id}.tmp"
+        with open(tmp_path, "wb") as f:
+            for part_number, _ in parts:
+                with open(os.path.join(parts_dir, str(part_number)), "rb") as part:
+                    shutil.copyfileobj(part, f)
+        os.replace(tmp_path, save_path)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    def _abort_multipart(self, path: str, upload_id: str) -> None:
+        shutil.rmtree(f"{self.__get_path(path)}.{upload_id}.parts", ignore_errors=True)
+
+
+def get_storage(access_key_id: str, access_key_secret: str, endpoint: str, bucket: str, base_url: str) -> StorageBackend:
+    """
+    根据 OSS_BACKEND 配置获取存储后端
+    """
+    if settings.OSS_BACKEND == "local":
+        return LocalStorage(settings.STATIC_ROOT, settings.STATIC_URL)
+    return AliyunStorage(access_key_id, access_key_secret, endpoint, bucket, base_url)
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/13 10:05
+# @File           : http_client.py
+# @IDE            : PyCharm
+# @desc           : 共享 HTTP 客户端
+
+"""
+进程内共享一个 aiohttp.ClientSession，复用连接池，避免每次请求都重新建立连接与 TLS 握手
+
+aiohttp 客户端文档：https://docs.aiohttp.org/en/stable/client_quickstart.html
+官方建议：不要为每个请求创建一个会话，每个应用程序最好只使用一个会话
+"""
+
+import asyncio
+import aiohttp
+from aiohttp import TCPConnector
+from application import settings
+from core.logger import logger
+
+
+class HttpClient:
+
+    session: aiohttp.ClientSession | None = None
+
+    @classmethod
+    def get_session(cls) -> aiohttp.ClientSession:
+        """
+        获取共享会话，第一次使用时创建，需要在事件循环中调用
+        """
+        if cls.session is None or cls.session.closed:
+            connector = TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=30)
+            timeout = aiohttp.ClientTimeout(total=settings.HTTP_CLIENT_TIMEOUT)
+            cls.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return cls.session
+
+    @staticmethod
+    def max_duration(retry: int = None) -> float:
+        """
+        request_json 最长耗时（秒）：每次请求的超时时间加上重试之间的退避时间
+
+        :param retry: 重试次数，为空时使用 HTTP_CLIENT_RETRY
+        """
+        retry = settings.HTTP_CLIENT_RETRY if retry is None else retry
+        return (retry + 1) * settings.HTTP_CLIENT_TIMEOUT + sum(2 ** attempt * 0.2 for attempt in range(retry))
+
+    @classmethod
+    async def request_json(cls, method: str, url: str, retry: int = None, **kwargs) -> dict:
+        """
+        发送请求并解析 JSON 响应，网络异常、超时与 5xx 响应按照指数退避重试
+
+        :param method: 请求方法
+        :param url: 请求地址
+        :param retry: 重试次数，为空时使用 HTTP_CLIENT_RETRY
+        :param kwargs: aiohttp 请求参数，params、json 等
+        """
+        retry = settings.HTTP_CLIENT_RETRY if retry is None else retry
+        for attempt in range(retry + 1):
+            try:
+                async with cls.get_session().request(method, url, **kwargs) as resp:
+                    resp.raise_for_status()
+                    # 部分接口（例如微信 jscode2session）返回的 Content-Type 为 text/plain
+                    return await resp.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = getattr(e, "status", None)
+                if attempt >= retry or (status is not None and status < 500):
+                    raise
+                logger.warning(f"请求 {url} 失败，第 {attempt + 1} 次，报错：{e!r}")
+                await asyncio.sleep(2 ** attempt * 0.2)
+
+    @classmethod
+    async def close(cls) -> None:
+        """
+        关闭共享会话，项目关闭时调用
+        """
+        if cls.session is not None and not cls.session.closed:
+            await cls.session.close()
+        cls.session = None
@@ -1,7 +1,7 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 # @version        : 1.0
-# @Creaet Time    : 2022/11/3 17:23 
+# @Creaet Time    : 2022/11/3 17:23
 # @File           : ip_manage.py
 # @IDE            : PyCharm
 # @desc           : 获取IP地址归属地
@@ -14,14 +14,26 @@ JSONP请求示例（IPv4）
 https://api.ip138.com/ip/?ip=58.16.180.3&datatype=jsonp&token=cc87f3c77747bccbaaee35006da1ebb65e0bad57
 
 aiohttp 异步请求文档：https://docs.aiohttp.org/en/stable/client_quickstart.html
+
+查询顺序：进程内 LRU 缓存 -> Redis 缓存 -> 离线IP数据 -> 第三方接口
+缓存键：IPv4 按照 /24 网段，IPv6 按照 /64 网段，同一网段的IP归属地基本一致
+离线IP数据：文件每行格式为 起始IP|结束IP|国家|省份|城市|区县|运营商，只支持 IPv4，加载后使用数组保存，二分查找
+    项目启动时在线程中加载（core.event.load_ip_offline），加载完成前不使用离线数据，不阻塞事件循环
 """
-from aiohttp import TCPConnector
 
-from application.settings import IP_PARSE_TOKEN, IP_PARSE_ENABLE
-import aiohttp
+import asyncio
+import bisect
+import ipaddress
+import json
+import time
+from array import array
+from collections import OrderedDict
+from aioredis import Redis
+from application import settings
 from core.logger import logger
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List, Tuple
+from utils.http_client import HttpClient
 
 
 class IPLocationOut(BaseModel):
@@ -36,36 +48,200 @@ class IPLocationOut(BaseModel):
     area_code: Optional[str] = None
 
 
+class IPOfflineDatabase:
+    """
+    离线IP数据
+
+    起始IP与结束IP分别保存在两个无符号整数数组中，按照起始IP排序，查询时二分查找
+    归属地数据去重后保存，相同归属地的IP段共用一份数据
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.starts = array("L")
+        self.ends = array("L")
+        self.indexes = array("L")
+        self.locations: List[Tuple[str, ...]] = []
+        self.load()
+
+    def load(self) -> None:
+        ranges = []
+        location_index = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                items = line.strip().split("|")
+                if len(items) < 7:
+                    continue
+                try:
+                    start = int(ipaddress.IPv4Address(items[0]))
+                    end = int(ipaddress.IPv4Address(items[1]))
+                except ValueError:
+                    continue
+                location = tuple(item if item and item != "0" else "" for item in items[2:7])
+                index = location_index.setdefault(location, len(location_index))
+                ranges.append((start, end, index))
+        ranges.sort()
+        self.locations = list(location_index)
+        for start, end, index in ranges:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.indexes.append(index)
+        logger.info(f"加载离线IP数据完成，共 {len(self.starts)} 条IP段")
+
+    def search(self, ip: str) -> Tuple[str, ...] | None:
+        """
+        查询IP所在的IP段，返回：(国家, 省份, 城市, 区县, 运营商)
+        """
+        try:
+            value = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return None
+        i = bisect.bisect_right(self.starts, value) - 1
+        if i < 0 or value > self.ends[i]:
+            return None
+        return self.locations[self.indexes[i]]
+
+
 class IPManage:
 
-    def __init__(self, ip: str):
+    CACHE_KEY = "ip_location"
+
+    # 进程内 LRU 缓存，网段 -> (过期时间, 归属地数据)
+    lru: OrderedDict = OrderedDict()
+    offline: IPOfflineDatabase | None = None
+    # 离线IP数据加载任务
+    offline_task: asyncio.Task | None = None
+
+    def __init__(self, ip: str, rd: Redis = None):
         self.ip = ip
-        self.url = f"https://api.ip138.com/ip/?ip={ip}&datatype=jsonp&token={IP_PARSE_TOKEN}"
+        self.rd = rd
+        self.url = f"https://api.ip138.com/ip/?ip={ip}&datatype=jsonp&token={settings.IP_PARSE_TOKEN}"
+        self.key = self.get_cache_key(ip)
 
-    async def parse(self):
+    @classmethod
+    def get_cache_key(cls, ip: str) -> str | None:
+        """
+        获取IP所在网段，内网IP与无效IP返回 None，不需要解析
         """
-        IP 数据解析
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.is_private or address.is_loopback or address.is_link_local:
+            return None
+        prefix = 24 if address.version == 4 else 64
+        return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+    @classmethod
+    async def load_offline(cls) -> IPOfflineDatabase | None:
+        """
+        在线程中加载离线IP数据，多次调用只加载一次
+        """
+        if not settings.IP_PARSE_OFFLINE_FILE:
+            return None
+        if cls.offline_task is None:
+            cls.offline_task = asyncio.create_task(cls.__load_offline())
+        return await asyncio.shield(cls.offline_task)
+
+    @classmethod
+    async def __load_offline(cls) -> IPOfflineDatabase | None:
+        try:
+            cls.offline = await asyncio.to_thread(IPOfflineDatabase, settings.IP_PARSE_OFFLINE_FILE)
+        except OSError as e:
+            logger.error(f"加载离线IP数据失败：{e}")
+        return cls.offline
+
+    @classmethod
+    def get_offline(cls) -> IPOfflineDatabase | None:
+        """
+        获取离线IP数据，还没有开始加载时在后台加载，加载完成前返回 None
+        """
+        if cls.offline_task is None and settings.IP_PARSE_OFFLINE_FILE:
+            cls.offline_task = asyncio.create_task(cls.__load_offline())
+        return cls.offline
+
+    async def parse(self) -> IPLocationOut:
+        """
+        IP 数据解析，本地没有数据时请求第三方接口
+        """
+        out = await self.parse_local()
+        if out is not None:
+            return out
+        return await self.parse_remote()
+
+    async def parse_local(self) -> IPLocationOut | None:
+        """
+        从缓存与离线IP数据中解析，不请求第三方接口，没有数据时返回 None
+        """
+        if self.key is None:
+            return IPLocationOut(ip=self.ip)
+        data = self.__lru_get()
+        if data is None and self.rd:
+            result = await self.rd.get(f"{self.CACHE_KEY}:{self.key}")
+            if result:
+                data = json.loads(result)
+                self.__lru_set(data)
+        if data is None:
+            offline = self.get_offline()
+            location = offline.search(self.ip) if offline else None
+            if location:
+                data = self.format_data(list(location) + ["", ""])
+                self.__lru_set(data)
+        if data is None:
+            return None
+        return IPLocationOut(ip=self.ip, **data)
+
+    async def parse_remote(self) -> IPLocationOut:
+        """
+        请求第三方接口解析，并写入缓存
 
         接口返回：{'ret': 'ok', 'ip': '114.222.121.253','data': ['中国', '江苏', '南京', '江宁区', '电信', '211100', '025']}
         """
-        out = IPLocationOut()
-        out.ip = self.ip
-        if not IP_PARSE_ENABLE:
+        out = IPLocationOut(ip=self.ip)
+        if self.key is None:
+            return out
+        if not settings.IP_PARSE_ENABLE:
             logger.warning("未开启IP地址数据解析，无法获取到IP所属地，请在application/config/production.py:IP_PARSE_ENABLE中开启！")
             return out
-        async with aiohttp.ClientSession(connector=TCPConnector(ssl=False)) as session:
-            async with session.get(self.url) as resp:
-                body = await resp.json()
-                if body.get("ret") != 'ok':
-                    logger.error(f"获取IP所属地失败：{body}")
-                    return out
-                data = body.get("data")
-                out.address = f"{''.join(data[i] for i in range(0, 4))} {data[4]}"
-                out.country = data[0]
-                out.province = data[1]
-                out.city = data[2]
-                out.county = data[3]
-                out.operator = data[4]
-                out.postal_code = data[5]
-                out.area_code = data[6]
-                return out
+        async with HttpClient.get_session().get(self.url) as resp:
+            body = await resp.json(content_type=None)
+        if body.get("ret") != 'ok':
+            logger.error(f"获取IP所属地失败：{body}")
+            return out
+        data = self.format_data(body.get("data"))
+        self.__lru_set(data)
+        if self.rd:
+            await self.rd.set(f"{self.CACHE_KEY}:{self.key}", json.dumps(data), ex=settings.IP_PARSE_CACHE_EXPIRE)
+        return IPLocationOut(ip=self.ip, **data)
+
+    @staticmethod
+    def format_data(data: list) -> dict:
+        """
+        格式化归属地数据：[国家, 省份, 城市, 区县, 运营商, 邮政编码, 地区区号]
+        """
+        return {
+            "address": f"{''.join(data[i] for i in range(0, 4))} {data[4]}",
+            "country": data[0],
+            "province": data[1],
+            "city": data[2],
+            "county": data[3],
+            "operator": data[4],
+            "postal_code": data[5],
+            "area_code": data[6]
+        }
+
+    def __lru_get(self) -> dict | None:
+        item = self.lru.get(self.key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            self.lru.pop(self.key, None)
+            return None
+        self.lru.move_to_end(self.key)
+        return item[1]
+
+    def __lru_set(self, data: dict) -> None:
+        self.lru[self.key] = (time.monotonic() + settings.IP_PARSE_CACHE_EXPIRE, data)
+        self.lru.move_to_end(self.key)
+        while len(self.lru) > settings.IP_PARSE_LRU_SIZE:
+            self.lru.popitem(last=False)
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/23 14:00
+# @File           : local_smtp.py
+# @IDE            : PyCharm
+# @desc           : 本地 SMTP 替身
+
+"""
+LocalSMTPServer：本地 SMTP 替身，只接收邮件不投递，用于测试与压测
+
+支持 EHLO/HELO、MAIL、RCPT、DATA、RSET、NOOP、QUIT，不支持 STARTTLS 与 AUTH
+每条命令可以增加固定延迟，模拟真实 SMTP 服务器的网络往返时间
+可以模拟连接异常：断开所有连接（例如空闲超时），或者收到邮件内容后不回复直接断开
+"""
+
+import asyncio
+import threading
+from typing import Set
+
+
+class LocalSMTPServer:
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        # 收到的邮件内容，不包括结尾的 .
+        self.messages = []
+        # 建立过的连接数
+        self.connections = 0
+        # 接下来多少封邮件收到后不回复，直接断开连接
+        self.drop_after_data = 0
+        self.writers: Set[asyncio.StreamWriter] = set()
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.server: asyncio.AbstractServer | None = None
+        self.started = threading.Event()
+
+    def start(self) -> None:
+        """
+        在新线程中启动
+        """
+        threading.Thread(target=self.__run, daemon=True).start()
+        self.started.wait()
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.server.close)
+
+    def disconnect_all(self) -> None:
+        """
+        断开所有连接，客户端下一次发送命令时才会发现连接已断开
+        """
+        done = threading.Event()
+
+        def close():
+            for writer in self.writers:
+                writer.close()
+            done.set()
+
+        self.loop.call_soon_threadsafe(close)
+        done.wait()
+
+    def __run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        try:
+            self.loop.run_until_complete(self.server.serve_forever())
+        except asyncio.CancelledError:
+            pass
+
+    async def reply(self, writer: asyncio.StreamWriter, text: str) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(f"{text}\r\n".encode())
+        await writer.drain()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        self.writers.add(writer)
+        try:
+            await self.reply(writer, "220 localhost ESMTP")
+            while line := await reader.readline():
+                command = line.decode().strip().upper()
+                if command.startswith("EHLO"):
+                    await self.reply(writer, "250-localhost\r\n250 8BITMIME")
+                elif command.startswith("DATA"):
+                    await self.reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while (line := await reader.readline()) not in (b".\r\n", b""):
+                        data.append(line)
+                    self.messages.append(b"".join(data))
+                    if self.drop_after_data:
+                        self.drop_after_data -= 1
+                        break
+                    await self.reply(writer, "250 OK")
+                elif command.startswith("QUIT"):
+                    await self.reply(writer, "221 Bye")
+                    break
+                elif command.split(" ")[0] in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                    await self.reply(writer, "250 OK")
+                else:
+                    await self.reply(writer, "502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/14 9:40
+# @File           : password_hash.py
+# @IDE            : PyCharm
+# @desc           : 密码哈希工作池
+
+"""
+bcrypt 每次计算需要几十毫秒，直接在事件循环中执行会阻塞该进程中的所有请求
+这里将哈希计算放到线程池或进程池中执行，并使用信号量限制同时计算的数量
+
+线程池：bcrypt 计算时会释放 GIL，线程池即可并行计算，开销小
+进程池：完全隔离计算，适合 CPU 核心较多，并且登录量很大的情况
+"""
+
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List
+from passlib.context import CryptContext
+from application import settings
+
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+class PasswordHash:
+
+    executor: Executor | None = None
+    semaphore: asyncio.Semaphore | None = None
+
+    @classmethod
+    def get_executor(cls) -> Executor:
+        """
+        获取工作池，第一次使用时创建
+        """
+        if cls.executor is None:
+            if settings.PASSWORD_HASH_POOL == "process":
+                cls.executor = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+            else:
+                cls.executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS,
+                    thread_name_prefix="password_hash"
+                )
+        return cls.executor
+
+    @classmethod
+    async def run(cls, func, *args):
+        if cls.semaphore is None:
+            cls.semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+        async with cls.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(cls.get_executor(), func, *args)
+
+    @classmethod
+    async def hash(cls, password: str) -> str:
+        """
+        生成密码哈希
+        """
+        return await cls.run(hash_password, password)
+
+    @classmethod
+    async def verify(cls, password: str, hashed_password: str) -> bool:
+        """
+        验证密码
+        """
+        return await cls.run(verify_password, password, hashed_password)
+
+    @classmethod
+    async def hash_many(cls, passwords: List[str]) -> List[str]:
+        """
+        批量生成密码哈希，按照 PASSWORD_HASH_BATCH_SIZE 分批并行计算，返回顺序与传入顺序一致
+        """
+        result = []
+        size = settings.PASSWORD_HASH_BATCH_SIZE
+        for i in range(0, len(passwords), size):
+            result.extend(await asyncio.gather(*[cls.hash(password) for password in passwords[i:i + size]]))
+        return result
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """
+        关闭工作池，项目关闭时调用
+        """
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=False, cancel_futures=True)
+        cls.executor = None
+        cls.semaphore = None
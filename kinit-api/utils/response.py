@@ -1,5 +1,6 @@
 # 依赖安装：pip install orjson
 from fastapi.responses import ORJSONResponse as Response
+from fastapi.responses import Response as EmptyResponse
 from fastapi import status as http_status
 from utils import status as http
 
@@ -31,3 +32,24 @@ class ErrorResponse(Response):
         }
         self.data.update(kwargs)
         super().__init__(content=self.data, status_code=status)
+
+
+class NotModifiedResponse(EmptyResponse):
+    """
+    内容未变化响应，不返回响应体，客户端继续使用本地缓存
+    """
+    def __init__(self, etag: str, headers: dict = None):
+        headers = {"ETag": etag, **(headers or {})}
+        super().__init__(status_code=http_status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    @staticmethod
+    def match(if_none_match: str | None, etag: str) -> bool:
+        """
+        请求头 If-None-Match 中是否包含当前 ETag，弱比较
+        """
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = [i.strip().removeprefix("W/") for i in if_none_match.split(",")]
+        return etag.removeprefix("W/") in tags
@@ -1,23 +1,237 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 # @version        : 1.0
-# @Creaet Time    : 2023/3/27 9:48 
+# @Creaet Time    : 2023/3/27 9:48
 # @File           : send_email.py
 # @IDE            : PyCharm
 # @desc           : 发送邮件封装类
 
+"""
+smtplib 为阻塞调用，所有 SMTP 操作都在线程中执行，不阻塞事件循环
 
+连接池：
+    每个邮箱账号在进程内维护一个连接池，连接登录后重复使用，不需要每封邮件都重新连接与认证
+    连接池大小即为同时发送的最大数量，空闲超过 EMAIL_POOL_IDLE_TIMEOUT 秒的连接会重新建立
+
+附件：
+    邮件内容按照 MIME 格式分块写入 SMTP 连接，附件每次只读取一块并进行 base64 编码，不会一次性读入内存
+
+连接断开重试：
+    只有在服务器接受 DATA 之前连接断开（例如连接池中的连接已被服务器关闭）才重新连接发送，
+    DATA 被接受之后连接断开时，服务器可能已经收到完整邮件，重新发送会重复投递，所以不再重试
+"""
+
+import asyncio
+import base64
+import os
+import re
 import smtplib
+import time
+import uuid
+from email.header import Header
 from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-from typing import List
+from email.utils import formatdate, make_msgid
+from typing import List, Tuple, Callable, Awaitable, Dict
 from aioredis import Redis
-
+from application import settings
 from core.exception import CustomException
+from core.logger import logger
 from utils.cache import Cache
 
 
+class SMTPDataDisconnected(smtplib.SMTPException):
+    """
+    DATA 被接受之后连接断开，无法确定邮件是否已经投递，不能重新发送
+    """
+
+
+class SMTPConnectionPool:
+
+    # 附件每次读取的大小，57 字节编码后为一行 76 个字符
+    CHUNK_SIZE = 57 * 1024
+
+    pools: Dict[tuple, "SMTPConnectionPool"] = {}
+
+    def __init__(self, server: str, port: int, email: str, password: str, size: int = 5, starttls: bool = True):
+        self.server = server
+        self.port = port
+        self.email = email
+        self.password = password
+        self.starttls = starttls
+        self.size = size
+        self.idle: List[Tuple[smtplib.SMTP, float]] = []
+        self.semaphore = asyncio.Semaphore(size)
+
+    @classmethod
+    def get_pool(cls, server: str, port: int, email: str, password: str, **kwargs) -> "SMTPConnectionPool":
+        """
+        获取连接池，每个邮箱账号只创建一个
+        """
+        key = (server, port, email, password)
+        pool = cls.pools.get(key)
+        if pool is None:
+            pool = cls(server, port, email, password, **kwargs)
+            cls.pools[key] = pool
+        return pool
+
+    def connect(self) -> smtplib.SMTP:
+        """
+        建立连接并登录，在线程中执行
+        """
+        conn = smtplib.SMTP(self.server, self.port, timeout=settings.EMAIL_TIMEOUT)
+        try:
+            if self.starttls:
+                conn.starttls()
+            if self.password:
+                conn.login(self.email, self.password)
+        except smtplib.SMTPAuthenticationError:
+            self.close(conn)
+            raise CustomException("邮箱服务器认证失败！")
+        except Exception:
+            self.close(conn)
+            raise
+        return conn
+
+    @staticmethod
+    def close(conn: smtplib.SMTP) -> None:
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    async def send(self, to_emails: List[str], subject: str, body: str, attachments: List[str] = None) -> bool:
+        """
+        使用连接池中的连接发送邮件，DATA 被接受之前连接断开时重新连接发送一次
+        """
+        async with self.semaphore:
+            conn = None
+            while self.idle:
+                conn, last_used = self.idle.pop()
+                if time.monotonic() - last_used < settings.EMAIL_POOL_IDLE_TIMEOUT:
+                    break
+                await asyncio.to_thread(self.close, conn)
+                conn = None
+            for retry in (True, False):
+                if conn is None:
+                    conn = await asyncio.to_thread(self.connect)
+                try:
+                    result = await asyncio.to_thread(self.send_message, conn, to_emails, subject, body, attachments)
+                except smtplib.SMTPServerDisconnected:
+                    conn = None
+                    if retry:
+                        continue
+                    raise
+                except smtplib.SMTPResponseException:
+                    # 服务器拒绝了当前邮件，重置会话状态后连接仍然可用
+                    await self.__release(conn, reset=True)
+                    raise
+                except Exception:
+                    await asyncio.to_thread(self.close, conn)
+                    raise
+                await self.__release(conn)
+                return result
+
+    async def __release(self, conn: smtplib.SMTP, reset: bool = False) -> None:
+        """
+        放回连接池，重置会话失败则关闭连接
+        """
+        if reset:
+            try:
+                await asyncio.to_thread(conn.rset)
+            except (smtplib.SMTPException, OSError):
+                await asyncio.to_thread(self.close, conn)
+                return
+        self.idle.append((conn, time.monotonic()))
+
+    def send_message(
+            self,
+            conn: smtplib.SMTP,
+            to_emails: List[str],
+            subject: str,
+            body: str,
+            attachments: List[str] = None
+    ) -> bool:
+        """
+        分块写入邮件内容，在线程中执行
+        """
+        conn.ehlo_or_helo_if_needed()
+        code, resp = conn.mail(self.email)
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, resp, self.email)
+        refused = {}
+        for email in to_emails:
+            code, resp = conn.rcpt(email)
+            if code not in (250, 251):
+                refused[email] = (code, resp)
+        if len(refused) == len(to_emails):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, resp = conn.docmd("data")
+        if code != 354:
+            raise smtplib.SMTPDataError(code, resp)
+        try:
+            return self.__send_data(conn, to_emails, subject, body, attachments, refused)
+        except smtplib.SMTPServerDisconnected as e:
+            raise SMTPDataDisconnected(f"邮件内容发送过程中连接断开，无法确定是否已投递：{e}") from e
+
+    def __send_data(
+            self,
+            conn: smtplib.SMTP,
+            to_emails: List[str],
+            subject: str,
+            body: str,
+            attachments: List[str],
+            refused: dict
+    ) -> bool:
+        """
+        DATA 被接受后写入邮件内容
+        """
+        boundary = f"=============={uuid.uuid4().hex}=="
+        headers = [
+            f"From: {self.email}",
+            f"To: {', '.join(to_emails)}",
+            f"Subject: {Header(subject, 'utf-8').encode()}",
+            f"Date: {formatdate(localtime=True)}",
+            f"Message-ID: {make_msgid()}",
+            "MIME-Version: 1.0",
+            f'Content-Type: multipart/mixed; boundary="{boundary}"',
+            "",
+            f"--{boundary}",
+            MIMEText(body, "plain", "utf-8").as_string(),
+        ]
+        self.__write(conn, "\n".join(headers) + "\n")
+        for attachment in attachments or []:
+            filename = os.path.basename(attachment)
+            part = [
+                f"--{boundary}",
+                "Content-Type: application/octet-stream",
+                "Content-Transfer-Encoding: base64",
+                f'Content-Disposition: attachment; filename="{Header(filename, "utf-8").encode()}"',
+                "",
+            ]
+            self.__write(conn, "\n".join(part) + "\n")
+            with open(attachment, "rb") as f:
+                while chunk := f.read(self.CHUNK_SIZE):
+                    conn.send(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+        self.__write(conn, f"--{boundary}--\n")
+        conn.send(b".\r\n")
+        code, resp = conn.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        if refused:
+            logger.error(f"部分收件人邮件发送失败：{refused}")
+            return False
+        return True
+
+    @staticmethod
+    def __write(conn: smtplib.SMTP, text: str) -> None:
+        """
+        转换为 CRLF 换行，以 . 开头的行需要再添加一个 .
+        """
+        text = re.sub(r'(?:\r\n|\n|\r(?!\n))', "\r\n", text)
+        text = re.sub(r'(?m)^\.', '..', text)
+        conn.send(text.encode("utf-8"))
+
+
 class EmailSender:
 
     def __init__(self, rd: Redis):
@@ -25,25 +239,27 @@ class EmailSender:
         self.password = None
         self.smtp_server = None
         self.smtp_port = None
-        self.server = None
+        self.pool: SMTPConnectionPool | None = None
         self.rd = rd
 
     async def __get_settings(self, retry: int = 3):
         """
-        获取配置信息
+        获取配置信息，每个实例只获取一次
         """
+        if self.pool:
+            return
         web_email = await Cache(self.rd).get_tab_name("web_email", retry)
         self.email = web_email.get("email_access")
         self.password = web_email.get("email_password")
         self.smtp_server = web_email.get("email_server")
         self.smtp_port = int(web_email.get("email_port"))
-
-        self.server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-        self.server.starttls()
-        try:
-            self.server.login(self.email, self.password)
-        except smtplib.SMTPAuthenticationError:
-            raise CustomException("邮箱服务器认证失败！")
+        self.pool = SMTPConnectionPool.get_pool(
+            self.smtp_server,
+            self.smtp_port,
+            self.email,
+            self.password,
+            size=settings.EMAIL_POOL_SIZE
+        )
 
     async def send_email(self, to_emails: List[str], subject: str, body: str, attachments: List[str] = None):
         """
@@ -54,38 +270,36 @@ class EmailSender:
         :param attachments: 附件
         """
         await self.__get_settings()
-
-        message = MIMEMultipart()
-        message['From'] = self.email
-        message['To'] = ', '.join(to_emails)
-        message['Subject'] = subject
-        body = MIMEText(body)
-        message.attach(body)
-        if attachments:
-            for attachment in attachments:
-                with open(attachment, 'rb') as f:
-                    file_data = f.read()
-                filename = attachment.split('/')[-1]
-                attachment = MIMEApplication(file_data, Name=filename)
-                attachment['Content-Disposition'] = f'attachment; filename="{filename}"'
-                message.attach(attachment)
         try:
-            result = self.server.sendmail(self.email, to_emails, message.as_string())
-            self.server.quit()
-            print("邮件发送结果", result)
-            if result:
-                return False
-            else:
-                return True
-        except smtplib.SMTPException as e:
-            self.server.quit()
-            print('邮件发送失败！错误信息：', e)
+            return await self.pool.send(to_emails, subject, body, attachments)
+        except (smtplib.SMTPException, OSError) as e:
+            logger.error(f"邮件发送失败！错误信息：{e}")
             return False
 
+    async def send_many(
+            self,
+            messages: List[Tuple[List[str], str, str]],
+            progress: Callable[[int, int], Awaitable] = None
+    ) -> List[bool | str]:
+        """
+        并发发送多封邮件，同时发送的数量为连接池大小
+
+        :param messages: [(收件人, 主题, 内容), ...]
+        :param progress: 进度回调函数，参数为 (已完成数量, 总数量)
+        :return: 每封邮件的发送结果，顺序与传入顺序一致，失败时为 False 或错误信息
+        """
+        await self.__get_settings()
+        finished = 0
+
+        async def send(to_emails: List[str], subject: str, body: str) -> bool | str:
+            nonlocal finished
+            try:
+                result = await self.send_email(to_emails, subject, body)
+            except CustomException as e:
+                result = e.msg
+            finished += 1
+            if progress:
+                await progress(finished, len(messages))
+            return result
 
-# if __name__ == '__main__':
-#     sender = EmailSender()
-#     to_emails = ['ktianc2001@163.com', '2445667550@qq.com']
-#     subject = 'Test email'
-#     body = 'This is a test email'
-#     sender.send_email(to_emails, subject, body)
+        return await asyncio.gather(*[send(*message) for message in messages])
@@ -0,0 +1,261 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+# @version        : 1.0
+# @Creaet Time    : 2023/4/17 9:50
+# @File           : sms_dispatcher.py
+# @IDE            : PyCharm
+# @desc           : 批量短信发送
+
+"""
+批量发送短信（例如重置密码通知）：
+1. 每批只获取一次短信配置，所有短信共用同一个客户端
+2. 使用信号量限制同时发送的数量，使用令牌桶限制每秒发送的数量，与服务商的频率限制保持一致
+3. 网络异常、超时、服务商限流与服务端错误（5xx）等临时错误按照指数退避重试，
+   AccessKey 错误、签名或模板未审核、手机号错误等永久错误不重试
+4. 返回每个手机号的发送结果
+
+短信服务商：
+    aliyun：阿里云短信服务
+    local：本地替身，不发送短信，只记录日志并返回成功，也可以模拟服务商返回码，用于本地开发与测试
+"""
+
+import asyncio
+import datetime
+import json
+import time
+from typing import List, Tuple, Callable, Awaitable, Dict
+from aioredis import Redis
+from alibabacloud_dysmsapi20170525.client import Client as Dysmsapi20170525Client
+from alibabacloud_dysmsapi20170525 import models as dysmsapi_20170525_models
+from alibabacloud_tea_openapi import models as open_api_models
+from alibabacloud_tea_util import models as util_models
+from Tea.exceptions import TeaException, UnretryableException
+from application import settings
+from core.logger import logger
+from utils.cache import Cache
+from utils.count import RateLimiter
+
+
+class TransientSMSError(Exception):
+    """
+    可以重试的临时错误
+    """
+
+
+class AliyunSMSProvider:
+    """
+    阿里云短信服务，每个 AccessKey 在进程内只创建一个客户端
+    """
+
+    # 可以重试的返回码：服务商限流、服务暂不可用、服务端内部错误
+    TRANSIENT_CODES = {
+        "Throttling", "Throttling.User", "Throttling.Api", "ServiceUnavailable", "InternalError", "isp.SYSTEM_ERROR"
+    }
+
+    clients: Dict[Tuple[str, str], Dysmsapi20170525Client] = {}
+
+    def __init__(self, access_key_id: str, access_key_secret: str):
+        self.client = self.get_client(access_key_id, access_key_secret)
+
+    @classmethod
+    def get_client(cls, access_key_id: str, access_key_secret: str) -> Dysmsapi20170525Client:
+        key = (access_key_id, access_key_secret)
+        client = cls.clients.get(key)
+        if client is None:
+            config = open_api_models.Config(access_key_id=access_key_id, access_key_secret=access_key_secret)
+            config.endpoint = f'dysmsapi.aliyuncs.com'
+            client = Dysmsapi20170525Client(config)
+            cls.clients[key] = client
+        return client
+
+    async def send(self, telephone: str, sign_name: str, template_code: str, template_param: str) -> str:
+        """
+        发送短信，返回服务商返回码，OK 为发送成功
+        """
+        send_sms_request = dysmsapi_20170525_models.SendSmsRequest(
+            phone_numbers=telephone,
+            sign_name=sign_name,
+            template_code=template_code,
+            template_param=template_param
+        )
+        try:
+            resp = await self.client.send_sms_with_options_async(send_sms_request, util_models.RuntimeOptions())
+        except UnretryableException as e:
+            # SDK 重试后仍然失败，网络异常与超时时内部异常不是 TeaException
+            if not isinstance(e.inner_exception, TeaException):
+                raise TransientSMSError(repr(e.inner_exception))
+            return self.check_code(e.code, getattr(e, "statusCode", None))
+        except TeaException as e:
+            return self.check_code(e.code, getattr(e, "statusCode", None))
+        except (asyncio.TimeoutError, OSError) as e:
+            raise TransientSMSError(repr(e))
+        except Exception as e:
+            logger.error(f"{telephone} 短信发送异常，报错：{e!r}")
+            return "Unknown"
+        return self.check_code(resp.body.code)
+
+    @classmethod
+    def check_code(cls, code: str | None, status_code: int = None) -> str:
+        """
+        临时错误抛出 TransientSMSError，其他返回码直接返回
+
+        :param code: 服务商返回码
+        :param status_code: HTTP 状态码，5xx 为临时错误
+        """
+        if code in cls.TRANSIENT_CODES or (status_code or 0) >= 500:
+            raise TransientSMSError(f"{code} {status_code or ''}".strip())
+        return code or "Unknown"
+
+
+class LocalSMSProvider:
+    """
+    本地短信替身，不发送短信
+    """
+
+    def __init__(self, *args, codes: Dict[str, List[str]] = None):
+        """
+        :param codes: 模拟服务商返回码，{手机号: [第 1 次发送的返回码, 第 2 次发送的返回码, ...]}，用完后返回 OK
+        """
+        self.codes = codes or {}
+        self.messages = []
+
+    async def send(self, telephone: str, sign_name: str, template_code: str, template_param: str) -> str:
+        codes = self.codes.get(telephone)
+        code = AliyunSMSProvider.check_code(codes.pop(0) if codes else "OK")
+        if code == "OK":
+            self.messages.append((telephone, sign_name, template_code, template_param))
+            logger.info(f"本地短信替身：{telephone} {sign_name} {template_code} {template_param}")
+        return code
+
+
+PROVIDERS = {
+    "aliyun": AliyunSMSProvider,
+    "local": LocalSMSProvider
+}
+
+
+class TokenBucket:
+    """
+    令牌桶限流
+
+    :param rate: 每秒生成的令牌数量
+    :param capacity: 令牌桶容量，允许的最大突发数量
+    """
+
+    def __init__(self, rate: float, capacity: int = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SMSDispatcher:
+    """
+    批量短信发送
+
+    与 AliyunSMS 一样限制发送间隔，发送成功后写入验证码
+    """
+
+    def __init__(self, rd: Redis, scene, provider=None):
+        """
+        :param rd: Redis
+        :param scene: 短信场景，AliyunSMS.Scene
+        :param provider: 短信服务商，为空时根据 SMS_PROVIDER 配置创建
+        """
+        self.rd = rd
+        self.scene = scene
+        self.provider = provider
+        self.config = None
+        self.bucket = TokenBucket(settings.SMS_SEND_RATE)
+        self.semaphore = asyncio.Semaphore(settings.SMS_SEND_CONCURRENCY)
+
+    async def __load_config(self) -> None:
+        """
+        获取短信配置，每批只获取一次
+        """
+        aliyun_sms = await Cache(self.rd).get_tab_name("aliyun_sms")
+        self.config = {
+            "send_interval": int(aliyun_sms.get("sms_send_interval")),
+            "valid_time": int(aliyun_sms.get("sms_valid_time")),
+            "sign_name": aliyun_sms.get("sms_sign_name_1" if self.scene.name == "login" else "sms_sign_name_2"),
+            "template_code": aliyun_sms.get(self.scene.value)
+        }
+        if self.provider is None:
+            provider = PROVIDERS[settings.SMS_PROVIDER]
+            self.provider = provider(aliyun_sms.get("sms_access_key"), aliyun_sms.get("sms_access_key_secret"))
+
+    async def send_many(
+            self,
+            messages: List[Tuple[str, dict]],
+            progress: Callable[[int, int], Awaitable] = None
+    ) -> List[dict]:
+        """
+        批量发送短信
+
+        :param messages: [(手机号, 模板参数), ...]
+        :param progress: 进度回调函数，参数为 (已完成数量, 总数量)
+        :return: [{"telephone": 手机号, "status": 是否成功, "msg": 失败原因}, ...]，顺序与传入顺序一致
+        """
+        await self.__load_config()
+        finished = 0
+
+        async def send(telephone: str, params: dict) -> dict:
+            nonlocal finished
+            async with self.semaphore:
+                result = await self.send(telephone, params)
+            finished += 1
+            if progress:
+                await progress(finished, len(messages))
+            return result
+
+        return await asyncio.gather(*[send(telephone, params) for telephone, params in messages])
+
+    async def send(self, telephone: str, params: dict) -> dict:
+        """
+        发送单条短信，临时错误按照指数退避重试
+        """
+        result = {"telephone": telephone, "status": False, "msg": ""}
+        # 与 AliyunSMS.get_send_limiter 使用同一个键，先记录再发送
+        limiter = RateLimiter(self.rd, telephone + "_send_flag", 1, self.config["send_interval"])
+        if not await limiter.acquire():
+            result["msg"] = "短信发送频繁"
+            return result
+        template_param = json.dumps(params, ensure_ascii=False)
+        send_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        code = None
+        for attempt in range(settings.SMS_SEND_RETRY + 1):
+            await self.bucket.acquire()
+            try:
+                code = await self.provider.send(
+                    telephone,
+                    self.config["sign_name"],
+                    self.config["template_code"],
+                    template_param
+                )
+                break
+            except TransientSMSError as e:
+                logger.warning(f"{telephone} 短信发送失败，第 {attempt + 1} 次，报错：{e}")
+                if attempt < settings.SMS_SEND_RETRY:
+                    await asyncio.sleep(2 ** attempt * 0.5)
+        if code == "OK":
+            logger.info(f'{send_time} {telephone} 短信发送成功，返回code：{code}')
+            value = next(iter(params.values()), "")
+            await self.rd.set(telephone, value, self.config["valid_time"])
+            result["status"] = True
+        else:
+            logger.error(f'{send_time} {telephone} 短信发送失败，返回code：{code}')
+            await limiter.reset()
+            result["msg"] = "发送失败，请联系管理员"
+        return result
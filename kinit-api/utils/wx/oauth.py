@@ -6,9 +6,9 @@
 # @IDE            : PyCharm
 # @desc           : 简要说明
 
-import requests
 from core.logger import logger
 from utils.cache import Cache
+from utils.http_client import HttpClient
 from utils.wx.wx_access_token import WxAccessToken
 from aioredis import Redis
 
@@ -57,8 +57,10 @@ class WXOAuth:
             "js_code": code,
             "grant_type": "authorization_code"
         }
-        response = requests.get(url=api, params=params)
-        result = response.json()
+        try:
+            result = await HttpClient.request_json("get", api, params=params)
+        except Exception as e:
+            result = {'errcode': -1, 'errmsg': f'请求微信接口失败：{e!r}'}
         if "openid" not in result:
             logger.error(f"微信校验失败：{result}, code：{code}")
         else:
@@ -91,8 +93,10 @@ class WXOAuth:
         data = {
             "code": code,
         }
-        response = requests.post(url=api, params=params, json=data)
-        result = response.json()
+        try:
+            result = await HttpClient.request_json("post", api, params=params, json=data)
+        except Exception as e:
+            result = {'errcode': -1, 'errmsg': f'请求微信接口失败：{e!r}'}
         if result.get("errcode", 0) == 0:
             # print("获取微信用户手机号成功", result)
             logger.info(f"获取微信用户手机号成功：{result}, code：{code}")
@@ -100,7 +104,7 @@ class WXOAuth:
             # print("获取微信用户手机号失败", result)
             logger.error(f"获取微信用户手机号失败：{result}, code：{code}")
             if result.get("errcode", 0) == 40001:
-                await at.update()
+                await at.update(access_token.get("token"))
                 if self.retry_count > 0:
                     logger.error(f"重试获取微信手机号，重试剩余次数, {self.retry_count}")
                     self.retry_count -= 1
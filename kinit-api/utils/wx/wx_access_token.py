@@ -6,9 +6,14 @@
 # @IDE            : PyCharm
 # @desc           : 获取小程序全局唯一后台接口调用凭据
 
-import requests
+import asyncio
+import math
+import uuid
+from typing import Dict, Set
 from aioredis import Redis
+from application import settings
 from core.logger import logger
+from utils.http_client import HttpClient
 
 
 class WxAccessToken:
@@ -18,12 +23,32 @@ class WxAccessToken:
     获取小程序全局唯一后台接口调用凭据（access_token）。调用绝大多数后台接口时都需使用 access_token，开发者需要进行妥善保存。
 
     官方文档：https://developers.weixin.qq.com/miniprogram/dev/api-backend/open-api/access-token/auth.getAccessToken.html
+
+    刷新规则：
+    1. 同一时间只刷新一次：进程内使用 asyncio.Lock，多进程之间使用 Redis 锁，未获取到锁的请求等待新的 access_token，
+       Redis 锁的有效期大于一次刷新的最长耗时（包括重试），锁的值为随机字符串，只删除自己持有的锁
+    2. 提前刷新：缓存剩余时间少于 WX_ACCESS_TOKEN_REFRESH_BEFORE 秒时，在后台刷新，当前请求继续使用旧的 access_token，
+       微信刷新 access_token 后旧的 access_token 在 5 分钟内仍然可用
+    """
+
+    # 锁的值与自己持有的值相同时才删除
+    UNLOCK_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
     """
 
+    # 进程内每个小程序一个刷新锁
+    locks: Dict[str, asyncio.Lock] = {}
+    # 进程内正在执行的后台刷新任务，防止被垃圾回收
+    tasks: Set[asyncio.Task] = set()
+
     def __init__(self, appid: str, secret: str, redis: Redis, grant_type: str = "client_credential", *args, **kwargs):
         self.__url = "https://api.weixin.qq.com/cgi-bin/token"
         self.__method = "get"
         self.appidKey = f"{appid}_access_token"
+        self.lockKey = f"{appid}_access_token_lock"
         self.redis = redis
         self.params = {
             "appid": appid,
@@ -31,31 +56,88 @@ class WxAccessToken:
             "grant_type": grant_type
         }
 
+    @property
+    def lock(self) -> asyncio.Lock:
+        lock = self.locks.get(self.appidKey)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[self.appidKey] = lock
+        return lock
+
     async def get(self) -> dict:
         """
         获取小程序access_token
         """
-        token = await self.redis.get(self.appidKey)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            token, ttl = await pipe.get(self.appidKey).ttl(self.appidKey).execute()
         if not token:
             return await self.update()
+        if 0 <= ttl < settings.WX_ACCESS_TOKEN_REFRESH_BEFORE and not self.lock.locked():
+            task = asyncio.create_task(self.update(token))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
         return {"status": True, "token": token}
 
-    async def update(self) -> dict:
+    async def update(self, expired_token: str = None) -> dict:
         """
         更新小程序access_token
+
+        :param expired_token: 已失效的 access_token，获取到锁后缓存中的 access_token 与其不同，说明已被其他请求刷新，直接使用
+        """
+        async with self.lock:
+            token = await self.redis.get(self.appidKey)
+            if token and token != expired_token:
+                # 等待锁期间已被其他请求刷新
+                return {"status": True, "token": token}
+            # 多进程之间只有一个进程请求微信接口，其他进程等待刷新结果
+            value = uuid.uuid4().hex
+            if not await self.redis.set(self.lockKey, value, ex=self.lock_expire(), nx=True):
+                return await self.__wait(expired_token)
+            try:
+                return await self.__refresh()
+            finally:
+                await self.redis.register_script(self.UNLOCK_SCRIPT)(keys=[self.lockKey], args=[value])
+
+    @staticmethod
+    def lock_expire() -> int:
+        """
+        Redis 锁的有效期（秒），一次刷新的最长耗时加上 5 秒余量，避免刷新过程中锁过期导致其他进程同时刷新
         """
-        print("开始更新 access_token")
-        method = getattr(requests, self.__method)
-        response = method(url=self.__url, params=self.params)
-        result = response.json()
+        return math.ceil(HttpClient.max_duration()) + 5
+
+    async def __wait(self, expired_token: str = None) -> dict:
+        """
+        等待其他进程刷新 access_token
+        """
+        for _ in range(self.lock_expire() * 10):
+            await asyncio.sleep(0.1)
+            token = await self.redis.get(self.appidKey)
+            if token and token != expired_token:
+                return {"status": True, "token": token}
+            if not await self.redis.exists(self.lockKey):
+                break
+        token = await self.redis.get(self.appidKey)
+        if not token or token == expired_token:
+            return {"status": False, "token": None}
+        return {"status": True, "token": token}
+
+    async def __refresh(self) -> dict:
+        """
+        请求微信接口获取新的 access_token
+        """
+        logger.info("开始更新 access_token")
+        try:
+            result = await HttpClient.request_json(self.__method, self.__url, params=self.params)
+        except Exception as e:
+            logger.error(f"获取access_token失败：{e!r}")
+            return {"status": False, "token": None}
 
-        if result.get("errcode", "0") != "0":
-            print("获取access_token失败", result)
+        if "access_token" not in result:
             logger.error(f"获取access_token失败：{result}")
             return {"status": False, "token": None}
 
-        print("成功获取到", result)
-        await self.redis.set(self.appidKey, result.get("access_token"), ex=2000)
+        expire = min(settings.WX_ACCESS_TOKEN_EXPIRE, result.get("expires_in", 7200))
+        await self.redis.set(self.appidKey, result.get("access_token"), ex=expire)
         logger.info(f"获取access_token成功：{result}")
 
         return {"status": True, "token": result.get("access_token")}
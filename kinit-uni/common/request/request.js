@@ -17,6 +17,9 @@ const http = new luchRequest({
   }
 })
 
+// 主库粘滞结束时间戳（秒），写入数据后由后端返回，在此之前的请求带上该请求头，查询走主库，避免读到从库中的旧数据
+let dbStickyUntil = 0
+
 // 请求拦截器
 http.interceptors.request.use(
   (config) => {
@@ -26,6 +29,9 @@ http.interceptors.request.use(
       // 添加头信息，token验证
       config.header['Authorization'] = token
     }
+    if (dbStickyUntil > Date.now() / 1000) {
+      config.header['X-DB-Sticky'] = dbStickyUntil
+    }
     return config
   },
   (error) => {
@@ -43,6 +49,10 @@ http.interceptors.response.use(
     const msg = res.data.message || errorCode[code] || errorCode['default']
     // 是否刷新token
     const refresh = res.header['if-refresh']
+    const dbSticky = res.header['x-db-sticky'] || res.header['X-DB-Sticky']
+    if (dbSticky) {
+      dbStickyUntil = Number(dbSticky)
+    }
     if (code === 500) {
       toast(msg)
       return Promise.reject(new Error(msg))